@@ -0,0 +1,208 @@
+"""Control de admisión para los endpoints pesados, con cupos por empresa.
+
+Una empresa grande corriendo /generar-pedidos o la exportación de auditoría
+podía ocupar todos los workers y conexiones mientras las demás esperaban.
+Antes de entrar a un endpoint de `ENDPOINTS_PESADOS` la petición toma:
+
+1. un cupo de su empresa (`ADMISION_POR_EMPRESA`, 2 por defecto);
+2. un cupo global (`ADMISION_GLOBAL`, uno por CPU por defecto), de modo que
+   los endpoints livianos siempre tengan hilos libres.
+
+Los cupos son archivos con `flock` en `ADMISION_DIR`: valen para todos los
+workers de gunicorn del mismo servidor y el sistema los libera si un
+proceso muere. Si no hay cupo, la petición espera hasta
+`ADMISION_ESPERA_MAX` segundos; después responde 503 con `Retry-After`. Si
+la empresa ya tiene `ADMISION_COLA_POR_EMPRESA` peticiones esperando en el
+worker, responde 429 de inmediato.
+"""
+
+import fcntl
+import hashlib
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+from flask import g, jsonify, request, session
+
+import metricas
+from registro import get_logger
+
+log = get_logger(__name__)
+
+ACTIVA = os.getenv("ADMISION_ACTIVA", "1") == "1"
+POR_EMPRESA = int(os.getenv("ADMISION_POR_EMPRESA", "2"))
+GLOBAL = int(os.getenv("ADMISION_GLOBAL", str(max(2, os.cpu_count() or 1))))
+ESPERA_MAX = float(os.getenv("ADMISION_ESPERA_MAX", "20"))
+COLA_POR_EMPRESA = int(os.getenv("ADMISION_COLA_POR_EMPRESA", "4"))
+DIRECTORIO = os.getenv("ADMISION_DIR", os.path.join(tempfile.gettempdir(), "obt_admision"))
+
+# Solo los POST de estos endpoints pasan por admisión
+ENDPOINTS_PESADOS = {
+    "upload.upload_index",
+    "generar_pedidos.cargar_pedidos",
+    "generar_pedidos.simular",
+    "auditoria.descargar_excel",
+    "subir_pedidos.probar_login_portal",
+}
+
+metricas.definir(
+    "obt_admision_espera_seconds",
+    "Espera por un cupo de admisión (resultado: admitida | ocupado | cola_llena)",
+    metricas.BUCKETS_SEG,
+)
+
+_lock = threading.Lock()
+_en_cola: dict = {}  # empresa -> peticiones esperando en este proceso
+_en_curso = 0
+
+
+class _Cupo:
+    """Un archivo de cupo bloqueado con flock; se libera al cerrarlo."""
+
+    __slots__ = ("fd",)
+
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def liberar(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)  # cerrar el descriptor suelta el flock
+            self.fd = None
+
+
+def _tomar(prefijo: str, cupos: int) -> Optional[_Cupo]:
+    """Intenta bloquear alguno de los `cupos` archivos del prefijo, sin esperar."""
+    indices = list(range(cupos))
+    random.shuffle(indices)
+    for k in indices:
+        fd = os.open(os.path.join(DIRECTORIO, f"{prefijo}.{k}"), os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return _Cupo(fd)
+        except BlockingIOError:
+            os.close(fd)
+    return None
+
+
+def _esperar(prefijo: str, cupos: int, limite: float) -> Optional[_Cupo]:
+    pausa = 0.02
+    while True:
+        cupo = _tomar(prefijo, cupos)
+        if cupo is not None or time.monotonic() >= limite:
+            return cupo
+        time.sleep(min(pausa, max(limite - time.monotonic(), 0)))
+        pausa = min(pausa * 2, 0.25)
+
+
+def _prefijo_empresa(empresa: str) -> str:
+    # El nombre de la empresa viene del correo: se usa su hash como archivo
+    return "empresa_" + hashlib.sha1(empresa.encode("utf-8")).hexdigest()[:16]
+
+
+def admitir(empresa: str) -> Optional[List[_Cupo]]:
+    """Toma un cupo de la empresa y uno global; None si no lo logra a tiempo."""
+    limite = time.monotonic() + ESPERA_MAX
+    propio = _esperar(_prefijo_empresa(empresa), POR_EMPRESA, limite)
+    if propio is None:
+        return None
+    # Se espera el global con el cupo propio tomado: cada empresa compite
+    # por los cupos globales con a lo sumo POR_EMPRESA peticiones
+    general = _esperar("global", GLOBAL, limite)
+    if general is None:
+        propio.liberar()
+        return None
+    return [propio, general]
+
+
+def _respuesta_ocupado(status: int, estado: str, mensaje: str):
+    reintentar = max(1, int(ESPERA_MAX // 2))
+    resp = jsonify(success=False, estado=estado, error=mensaje, message=mensaje,
+                   reintentar_en=reintentar)
+    resp.status_code = status
+    resp.headers["Retry-After"] = str(reintentar)
+    return resp
+
+
+# ------------------------------------------------------------------
+# Integración con Flask
+# ------------------------------------------------------------------
+def _antes():
+    global _en_curso
+    if request.method != "POST" or request.endpoint not in ENDPOINTS_PESADOS:
+        return None
+    empresa = session.get("empresa")
+    if not empresa:  # sin sesión: login_required redirige
+        return None
+
+    with _lock:
+        if _en_cola.get(empresa, 0) >= COLA_POR_EMPRESA:
+            cola_llena = True
+        else:
+            cola_llena = False
+            _en_cola[empresa] = _en_cola.get(empresa, 0) + 1
+    if cola_llena:
+        metricas.observar("obt_admision_espera_seconds", 0.0,
+                          endpoint=request.endpoint, resultado="cola_llena")
+        log.warning("admisión: cola de la empresa llena", extra={"en_cola": COLA_POR_EMPRESA})
+        return _respuesta_ocupado(
+            429, "cola_llena",
+            "Ya hay varias solicitudes de tu empresa en espera. Espera a que terminen e intenta de nuevo.",
+        )
+
+    t0 = time.perf_counter()
+    try:
+        cupos = admitir(empresa)
+    finally:
+        with _lock:
+            _en_cola[empresa] -= 1
+            if not _en_cola[empresa]:
+                del _en_cola[empresa]
+    espera = time.perf_counter() - t0
+
+    if cupos is None:
+        metricas.observar("obt_admision_espera_seconds", espera,
+                          endpoint=request.endpoint, resultado="ocupado")
+        log.warning("admisión: sin cupo", extra={"espera": round(espera, 3)})
+        return _respuesta_ocupado(
+            503, "ocupado",
+            "El servidor está procesando muchas cargas en este momento. Intenta de nuevo en unos segundos.",
+        )
+
+    metricas.observar("obt_admision_espera_seconds", espera,
+                      endpoint=request.endpoint, resultado="admitida")
+    g.admision_cupos = cupos
+    with _lock:
+        _en_curso += 1
+    return None
+
+
+def _liberar(_exc) -> None:
+    global _en_curso
+    cupos = g.pop("admision_cupos", None)
+    if cupos is None:
+        return
+    for cupo in cupos:
+        cupo.liberar()
+    with _lock:
+        _en_curso -= 1
+
+
+def _gauges():
+    with _lock:
+        return {
+            "obt_admision_en_cola": ("Peticiones esperando cupo en el proceso", sum(_en_cola.values())),
+            "obt_admision_en_curso": ("Peticiones pesadas en curso en el proceso", _en_curso),
+        }
+
+
+def init_app(app) -> None:
+    """Registra la admisión antes de las vistas pesadas (ADMISION_ACTIVA=0 la desactiva)."""
+    if not ACTIVA:
+        return
+    os.makedirs(DIRECTORIO, exist_ok=True)
+    app.before_request(_antes)
+    app.teardown_request(_liberar)
+    metricas.registrar_gauges(_gauges)
@@ -7,6 +7,13 @@ from views.auth import auth_bp
 from views.auditoria import auditoria_bp
 from views.subir_pedidos import subir_pedidos_bp
 from views.admin import admin_bp
+from views.vista_previa import vista_previa_bp
+from migraciones import migrar, migrar_al_iniciar
+import admision
+import diagnostico
+import metricas
+import plazos
+import registro
 
 
 
@@ -19,6 +26,29 @@ app.register_blueprint(consolidar_bp)
 app.register_blueprint(auditoria_bp)
 app.register_blueprint(subir_pedidos_bp)
 app.register_blueprint(admin_bp)
+app.register_blueprint(vista_previa_bp)
+
+# Logs JSON por cola (con empresa, endpoint y run_id) y métricas por endpoint
+registro.init_app(app)
+metricas.init_app(app)
+# Plazos y cancelación de consultas (antes de admisión: la espera por cupo
+# también consume el plazo de la petición)
+plazos.init_app(app)
+# Cupos por empresa y globales para los endpoints pesados (después de
+# metricas, para que la espera cuente en la latencia)
+admision.init_app(app)
+# EXPLAIN/pg_stat_statements bajo demanda del administrador (ver /admin)
+diagnostico.init_app(app)
+
+# El esquema propio (vehiculos, cargas_pedidos) se migra una vez al arrancar
+migrar_al_iniciar()
+
+
+@app.cli.command("migrar")
+def migrar_cmd():
+    """Aplica las migraciones pendientes del esquema."""
+    versiones = migrar()
+    print(f"Migraciones aplicadas: {versiones or 'ninguna'}")
 
 
 
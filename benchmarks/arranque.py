@@ -0,0 +1,121 @@
+"""Mide el costo de `import app`: tiempo de importación y RSS del proceso.
+
+Cada repetición corre `python -X importtime -c "import app"` en un proceso
+nuevo (con `MIGRAR_AL_INICIAR=0`, sin tocar la base) y lee:
+
+- el tiempo acumulado de `app` según `-X importtime` (mediana de las corridas);
+- el VmRSS del proceso al terminar de importar;
+- los módulos pesados que quedaron cargados.
+
+Con `--max-ms`, `--max-rss-mb` o `--prohibidos` funciona como guarda: sale
+con código 1 si se supera algún límite, para usarlo antes de publicar.
+
+    python -m benchmarks.arranque --repeticiones 5 --max-ms 600 --max-rss-mb 90
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Solo deben cargarse en la primera petición que los usa
+PROHIBIDOS = "pandas,numpy,openpyxl,playwright,pyarrow"
+
+_SONDA = """
+import sys
+import app
+with open("/proc/self/status") as fh:
+    rss = next(int(l.split()[1]) for l in fh if l.startswith("VmRSS:"))
+print("OBT_ARRANQUE", rss, ",".join(sorted(m for m in sys.modules if "." not in m)))
+"""
+
+
+def _leer_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """módulo -> (propio_us, acumulado_us) de la salida de -X importtime."""
+    tiempos: Dict[str, Tuple[int, int]] = {}
+    for linea in stderr.splitlines():
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        propio, acumulado, modulo = (c.strip() for c in linea[len("import time:"):].split("|"))
+        if propio.isdigit():
+            tiempos[modulo] = (int(propio), int(acumulado))
+    return tiempos
+
+
+def medir_una_vez() -> Dict:
+    entorno = {**os.environ, "MIGRAR_AL_INICIAR": "0", "PYTHONDONTWRITEBYTECODE": "1"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _SONDA],
+        cwd=RAIZ, env=entorno, capture_output=True, text=True, check=False,
+    )
+    linea = next((l for l in proc.stdout.splitlines() if l.startswith("OBT_ARRANQUE")), None)
+    if proc.returncode != 0 or linea is None:
+        raise RuntimeError(f"no se pudo importar app:\n{proc.stderr[-2000:]}")
+    _, rss_kb, modulos = linea.split(" ", 2)
+    tiempos = _leer_importtime(proc.stderr)
+    return {
+        "import_ms": tiempos.get("app", (0, 0))[1] / 1000,
+        "rss_mb": int(rss_kb) / 1024,
+        "modulos": set(modulos.split(",")),
+        "tiempos": tiempos,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("--repeticiones", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15, help="módulos más lentos a listar")
+    ap.add_argument("--max-ms", type=float, help="límite para la mediana de import_ms")
+    ap.add_argument("--max-rss-mb", type=float, help="límite para la mediana de RSS")
+    ap.add_argument("--prohibidos", default=PROHIBIDOS,
+                    help="módulos que no deben cargarse con la app (vacío para no revisar)")
+    ap.add_argument("--salida", help="escribe el resultado en JSON")
+    args = ap.parse_args()
+
+    # La primera corrida deja los .pyc del sistema en caché; no cuenta
+    medir_una_vez()
+    corridas = [medir_una_vez() for _ in range(args.repeticiones)]
+    import_ms = statistics.median(c["import_ms"] for c in corridas)
+    rss_mb = statistics.median(c["rss_mb"] for c in corridas)
+
+    ultima = corridas[-1]
+    lentos = sorted(ultima["tiempos"].items(), key=lambda kv: kv[1][0], reverse=True)[: args.top]
+    prohibidos = [m for m in args.prohibidos.split(",") if m]
+    cargados = sorted(m for m in prohibidos if m in ultima["modulos"])
+
+    print(f"import app: {import_ms:.0f} ms (mediana de {len(corridas)}), RSS {rss_mb:.1f} MB")
+    print("módulos más lentos (propio ms / acumulado ms):")
+    for modulo, (propio, acumulado) in lentos:
+        print(f"  {modulo:<40} {propio / 1000:8.1f} {acumulado / 1000:8.1f}")
+
+    fallas: List[str] = []
+    if args.max_ms is not None and import_ms > args.max_ms:
+        fallas.append(f"import app tarda {import_ms:.0f} ms (límite {args.max_ms:.0f})")
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        fallas.append(f"RSS tras importar {rss_mb:.1f} MB (límite {args.max_rss_mb:.1f})")
+    if cargados:
+        fallas.append(f"se cargan al importar la app: {', '.join(cargados)}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as fh:
+            json.dump({
+                "import_ms": import_ms,
+                "rss_mb": rss_mb,
+                "corridas": [{"import_ms": c["import_ms"], "rss_mb": c["rss_mb"]} for c in corridas],
+                "mas_lentos": [{"modulo": m, "propio_us": p, "acumulado_us": a} for m, (p, a) in lentos],
+                "prohibidos_cargados": cargados,
+                "fallas": fallas,
+            }, fh, indent=2, ensure_ascii=False)
+
+    for falla in fallas:
+        print(f"FALLA: {falla}", file=sys.stderr)
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
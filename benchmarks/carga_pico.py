@@ -0,0 +1,300 @@
+"""Simula el pico de la mañana: muchas empresas cargando y generando a la vez.
+
+Cada usuario virtual es una empresa distinta (`bench@empresaNNN.com`) que
+inicia sesión y repite el flujo del día: /cargar-pedidos, /generar-pedidos,
+/consolidar-compras y /auditoria/descargar, con payloads msgpack propios
+(`benchmarks/datos.py`) y pausas entre pasos. Los usuarios entran
+escalonados durante `--rampa` segundos, como las empresas a lo largo de la
+ventana de la mañana.
+
+Corre contra un despliegue local (gunicorn) sobre una base con las
+rutinas de `benchmarks/sql/stubs.sql`; `--sembrar DSN` las carga y crea los
+usuarios. Reporta por endpoint throughput, p50/p95/p99, tasa de errores y la
+saturación del pool: la espera por conexión que cada respuesta trae en
+`Server-Timing` (`pool`, requiere `DB_POOL=1`) y el máximo de
+`obt_db_requests_waiting` leído de `/metrics`.
+
+    DB_POOL=1 DB_POOL_MAX=4 DATABASE_URL=postgresql://localhost/obt_carga gunicorn app:app &
+    python -m benchmarks.carga_pico --sembrar postgresql://localhost/obt_carga \\
+        --empresas 40 --duracion 600 --rampa 300 --lineas 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks import datos
+from benchmarks.cliente import Sesion, esperar_servidor, percentil
+
+DIA = "LU"
+PASOS = ["cargar", "generar", "consolidar", "auditoria"]
+
+# Una espera por el pool mayor a esto cuenta como petición "saturada"
+UMBRAL_POOL_MS = 10.0
+
+
+def sembrar(dsn: str, empresas: int, password: str) -> None:
+    """Carga las rutinas de prueba y un usuario por empresa."""
+    import psycopg
+
+    from benchmarks.suite import STUBS_SQL
+
+    with open(STUBS_SQL, encoding="utf-8") as fh:
+        stubs = fh.read()
+    with psycopg.connect(dsn) as conn:
+        conn.execute(stubs)
+        with conn.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO users (email, password_hash, negocio)
+                VALUES (%s, crypt(%s, gen_salt('bf')), 'bench')
+                ON CONFLICT (email) DO UPDATE SET password_hash = EXCLUDED.password_hash
+                """,
+                [(_email(i), password) for i in range(empresas)],
+            )
+
+
+def _email(i: int) -> str:
+    return f"bench@empresa{i:03d}.com"
+
+
+def _multipart(campos: Dict[str, str], archivos: Dict[str, Tuple[str, bytes]]) -> Tuple[bytes, str]:
+    limite = uuid.uuid4().hex
+    partes: List[bytes] = []
+    for nombre, valor in campos.items():
+        partes.append(
+            f'--{limite}\r\nContent-Disposition: form-data; name="{nombre}"\r\n\r\n{valor}\r\n'.encode()
+        )
+    for nombre, (archivo, contenido) in archivos.items():
+        partes.append(
+            f'--{limite}\r\nContent-Disposition: form-data; name="{nombre}"; filename="{archivo}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n".encode() + contenido + b"\r\n"
+        )
+    partes.append(f"--{limite}--\r\n".encode())
+    return b"".join(partes), f"multipart/form-data; boundary={limite}"
+
+
+def preparar_pasos(i: int, args) -> Dict[str, Tuple[str, bytes, Dict[str, str], str]]:
+    """(path, cuerpo, cabeceras, content-type esperado) de cada paso para la empresa i."""
+    rnd = random.Random(args.semilla + i)
+    # Cada empresa tiene un tamaño distinto alrededor de --lineas
+    lineas = max(100, int(args.lineas * rnd.uniform(0.5, 1.5)))
+    msgpack = {"Content-Type": "application/msgpack"}
+    pasos = {}
+    if "cargar" in args.pasos:
+        pasos["cargar"] = (
+            f"/cargar-pedidos?dia={DIA}&force=1",
+            datos.empaquetar(datos.pedidos_y_rutas(lineas, DIA, args.semilla + i)),
+            msgpack, "spreadsheetml",
+        )
+    if "generar" in args.pasos:
+        pasos["generar"] = (
+            "/generar-pedidos",
+            datos.empaquetar(datos.inventario_y_materiales(lineas, args.semilla + i)),
+            msgpack, "zip",
+        )
+    if "consolidar" in args.pasos:
+        cuerpo, tipo = _multipart(
+            {"orden_compra": str(1000 + i)},
+            {"archivo": ("sap.xlsx", datos.reporte_sap(args.lineas_sap, args.semilla + i))},
+        )
+        # Con XHR responde JSON; un error de validación redirige al formulario
+        pasos["consolidar"] = (
+            "/consolidar-compras", cuerpo,
+            {"Content-Type": tipo, "X-Requested-With": "XMLHttpRequest"}, "json",
+        )
+    if "auditoria" in args.pasos:
+        pasos["auditoria"] = ("/auditoria/descargar", b"", {}, "spreadsheetml")
+    return pasos
+
+
+def _server_timing(cabeceras: Dict[str, str], nombre: str) -> Optional[float]:
+    valor = next((v for k, v in cabeceras.items() if k.lower() == "server-timing"), "")
+    m = re.search(rf"(?:^|,\s*){re.escape(nombre)};dur=([\d.]+)", valor)
+    return float(m.group(1)) if m else None
+
+
+class Registro:
+    """Resultados de todas las peticiones, compartido entre hilos."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filas: List[Dict[str, Any]] = []
+        self.esperando_max = 0.0
+
+    def agregar(self, **fila: Any) -> None:
+        with self.lock:
+            self.filas.append(fila)
+
+
+def usuario(i: int, args, pasos, registro: Registro, t_inicio: float, t_fin: float) -> None:
+    rnd = random.Random(args.semilla * 7919 + i)
+    # Llegadas repartidas en la rampa, con algo de ruido
+    time.sleep(max(0.0, t_inicio + args.rampa * (i + rnd.random()) / args.empresas - time.monotonic()))
+    sesion = Sesion(args.url, timeout=args.timeout)
+    try:
+        sesion.login(_email(i), args.password)
+    except RuntimeError as e:
+        registro.agregar(empresa=i, paso="login", status=0, seg=0.0, error=str(e), t=time.monotonic())
+        return
+
+    while time.monotonic() < t_fin:
+        for nombre in args.pasos:
+            if time.monotonic() >= t_fin:
+                break
+            path, cuerpo, cab, esperado = pasos[nombre]
+            status, seg, n, cab_resp = sesion.pedir("POST", path, cuerpo, cab)
+            tipo = next((v for k, v in cab_resp.items() if k.lower() == "content-type"), "")
+            error = None
+            if not 200 <= status < 300:
+                error = f"HTTP {status}"
+            elif esperado not in tipo:
+                error = f"respuesta {tipo or 'vacía'}"
+            registro.agregar(
+                empresa=i, paso=nombre, status=status, seg=seg, bytes=n, error=error,
+                pool_ms=_server_timing(cab_resp, "pool"), db_ms=_server_timing(cab_resp, "db"),
+                t=time.monotonic(),
+            )
+            time.sleep(rnd.expovariate(1 / args.pausa) if args.pausa > 0 else 0)
+
+
+def vigilar_metricas(args, registro: Registro, fin: threading.Event) -> None:
+    """Lee /metrics cada pocos segundos y guarda el máximo de requests_waiting."""
+    cab = {"Authorization": f"Bearer {args.metrics_token}"} if args.metrics_token else {}
+    while not fin.wait(args.cada_metricas):
+        try:
+            req = urllib.request.Request(args.url.rstrip("/") + "/metrics", headers=cab)
+            with urllib.request.urlopen(req, timeout=5) as resp:
+                texto = resp.read().decode()
+        except OSError:
+            continue
+        esperando = sum(float(v) for v in re.findall(r"^obt_db_requests_waiting\{[^}]*\} (\S+)$", texto, re.M))
+        with registro.lock:
+            registro.esperando_max = max(registro.esperando_max, esperando)
+
+
+def resumir(registro: Registro, duracion: float, ventana: float) -> Dict[str, Any]:
+    filas = [f for f in registro.filas if f["paso"] != "login"]
+    por_endpoint = {}
+    for paso in PASOS:
+        del_paso = [f for f in filas if f["paso"] == paso]
+        if not del_paso:
+            continue
+        ok = [f["seg"] for f in del_paso if not f["error"]]
+        pool = [f["pool_ms"] for f in del_paso if f["pool_ms"] is not None]
+        errores: Dict[str, int] = {}
+        for f in del_paso:
+            if f["error"]:
+                errores[f["error"]] = errores.get(f["error"], 0) + 1
+        por_endpoint[paso] = {
+            "peticiones": len(del_paso),
+            "throughput_rpm": round(len(del_paso) / duracion * 60, 2),
+            "tasa_error": round(sum(errores.values()) / len(del_paso), 4),
+            "errores": errores,
+            "p50_ms": round(percentil(ok, 50) * 1000, 1),
+            "p95_ms": round(percentil(ok, 95) * 1000, 1),
+            "p99_ms": round(percentil(ok, 99) * 1000, 1),
+            "db_p95_ms": round(percentil([f["db_ms"] for f in del_paso if f["db_ms"] is not None], 95), 1),
+            "pool_espera_p95_ms": round(percentil(pool, 95), 1),
+            "pool_saturadas": round(sum(1 for p in pool if p > UMBRAL_POOL_MS) / len(pool), 4) if pool else None,
+        }
+
+    # Evolución en el tiempo: cómo se degrada la latencia a medida que entran empresas
+    linea_tiempo = []
+    if filas:
+        t0 = min(f["t"] - f["seg"] for f in filas)
+        for k in range(int(duracion // ventana) + 1):
+            en = [f for f in filas if t0 + k * ventana <= f["t"] < t0 + (k + 1) * ventana]
+            if en:
+                linea_tiempo.append({
+                    "desde_seg": k * ventana,
+                    "peticiones": len(en),
+                    "errores": sum(1 for f in en if f["error"]),
+                    "p95_ms": round(percentil([f["seg"] for f in en], 95) * 1000, 1),
+                    "empresas_activas": len({f["empresa"] for f in en}),
+                })
+
+    logins_fallidos = sum(1 for f in registro.filas if f["paso"] == "login")
+    return {
+        "duracion_seg": round(duracion, 1),
+        "peticiones": len(filas),
+        "throughput_rps": round(len(filas) / duracion, 3) if duracion else 0,
+        "tasa_error": round(sum(1 for f in filas if f["error"]) / len(filas), 4) if filas else 0,
+        "logins_fallidos": logins_fallidos,
+        "pool_requests_waiting_max": registro.esperando_max,
+        "endpoints": por_endpoint,
+        "linea_tiempo": linea_tiempo,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("--url", default="http://127.0.0.1:5000")
+    ap.add_argument("--empresas", type=int, default=30)
+    ap.add_argument("--duracion", type=float, default=600, help="segundos de prueba (incluye la rampa)")
+    ap.add_argument("--rampa", type=float, default=120, help="segundos en que van entrando las empresas")
+    ap.add_argument("--pausa", type=float, default=5, help="pausa media entre pasos (exponencial)")
+    ap.add_argument("--pasos", default=",".join(PASOS), type=lambda v: v.split(","))
+    ap.add_argument("--lineas", type=int, default=20_000, help="líneas de pedido por empresa (±50 %%)")
+    ap.add_argument("--lineas-sap", type=int, default=3_000)
+    ap.add_argument("--semilla", type=int, default=0)
+    ap.add_argument("--password", default=os.getenv("BENCH_PASSWORD", "bench"))
+    ap.add_argument("--sembrar", metavar="DSN", help="carga stubs.sql y crea los usuarios antes de empezar")
+    ap.add_argument("--timeout", type=float, default=600)
+    ap.add_argument("--metrics-token", default=os.getenv("METRICS_TOKEN"))
+    ap.add_argument("--cada-metricas", type=float, default=5)
+    ap.add_argument("--ventana", type=float, default=30, help="segundos por punto de la línea de tiempo")
+    ap.add_argument("--salida", default="resultados_carga.json")
+    args = ap.parse_args()
+
+    if args.sembrar:
+        sembrar(args.sembrar, args.empresas, args.password)
+    esperar_servidor(args.url)
+
+    print(f"preparando payloads de {args.empresas} empresas...", flush=True)
+    pasos = [preparar_pasos(i, args) for i in range(args.empresas)]
+
+    registro = Registro()
+    fin_metricas = threading.Event()
+    vigia = threading.Thread(target=vigilar_metricas, args=(args, registro, fin_metricas), daemon=True)
+    vigia.start()
+
+    t_inicio = time.monotonic()
+    t_fin = t_inicio + args.duracion
+    hilos = [
+        threading.Thread(target=usuario, args=(i, args, pasos[i], registro, t_inicio, t_fin))
+        for i in range(args.empresas)
+    ]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    fin_metricas.set()
+    duracion = time.monotonic() - t_inicio
+
+    resumen = resumir(registro, duracion, args.ventana)
+    resumen["config"] = {k: v for k, v in vars(args).items() if k not in ("password", "metrics_token")}
+    with open(args.salida, "w", encoding="utf-8") as fh:
+        json.dump(resumen, fh, indent=2, ensure_ascii=False)
+
+    print(f"\n{resumen['peticiones']} peticiones en {resumen['duracion_seg']} s "
+          f"({resumen['throughput_rps']} req/s), errores {resumen['tasa_error']:.1%}, "
+          f"máx. esperando pool {resumen['pool_requests_waiting_max']:.0f}")
+    print(f"{'paso':<12} {'n':>6} {'req/min':>8} {'error':>7} {'p50':>9} {'p95':>9} {'p99':>9} "
+          f"{'pool p95':>9} {'saturadas':>9}")
+    for paso, r in resumen["endpoints"].items():
+        saturadas = "-" if r["pool_saturadas"] is None else f"{r['pool_saturadas']:.0%}"
+        print(f"{paso:<12} {r['peticiones']:>6} {r['throughput_rpm']:>8} {r['tasa_error']:>7.1%} "
+              f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['pool_espera_p95_ms']:>9} {saturadas:>9}")
+    print(f"\nresultados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
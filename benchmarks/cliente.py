@@ -0,0 +1,69 @@
+"""Cliente HTTP mínimo (solo stdlib) para los benchmarks contra la app."""
+
+import http.cookiejar
+import math
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+
+class Sesion:
+    """Un usuario con su propia cookie de sesión de Flask."""
+
+    def __init__(self, base_url: str, timeout: float = 600):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def login(self, email: str, password: str) -> None:
+        datos = urllib.parse.urlencode({"email": email, "password": password}).encode()
+        status, _, _, _ = self.pedir("POST", "/login", datos,
+                                     {"Content-Type": "application/x-www-form-urlencoded"})
+        if status >= 400:
+            raise RuntimeError(f"login falló con HTTP {status}")
+
+    def pedir(
+        self,
+        metodo: str,
+        path: str,
+        cuerpo: Optional[bytes] = None,
+        cabeceras: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, float, int, Dict[str, str]]:
+        """Devuelve (status, segundos, bytes de respuesta, cabeceras)."""
+        req = urllib.request.Request(
+            self.base_url + path, data=cuerpo, method=metodo, headers=cabeceras or {}
+        )
+        t0 = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                n = len(resp.read())
+                return resp.status, time.perf_counter() - t0, n, dict(resp.headers)
+        except urllib.error.HTTPError as e:
+            n = len(e.read() or b"")
+            return e.code, time.perf_counter() - t0, n, dict(e.headers or {})
+        except (urllib.error.URLError, OSError):
+            return 0, time.perf_counter() - t0, 0, {}
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por rango más cercano; 0 si no hay valores."""
+    if not valores:
+        return 0.0
+    orden = sorted(valores)
+    k = max(0, min(len(orden) - 1, math.ceil(p / 100 * len(orden)) - 1))
+    return orden[k]
+
+
+def esperar_servidor(base_url: str, segundos: float = 60) -> None:
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        try:
+            with urllib.request.urlopen(base_url.rstrip("/") + "/login", timeout=2):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.3)
+    raise RuntimeError(f"{base_url} no respondió en {segundos}s")
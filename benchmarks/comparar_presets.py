@@ -0,0 +1,158 @@
+"""Compara los perfiles de gunicorn.conf.py con la misma mezcla de peticiones.
+
+Para cada perfil levanta `gunicorn app:app` con `GUNICORN_PERFIL=<perfil>`,
+inicia sesión con N clientes concurrentes y durante `--duracion` segundos
+repite una mezcla de peticiones: GET /subir-pedidos y, si se pasan, los
+payloads msgpack de /generar-pedidos y /cargar-pedidos. Reporta
+throughput, p50/p95/p99, errores y el pico de RSS de todos los procesos.
+
+    BENCH_EMAIL=... BENCH_PASSWORD=... DATABASE_URL=... \\
+    python -m benchmarks.comparar_presets --clientes 16 --duracion 60 \\
+        --generar payload_inventario.msgpack --cargar payload_pedidos.msgpack --dia LU
+
+Usar una base de pruebas: /cargar-pedidos y /generar-pedidos escriben.
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.cliente import Sesion, esperar_servidor, percentil
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _rss_total_kb(pid_master: int) -> int:
+    """RSS del master más sus hijos directos, leído de /proc."""
+    pids = [pid_master]
+    try:
+        with open(f"/proc/{pid_master}/task/{pid_master}/children") as fh:
+            pids += [int(p) for p in fh.read().split()]
+    except OSError:
+        pass
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as fh:
+                for linea in fh:
+                    if linea.startswith("VmRSS:"):
+                        total += int(linea.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+def _mezcla(args) -> List[Tuple[str, str, bytes, Dict[str, str]]]:
+    mezcla = [("GET /subir-pedidos", "/subir-pedidos", b"", {})]
+    msgpack = {"Content-Type": "application/msgpack"}
+    if args.generar:
+        with open(args.generar, "rb") as fh:
+            mezcla.append(("POST /generar-pedidos", "/generar-pedidos", fh.read(), msgpack))
+    if args.cargar:
+        with open(args.cargar, "rb") as fh:
+            # force=1 para medir el ETL y no la carga omitida por hash repetido
+            mezcla.append(("POST /cargar-pedidos",
+                           f"/cargar-pedidos?dia={args.dia}&force=1", fh.read(), msgpack))
+    return mezcla
+
+
+def medir_perfil(perfil: str, args) -> Dict:
+    puerto = args.puerto
+    base = f"http://127.0.0.1:{puerto}"
+    env = {**os.environ, "GUNICORN_PERFIL": perfil, "GUNICORN_BIND": f"127.0.0.1:{puerto}"}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app"], cwd=RAIZ, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        esperar_servidor(base)
+        mezcla = _mezcla(args)
+        resultados: List[Tuple[str, int, float]] = []
+        lock = threading.Lock()
+        rss_pico = [_rss_total_kb(proc.pid)]
+        fin = 0.0  # se fija cuando todos los clientes iniciaron sesión
+        listo = threading.Event()
+
+        def cliente(i: int) -> None:
+            sesion = Sesion(base)
+            sesion.login(args.email, args.password)
+            listo.wait()
+            k = i
+            while time.monotonic() < fin:
+                nombre, path, cuerpo, cab = mezcla[k % len(mezcla)]
+                status, seg, _, _ = sesion.pedir("POST" if cuerpo else "GET", path, cuerpo or None, cab)
+                with lock:
+                    resultados.append((nombre, status, seg))
+                k += 1
+
+        hilos = [threading.Thread(target=cliente, args=(i,)) for i in range(args.clientes)]
+        for h in hilos:
+            h.start()
+        time.sleep(1)
+        t0 = time.monotonic()
+        fin = t0 + args.duracion
+        listo.set()
+        while any(h.is_alive() for h in hilos):
+            rss_pico[0] = max(rss_pico[0], _rss_total_kb(proc.pid))
+            time.sleep(0.5)
+        transcurrido = time.monotonic() - t0
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=90)
+
+    por_endpoint = {}
+    for nombre in {r[0] for r in resultados}:
+        lat = [r[2] for r in resultados if r[0] == nombre]
+        errores = sum(1 for r in resultados if r[0] == nombre and not 200 <= r[1] < 400)
+        por_endpoint[nombre] = {
+            "peticiones": len(lat),
+            "errores": errores,
+            "p50_ms": round(percentil(lat, 50) * 1000, 1),
+            "p95_ms": round(percentil(lat, 95) * 1000, 1),
+            "p99_ms": round(percentil(lat, 99) * 1000, 1),
+        }
+    return {
+        "perfil": perfil,
+        "throughput_rps": round(len(resultados) / transcurrido, 2) if transcurrido else 0,
+        "errores": sum(1 for r in resultados if not 200 <= r[1] < 400),
+        "rss_pico_mb": round(rss_pico[0] / 1024, 1),
+        "endpoints": por_endpoint,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("--perfiles", default="mixto,cpu,io")
+    ap.add_argument("--clientes", type=int, default=16)
+    ap.add_argument("--duracion", type=float, default=60)
+    ap.add_argument("--puerto", type=int, default=5098)
+    ap.add_argument("--generar", help="payload msgpack para /generar-pedidos")
+    ap.add_argument("--cargar", help="payload msgpack para /cargar-pedidos")
+    ap.add_argument("--dia", default="LU")
+    ap.add_argument("--email", default=os.getenv("BENCH_EMAIL"))
+    ap.add_argument("--password", default=os.getenv("BENCH_PASSWORD"))
+    ap.add_argument("--salida", default="resultados_presets.json")
+    args = ap.parse_args()
+    if not args.email or not args.password:
+        ap.error("faltan credenciales (--email/--password o BENCH_EMAIL/BENCH_PASSWORD)")
+
+    resultados = [medir_perfil(p.strip(), args) for p in args.perfiles.split(",")]
+
+    print(f"{'perfil':<8} {'req/s':>8} {'errores':>8} {'RSS MB':>8}  endpoint: p50/p95/p99 ms")
+    for r in resultados:
+        detalle = "; ".join(
+            f"{n}: {e['p50_ms']}/{e['p95_ms']}/{e['p99_ms']}" for n, e in sorted(r["endpoints"].items())
+        )
+        print(f"{r['perfil']:<8} {r['throughput_rps']:>8} {r['errores']:>8} {r['rss_pico_mb']:>8}  {detalle}")
+    with open(args.salida, "w", encoding="utf-8") as fh:
+        json.dump(resultados, fh, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Datos sintéticos con la forma de los archivos reales, a cualquier escala.
+
+Las filas salen con las mismas claves que arman las plantillas (y
+`views/ingesta.py`), de modo que pasan `views/validacion.py` y se pueden
+enviar tal cual en MessagePack:
+
+- pedidos + rutas para /cargar-pedidos;
+- inventario + materiales para /generar-pedidos;
+- reporte SAP (Excel) para /consolidar-compras.
+
+Con la misma `semilla` y escala los datos son idénticos entre corridas.
+
+    python -m benchmarks.datos --lineas 100000 --salida /tmp/obt_datos
+"""
+
+import argparse
+import os
+import random
+from io import BytesIO
+from typing import Any, Dict, List, Tuple
+
+import msgpack
+
+CIUDADES = ["MEDELLIN", "ENVIGADO", "ITAGUI", "BELLO", "SABANETA", "RIONEGRO"]
+BARRIOS = ["CENTRO", "LAURELES", "BELEN", "ROBLEDO", "POBLADO", "ARANJUEZ", "CASTILLA"]
+FAMILIAS = ["GALLETA", "CHOCOLATE", "CAFE", "PASTA", "CARNICO", "HELADO", "SNACK"]
+
+
+def _dimensiones(lineas: int) -> Tuple[int, int, int]:
+    """Clientes, productos y rutas proporcionales a las líneas de pedido."""
+    clientes = max(10, lineas // 12)
+    productos = max(20, min(4_000, int(lineas ** 0.6)))
+    rutas = max(2, min(60, clientes // 150 + 2))
+    return clientes, productos, rutas
+
+
+def catalogo(productos: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "codigo_pro": f"{100000 + i}",
+            "producto": f"{FAMILIAS[i % len(FAMILIAS)]} PRESENTACION {i:05d}",
+            "particion": random.Random(i).choice([1, 1, 2, 3, 6]),
+            "pq_x_caja": random.Random(i).choice([6, 12, 24, 30, 48]),
+        }
+        for i in range(productos)
+    ]
+
+
+def pedidos_y_rutas(lineas: int, dia: str = "LU", semilla: int = 0) -> Dict[str, Any]:
+    """Payload de /cargar-pedidos: `lineas` filas de pedido y una ruta por cliente."""
+    rnd = random.Random(semilla)
+    n_clientes, n_productos, n_rutas = _dimensiones(lineas)
+    productos = catalogo(n_productos)
+
+    pedidos: List[Dict[str, Any]] = []
+    rutas: List[Dict[str, Any]] = []
+    cliente = 0
+    numero = 0
+    while len(pedidos) < lineas:
+        cod_cli = f"{800000 + cliente}"
+        asesor = f"{5000 + cliente % 40}"
+        nombre = f"TIENDA {cliente:06d}"
+        barrio = BARRIOS[cliente % len(BARRIOS)]
+        ciudad = CIUDADES[cliente % len(CIUDADES)]
+        rutas.append({
+            "codigo_cliente": f"{cod_cli}-{dia}",
+            "codigo_ruta": f"{cliente % n_rutas + 1}-{dia}",
+        })
+        # Cada cliente hace uno o dos pedidos con varios productos distintos
+        for _ in range(rnd.choice([1, 1, 2])):
+            numero += 1
+            for prod in rnd.sample(productos, min(len(productos), rnd.randint(3, 20))):
+                if len(pedidos) >= lineas:
+                    break
+                cantidad = rnd.randint(1, 48)
+                pedidos.append({
+                    "numero_pedido": f"P{numero:09d}",
+                    "cliente": f"{cod_cli}-{dia}",
+                    "nombre": nombre,
+                    "barrio": barrio,
+                    "ciudad": ciudad,
+                    "asesor": f"{asesor}-VENTAS",
+                    "codigo_pideky": str(900000 + numero),
+                    "codigo_pro": prod["codigo_pro"],
+                    "producto": prod["producto"],
+                    "cantidad": cantidad,
+                    "valor": round(cantidad * rnd.uniform(800, 25_000), 2),
+                    "tipo_pro": "N",
+                    "estado": "Sin facturar",
+                })
+        cliente += 1
+        if cliente >= n_clientes:
+            cliente = 0  # se reciclan clientes con pedidos nuevos
+    return {"pedidos": pedidos, "rutas": _sin_repetidos(rutas)}
+
+
+def _sin_repetidos(rutas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    vistos = set()
+    unicas = []
+    for r in rutas:
+        if r["codigo_cliente"] not in vistos:
+            vistos.add(r["codigo_cliente"])
+            unicas.append(r)
+    return unicas
+
+
+def inventario_y_materiales(lineas: int, semilla: int = 0) -> Dict[str, Any]:
+    """Payload de /generar-pedidos con el mismo catálogo que `pedidos_y_rutas`."""
+    rnd = random.Random(semilla + 1)
+    _, n_productos, _ = _dimensiones(lineas)
+    productos = catalogo(n_productos)
+    return {
+        "inventario": [
+            {"codigo": p["codigo_pro"], "stock": rnd.randint(0, lineas // 2 + 50)}
+            for p in productos
+        ],
+        "materiales": [
+            {"pro_codigo": p["codigo_pro"], "particion": p["particion"], "pq_x_caja": p["pq_x_caja"]}
+            for p in productos
+        ],
+    }
+
+
+def reporte_sap(lineas: int, semilla: int = 0) -> bytes:
+    """Excel de SAP para /consolidar-compras con las columnas de COLUMN_CONFIG."""
+    import pandas as pd
+
+    from views.consolidar_compras import COLUMN_CONFIG
+
+    rnd = random.Random(semilla + 2)
+    n_clientes, n_productos, _ = _dimensiones(lineas)
+    productos = catalogo(n_productos)
+    filas = []
+    for i in range(lineas):
+        prod = productos[rnd.randrange(len(productos))]
+        cantidad = rnd.randint(1, 200)
+        filas.append({
+            "Pedido": str(4_500_000 + i // 15),
+            "Orden de compra": "23",
+            "Cantidad del pedido": str(cantidad),
+            "Unidad de medida": rnd.choice(["UN", "CJ"]),
+            "Codigo Sap Cliente": str(800000 + rnd.randrange(n_clientes)),
+            "Factura Sap": str(90_000_000 + i // 15),
+            "Fecha Factura": "2024-01-15",
+            "Material": prod["codigo_pro"],
+            "Descripcion del Material": prod["producto"],
+            "Cantidad Entrega": str(cantidad - rnd.randint(0, min(cantidad, 3))),
+            "Iva_valor": f"{cantidad * 190:.2f}",
+            "Impuesto Ultraprocesado": f"{cantidad * 35:.2f}",
+            "Valor_unitario": f"{rnd.uniform(800, 25_000):.2f}",
+            # Una parte son posiciones que el reporte descarta
+            "Tipo Pos": rnd.choices(["ZTAN", "ZCMM", "ZCM2"], weights=[90, 5, 5])[0],
+            "Entrega": str(80_000_000 + i // 15),
+            "Pos.Entrega": str(10 * (i % 15 + 1)),
+            "Transporte": "0",
+        })
+    df = pd.DataFrame(filas, columns=list(COLUMN_CONFIG))
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False)
+    return buf.getvalue()
+
+
+def empaquetar(payload: Dict[str, Any]) -> bytes:
+    """Mismo formato que envían las plantillas a /cargar-pedidos y /generar-pedidos."""
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("--lineas", type=int, default=10_000)
+    ap.add_argument("--dia", default="LU")
+    ap.add_argument("--semilla", type=int, default=0)
+    ap.add_argument("--salida", default="datos_benchmark")
+    ap.add_argument("--sin-sap", action="store_true", help="omite el Excel de SAP (lento a 1M)")
+    args = ap.parse_args()
+
+    os.makedirs(args.salida, exist_ok=True)
+    archivos = {
+        "pedidos.msgpack": empaquetar(pedidos_y_rutas(args.lineas, args.dia, args.semilla)),
+        "inventario.msgpack": empaquetar(inventario_y_materiales(args.lineas, args.semilla)),
+    }
+    if not args.sin_sap:
+        archivos["sap.xlsx"] = reporte_sap(args.lineas, args.semilla)
+    for nombre, contenido in archivos.items():
+        with open(os.path.join(args.salida, nombre), "wb") as fh:
+            fh.write(contenido)
+        print(f"{nombre}: {len(contenido) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
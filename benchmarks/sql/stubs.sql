@@ -0,0 +1,215 @@
+-- Versiones simplificadas de las tablas y rutinas de la base de producción,
+-- solo para benchmarks en una base desechable (benchmarks/suite.py).
+--
+-- Tienen las mismas firmas y devuelven las mismas columnas que usan las
+-- vistas, y hacen un trabajo del mismo orden (borrar/insertar por empresa,
+-- agrupar por ruta y producto), pero NO replican la lógica de negocio del
+-- reparto de inventario. Sirven para medir la parte Python y el tráfico con
+-- la base, no para validar resultados.
+
+CREATE EXTENSION IF NOT EXISTS pgcrypto;
+
+CREATE TABLE IF NOT EXISTS users (
+    id             SERIAL PRIMARY KEY,
+    email          TEXT UNIQUE NOT NULL,
+    password_hash  TEXT NOT NULL,
+    negocio        TEXT,
+    membership_end DATE
+);
+
+CREATE TABLE IF NOT EXISTS pedxclixprod (
+    bd            TEXT NOT NULL,
+    numero_pedido VARCHAR(70),
+    codigo_cli    VARCHAR(30),
+    nombre        VARCHAR(80),
+    barrio        VARCHAR(40),
+    ciudad        VARCHAR(30),
+    asesor        VARCHAR(20),
+    codigo_pideky TEXT,
+    codigo_pro    VARCHAR(25),
+    producto      VARCHAR(80),
+    cantidad      INTEGER,
+    valor         NUMERIC(14, 2),
+    tipo_pro      VARCHAR(2),
+    estado        VARCHAR(15),
+    ruta          INTEGER
+);
+CREATE INDEX IF NOT EXISTS pedxclixprod_bd ON pedxclixprod (bd, codigo_cli, codigo_pro);
+
+CREATE TABLE IF NOT EXISTS rutas_clientes (
+    bd         TEXT NOT NULL,
+    codigo_cli VARCHAR(30) NOT NULL,
+    ruta       INTEGER NOT NULL,
+    PRIMARY KEY (bd, codigo_cli)
+);
+
+CREATE TABLE IF NOT EXISTS materiales (
+    bd         TEXT NOT NULL,
+    pro_codigo VARCHAR(25) NOT NULL,
+    particion  INTEGER NOT NULL,
+    pq_x_caja  INTEGER NOT NULL,
+    PRIMARY KEY (bd, pro_codigo)
+);
+
+CREATE TABLE IF NOT EXISTS pedxrutaxprod (
+    bd         TEXT NOT NULL,
+    ruta       INTEGER NOT NULL,
+    codigo_pro VARCHAR(25) NOT NULL,
+    producto   VARCHAR(80),
+    cantidad   INTEGER NOT NULL,
+    pedir      INTEGER NOT NULL,
+    ped99      INTEGER NOT NULL DEFAULT 0,
+    inv        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS pedxrutaxprod_bd ON pedxrutaxprod (bd, ruta, producto);
+
+
+-- Pedido normalizado a partir de una fila del payload (mismas claves que el front)
+CREATE OR REPLACE FUNCTION _bench_pedidos(p_pedidos JSONB)
+RETURNS TABLE (numero_pedido TEXT, codigo_cli TEXT, nombre TEXT, barrio TEXT, ciudad TEXT,
+               asesor TEXT, codigo_pideky TEXT, codigo_pro TEXT, producto TEXT,
+               cantidad INTEGER, valor NUMERIC, tipo_pro TEXT, estado TEXT)
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT p->>'numero_pedido',
+           split_part(p->>'cliente', '-', 1),
+           p->>'nombre', p->>'barrio', p->>'ciudad',
+           split_part(p->>'asesor', '-', 1),
+           p->>'codigo_pideky', p->>'codigo_pro', p->>'producto',
+           (p->>'cantidad')::NUMERIC::INTEGER,
+           COALESCE(NULLIF(p->>'valor', ''), '0')::NUMERIC,
+           p->>'tipo_pro', p->>'estado'
+    FROM jsonb_array_elements(p_pedidos) AS p
+$$;
+
+
+CREATE OR REPLACE PROCEDURE etl_cargar_pedidos_y_rutas_masivo(
+    p_pedidos JSONB, p_rutas JSONB, p_dia TEXT, p_bd TEXT)
+LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM rutas_clientes WHERE bd = p_bd;
+    INSERT INTO rutas_clientes (bd, codigo_cli, ruta)
+    SELECT DISTINCT ON (cli) p_bd, cli, ruta
+    FROM (
+        SELECT split_part(regexp_replace(r->>'codigo_cliente', ' ', '-'), '-', 1) AS cli,
+               split_part(regexp_replace(r->>'codigo_ruta', ' ', '-'), '-', 1)::INTEGER AS ruta,
+               split_part(regexp_replace(r->>'codigo_ruta', ' ', '-'), '-', 2) AS dia
+        FROM jsonb_array_elements(p_rutas) AS r
+    ) t
+    WHERE dia = p_dia;
+
+    DELETE FROM pedxclixprod WHERE bd = p_bd;
+    INSERT INTO pedxclixprod
+    SELECT p_bd, p.numero_pedido, p.codigo_cli, p.nombre, p.barrio, p.ciudad, p.asesor,
+           p.codigo_pideky, p.codigo_pro, p.producto, p.cantidad, p.valor, p.tipo_pro,
+           p.estado, COALESCE(rc.ruta, 0)
+    FROM _bench_pedidos(p_pedidos) p
+    LEFT JOIN rutas_clientes rc ON rc.bd = p_bd AND rc.codigo_cli = p.codigo_cli;
+
+    DELETE FROM pedxrutaxprod WHERE bd = p_bd;
+END $$;
+
+
+CREATE OR REPLACE PROCEDURE etl_cargar_pedidos_delta(
+    p_upserts JSONB, p_borrados JSONB, p_dia TEXT, p_bd TEXT)
+LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM pedxclixprod d
+    USING jsonb_array_elements(p_borrados) AS b
+    WHERE d.bd = p_bd
+      AND d.codigo_cli = split_part(b->>'codigo_cli', '-', 1)
+      AND d.codigo_pro = b->>'codigo_pro';
+
+    INSERT INTO pedxclixprod
+    SELECT p_bd, p.numero_pedido, p.codigo_cli, p.nombre, p.barrio, p.ciudad, p.asesor,
+           p.codigo_pideky, p.codigo_pro, p.producto, p.cantidad, p.valor, p.tipo_pro,
+           p.estado, COALESCE(rc.ruta, 0)
+    FROM _bench_pedidos(p_upserts) p
+    LEFT JOIN rutas_clientes rc ON rc.bd = p_bd AND rc.codigo_cli = p.codigo_cli;
+
+    DELETE FROM pedxrutaxprod WHERE bd = p_bd;
+END $$;
+
+
+CREATE OR REPLACE PROCEDURE sp_cargar_materiales(p_materiales JSONB, p_bd TEXT)
+LANGUAGE sql AS $$
+    INSERT INTO materiales (bd, pro_codigo, particion, pq_x_caja)
+    SELECT DISTINCT ON (m->>'pro_codigo') p_bd, m->>'pro_codigo',
+           (m->>'particion')::NUMERIC::INTEGER, (m->>'pq_x_caja')::NUMERIC::INTEGER
+    FROM jsonb_array_elements(p_materiales) AS m
+    ON CONFLICT (bd, pro_codigo) DO UPDATE
+        SET particion = EXCLUDED.particion, pq_x_caja = EXCLUDED.pq_x_caja;
+$$;
+
+
+CREATE OR REPLACE FUNCTION fn_materiales_sin_definir(p_bd TEXT)
+RETURNS JSON LANGUAGE sql STABLE AS $$
+    SELECT COALESCE(json_agg(json_build_object('codigo_pro', codigo_pro, 'producto', producto)), '[]')
+    FROM (
+        SELECT DISTINCT p.codigo_pro, p.producto
+        FROM pedxclixprod p
+        LEFT JOIN materiales m ON m.bd = p.bd AND m.pro_codigo = p.codigo_pro
+        WHERE p.bd = p_bd AND m.pro_codigo IS NULL
+    ) t
+$$;
+
+
+-- Agrupa por ruta y producto y reparte el inventario en orden de ruta
+CREATE OR REPLACE PROCEDURE sp_etl_pedxrutaxprod_json(
+    p_inventario JSONB, p_bd TEXT, p_carro1 INTEGER, p_carro2 INTEGER)
+LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM pedxrutaxprod WHERE bd = p_bd;
+    INSERT INTO pedxrutaxprod (bd, ruta, codigo_pro, producto, cantidad, pedir, ped99, inv)
+    SELECT p_bd, ruta, codigo_pro, producto, cantidad,
+           GREATEST(cantidad - asignado, 0),
+           CASE WHEN ruta IN (p_carro1, p_carro2) THEN cantidad ELSE 0 END,
+           asignado
+    FROM (
+        SELECT a.*,
+               LEAST(a.cantidad, GREATEST(COALESCE(i.stock, 0) - (a.acumulado - a.cantidad), 0)) AS asignado
+        FROM (
+            SELECT ruta, codigo_pro, MAX(producto) AS producto, SUM(cantidad)::INTEGER AS cantidad,
+                   SUM(SUM(cantidad)) OVER (PARTITION BY codigo_pro ORDER BY ruta) AS acumulado
+            FROM pedxclixprod
+            WHERE bd = p_bd
+            GROUP BY ruta, codigo_pro
+        ) a
+        LEFT JOIN (
+            SELECT x->>'codigo' AS codigo, SUM((x->>'stock')::NUMERIC)::INTEGER AS stock
+            FROM jsonb_array_elements(p_inventario) AS x
+            GROUP BY 1
+        ) i ON i.codigo = a.codigo_pro
+    ) t;
+END $$;
+
+
+-- Versiones *_json de las lecturas (DB_LECTURA_FILAS=0); mismas columnas que db.CONSULTAS_FILAS
+CREATE OR REPLACE FUNCTION fn_obtener_pedidos_con_pedir_json(p_bd TEXT)
+RETURNS JSON LANGUAGE sql STABLE AS $$
+    SELECT COALESCE(json_agg(t), '[]') FROM (
+        SELECT ruta, codigo_pro, producto, pedir
+        FROM pedxrutaxprod WHERE pedir > 0 AND bd = p_bd
+        ORDER BY ruta, producto
+    ) t
+$$;
+
+CREATE OR REPLACE FUNCTION fn_obtener_reparticion_inventario_json(p_bd TEXT)
+RETURNS JSON LANGUAGE sql STABLE AS $$
+    SELECT COALESCE(json_agg(t), '[]') FROM (
+        SELECT bd, ruta, codigo_pro, producto, cantidad, pedir, ped99, inv
+        FROM pedxrutaxprod WHERE inv > 0 AND bd = p_bd
+        ORDER BY ruta, producto
+    ) t
+$$;
+
+CREATE OR REPLACE FUNCTION fn_obtener_resumen_pedidos(p_bd TEXT)
+RETURNS JSON LANGUAGE sql STABLE AS $$
+    SELECT COALESCE(json_agg(t), '[]') FROM (
+        SELECT bd, codigo_cli, nombre, barrio, ciudad, asesor,
+               MAX(codigo_pideky) AS codigo_pideky,
+               COUNT(DISTINCT numero_pedido) AS total_pedidos,
+               SUM(valor) AS valor, ruta
+        FROM pedxclixprod WHERE bd = p_bd
+        GROUP BY barrio, codigo_cli, bd, nombre, ciudad, asesor, ruta
+    ) t
+$$;
@@ -0,0 +1,318 @@
+"""Benchmark de extremo a extremo de los endpoints pesados, en proceso.
+
+Crea una base Postgres desechable, carga `benchmarks/sql/stubs.sql` (tablas
+y rutinas `etl_*`/`sp_*`/`fn_*` simplificadas) y las migraciones de la app, y
+con el cliente de pruebas de Flask mide, para cada escala de datos
+sintéticos (`benchmarks/datos.py`):
+
+- `upload_index`: POST /cargar-pedidos (msgpack, `force=1`);
+- `cargar_pedidos`: POST /generar-pedidos, incluido `_build_zip`;
+- `consolidar_compras_index`: POST /consolidar-compras sin caché;
+- `descargar_excel`: POST /auditoria/descargar, con la caché de descargas vacía;
+- `descargar_excel_cache`: el mismo POST servido desde la caché de descargas.
+
+Por caso y escala reporta latencia (mediana y mínimo), pico de memoria de
+Python (tracemalloc), bytes de la respuesta y los spans de `Server-Timing`.
+El resultado se guarda en JSON (con el commit) y `--comparar` marca las
+regresiones contra una corrida anterior.
+
+    python -m benchmarks.suite --admin-dsn postgresql://postgres@localhost/postgres \\
+        --escalas 1000,10000,100000 --repeticiones 3
+    python -m benchmarks.suite ... --comparar benchmarks/resultados/<anterior>.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg
+from psycopg import sql
+from psycopg.conninfo import make_conninfo
+
+from benchmarks import datos
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS_SQL = os.path.join(RAIZ, "benchmarks", "sql", "stubs.sql")
+
+EMAIL = "bench@bench.com"
+EMPRESA = "bench"
+DIA = "LU"
+MSGPACK = "application/msgpack"
+
+CASOS = ["upload_index", "cargar_pedidos", "consolidar_compras_index", "descargar_excel",
+         "descargar_excel_cache"]
+
+
+# ------------------------------------------------------------------
+# Base desechable
+# ------------------------------------------------------------------
+def crear_base(admin_dsn: str) -> str:
+    nombre = f"obt_bench_{os.getpid()}_{int(time.time())}"
+    with psycopg.connect(admin_dsn, autocommit=True) as conn:
+        conn.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(nombre)))
+    return nombre
+
+
+def borrar_base(admin_dsn: str, nombre: str) -> None:
+    with psycopg.connect(admin_dsn, autocommit=True) as conn:
+        conn.execute(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(sql.Identifier(nombre)))
+
+
+def preparar_base(dsn: str) -> int:
+    """Carga las rutinas de prueba y el usuario del benchmark; devuelve su id."""
+    with open(STUBS_SQL, encoding="utf-8") as fh:
+        stubs = fh.read()
+    with psycopg.connect(dsn) as conn:
+        conn.execute(stubs)
+        fila = conn.execute(
+            """
+            INSERT INTO users (email, password_hash, negocio)
+            VALUES (%s, crypt('bench', gen_salt('bf')), 'bench')
+            ON CONFLICT (email) DO UPDATE SET negocio = EXCLUDED.negocio
+            RETURNING id
+            """,
+            (EMAIL,),
+        ).fetchone()
+    return fila[0]
+
+
+# ------------------------------------------------------------------
+# Medición
+# ------------------------------------------------------------------
+def _server_timing(valor: Optional[str]) -> Dict[str, float]:
+    spans: Dict[str, float] = {}
+    for parte in (valor or "").split(","):
+        nombre, _, dur = parte.strip().partition(";dur=")
+        if nombre and dur:
+            spans[nombre] = float(dur)
+    return spans
+
+
+def medir(caso: str, escala: int, peticion: Callable[[], Any], repeticiones: int,
+          antes: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """Corre `peticion` N veces para la latencia y una más bajo tracemalloc."""
+    tiempos: List[float] = []
+    bytes_resp = 0
+    spans: Dict[str, float] = {}
+    for _ in range(repeticiones):
+        if antes:
+            antes()
+        t0 = time.perf_counter()
+        resp = peticion()
+        cuerpo = resp.get_data()
+        tiempos.append(time.perf_counter() - t0)
+        if resp.status_code != 200:
+            return {"caso": caso, "escala": escala, "error": f"{resp.status_code}: {cuerpo[:500]!r}"}
+        bytes_resp = len(cuerpo)
+        spans = _server_timing(resp.headers.get("Server-Timing"))
+        resp.close()
+
+    if antes:
+        antes()
+    tracemalloc.start()
+    try:
+        peticion().get_data()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "caso": caso,
+        "escala": escala,
+        "seg_mediana": statistics.median(tiempos),
+        "seg_min": min(tiempos),
+        "pico_python_mb": round(pico / 1e6, 2),
+        "maxrss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "bytes_respuesta": bytes_resp,
+        "spans_ms": spans,
+    }
+
+
+def correr_escala(cliente, escala: int, args, cache_dir: str) -> List[Dict[str, Any]]:
+    pedidos = datos.empaquetar(datos.pedidos_y_rutas(escala, DIA, args.semilla))
+    inventario = datos.empaquetar(datos.inventario_y_materiales(escala, args.semilla))
+    lineas_sap = min(escala, args.sap_max)
+    sap = datos.reporte_sap(lineas_sap, args.semilla)
+
+    def _limpiar_cache():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def _limpiar_descargas():
+        # Sin esto, desde la segunda repetición se mediría un acierto de caché
+        from views import cache_descargas
+        cache_descargas.invalidar(EMPRESA)
+
+    peticiones = {
+        "upload_index": lambda: cliente.post(
+            f"/cargar-pedidos?dia={DIA}&force=1", data=pedidos, content_type=MSGPACK),
+        "cargar_pedidos": lambda: cliente.post(
+            "/generar-pedidos", data=inventario, content_type=MSGPACK),
+        "consolidar_compras_index": lambda: cliente.post(
+            "/consolidar-compras",
+            data={"archivo": (BytesIO(sap), "sap.xlsx"), "orden_compra": "123"},
+            content_type="multipart/form-data"),
+        "descargar_excel": lambda: cliente.post("/auditoria/descargar"),
+        "descargar_excel_cache": lambda: cliente.post("/auditoria/descargar"),
+    }
+    antes = {
+        "consolidar_compras_index": _limpiar_cache,
+        "descargar_excel": _limpiar_descargas,
+    }
+
+    resultados = []
+    # El orden importa: /generar-pedidos y la auditoría leen lo que dejó la carga
+    for caso in CASOS:
+        if caso not in args.casos:
+            continue
+        if caso == "descargar_excel_cache":
+            peticiones[caso]().close()  # deja el archivo en la caché
+        r = medir(caso, escala, peticiones[caso], args.repeticiones, antes=antes.get(caso))
+        if caso == "consolidar_compras_index":
+            r["lineas_sap"] = lineas_sap
+        r["bytes_payload"] = {"upload_index": len(pedidos), "cargar_pedidos": len(inventario),
+                              "consolidar_compras_index": len(sap)}.get(caso, 0)
+        resultados.append(r)
+        print(_linea(r), flush=True)
+    return resultados
+
+
+def _linea(r: Dict[str, Any]) -> str:
+    if "error" in r:
+        return f"{r['caso']:<26} {r['escala']:>9}  ERROR {r['error']}"
+    return (f"{r['caso']:<26} {r['escala']:>9}  {r['seg_mediana'] * 1000:9.0f} ms  "
+            f"{r['pico_python_mb']:8.1f} MB  {r['bytes_respuesta'] / 1e6:7.2f} MB salida")
+
+
+# ------------------------------------------------------------------
+# Comparación entre corridas
+# ------------------------------------------------------------------
+def comparar(actual: Dict[str, Any], previo: Dict[str, Any], tolerancia: float) -> List[str]:
+    """Devuelve las regresiones de latencia o memoria mayores a `tolerancia`."""
+    antes = {(r["caso"], r["escala"]): r for r in previo["resultados"] if "error" not in r}
+    regresiones = []
+    print(f"\ncomparado con {previo.get('commit', '?')} ({previo.get('fecha', '?')}):")
+    for r in actual["resultados"]:
+        p = antes.get((r["caso"], r["escala"]))
+        if p is None or "error" in r:
+            continue
+        for campo, unidad in (("seg_mediana", "s"), ("pico_python_mb", "MB")):
+            if not p[campo]:
+                continue
+            cambio = r[campo] / p[campo] - 1
+            marca = ""
+            if cambio > tolerancia:
+                marca = "  <-- regresión"
+                regresiones.append(f"{r['caso']} @ {r['escala']}: {campo} {cambio:+.0%}")
+            print(f"  {r['caso']:<26} {r['escala']:>9} {campo:<15} "
+                  f"{p[campo]:10.3f} -> {r[campo]:10.3f} {unidad} ({cambio:+.0%}){marca}")
+    return regresiones
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("--admin-dsn", default=os.getenv("BENCH_ADMIN_DSN"),
+                    help="conexión con permiso de CREATE DATABASE; se crea y borra una base temporal")
+    ap.add_argument("--dsn", help="usar esta base (vacía) en vez de crear una")
+    ap.add_argument("--mantener", action="store_true", help="no borrar la base temporal al terminar")
+    ap.add_argument("--escalas", default="1000,10000,100000",
+                    type=lambda v: [int(x) for x in v.split(",")])
+    ap.add_argument("--casos", default=",".join(CASOS), type=lambda v: v.split(","))
+    ap.add_argument("--repeticiones", type=int, default=3)
+    ap.add_argument("--semilla", type=int, default=0)
+    ap.add_argument("--sap-max", type=int, default=200_000,
+                    help="tope de líneas del Excel SAP (escribirlo a 1M toma minutos)")
+    ap.add_argument("--salida", help="archivo JSON (por defecto benchmarks/resultados/<fecha>_<commit>.json)")
+    ap.add_argument("--comparar", help="JSON de una corrida anterior")
+    ap.add_argument("--tolerancia", type=float, default=0.15)
+    args = ap.parse_args()
+
+    if not args.dsn and not args.admin_dsn:
+        ap.error("indica --admin-dsn (o BENCH_ADMIN_DSN) o --dsn")
+
+    nombre_base = None
+    if args.dsn:
+        dsn = args.dsn
+    else:
+        nombre_base = crear_base(args.admin_dsn)
+        dsn = make_conninfo(args.admin_dsn, dbname=nombre_base)
+
+    cache_dir = tempfile.mkdtemp(prefix="obt_bench_cache_")
+    # La app lee su configuración al importarse
+    os.environ.update({
+        "DATABASE_URL": dsn,
+        "MIGRAR_AL_INICIAR": "0",
+        "CACHE_PEDIDOS_NOTIFY": "0",
+        "CONSOLIDAR_CACHE_DIR": cache_dir,
+        "CACHE_DESCARGAS_DIR": os.path.join(cache_dir, "descargas"),
+        "LOG_ACCESOS": "0",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+    sys.path.insert(0, RAIZ)
+
+    try:
+        user_id = preparar_base(dsn)
+        from app import app
+        import db
+        from migraciones import migrar
+
+        migrar()
+        app.config["TESTING"] = True
+        cliente = app.test_client()
+        with cliente.session_transaction() as s:
+            s.update(user_id=user_id, email=EMAIL, empresa=EMPRESA, negocio="bench", is_admin=False)
+
+        print(f"{'caso':<26} {'escala':>9}  {'latencia':>12}  {'pico':>11}")
+        resultados: List[Dict[str, Any]] = []
+        for escala in args.escalas:
+            resultados += correr_escala(cliente, escala, args, cache_dir)
+        db.cerrar_pool()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        if nombre_base and not args.mantener:
+            borrar_base(args.admin_dsn, nombre_base)
+
+    salida = {
+        "commit": _commit(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "repeticiones": args.repeticiones,
+        "resultados": resultados,
+    }
+    ruta = args.salida or os.path.join(
+        RAIZ, "benchmarks", "resultados", f"{datetime.now():%Y%m%d_%H%M}_{salida['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, "w", encoding="utf-8") as fh:
+        json.dump(salida, fh, indent=2, ensure_ascii=False)
+    print(f"\nresultados en {ruta}")
+
+    fallas = [f"{r['caso']} @ {r['escala']}: {r['error']}" for r in resultados if "error" in r]
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as fh:
+            fallas += comparar(salida, json.load(fh), args.tolerancia)
+    for falla in fallas:
+        print(f"FALLA: {falla}", file=sys.stderr)
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
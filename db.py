@@ -1,9 +1,440 @@
 import os
-from psycopg import connect
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
 
+from psycopg import Connection, Cursor, OperationalError, Pipeline, errors
+from psycopg.types.json import set_json_loads
+from psycopg_pool import ConnectionPool, PoolTimeout
+
+import metricas
+import plazos
+from registro import get_logger
+
+log = get_logger(__name__)
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson es opcional
+    import json
+    _json_loads = json.loads
+
+# json/jsonb se decodifican con orjson en todas las conexiones
+set_json_loads(_json_loads)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-def conectar():    
-    return connect(DATABASE_URL)
+# Pool de conexiones por proceso (opcional); ver gunicorn.conf.py
+DB_POOL = os.getenv("DB_POOL", "0") == "1"
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Réplica de solo lectura (opcional) para las lecturas de `conectar_lectura`
+DATABASE_URL_REPLICA = os.getenv("DATABASE_URL_REPLICA")
+# Tras una escritura de la empresa sus lecturas van al primario este tiempo
+REPLICA_VENTANA_SEG = float(os.getenv("DB_REPLICA_VENTANA_SEG", "30"))
+# Con más retraso que esto la réplica no se usa
+REPLICA_RETRASO_MAX = float(os.getenv("DB_REPLICA_RETRASO_MAX", "10"))
+REPLICA_MEDIR_CADA = float(os.getenv("DB_REPLICA_MEDIR_CADA", "15"))
+REPLICA_TIMEOUT = float(os.getenv("DB_REPLICA_TIMEOUT", "2"))
+
+# Lee los fn_obtener_*_json como filas tipadas en vez de un único JSON.
+# Desactivado por defecto: las consultas de abajo son copias a mano de las
+# funciones de MEMPRY FACT y los NUMERIC llegan como Decimal, no como float
+LECTURA_FILAS = os.getenv("DB_LECTURA_FILAS", "0") == "1"
+
+# Consultas equivalentes a cada función *_json (mismas columnas y orden);
+# si cambia una función en el esquema hay que cambiarla aquí también
+CONSULTAS_FILAS = {
+    "fn_obtener_pedidos_con_pedir_json": """
+        SELECT ruta, codigo_pro, producto, pedir
+        FROM pedxrutaxprod
+        WHERE pedir > 0 AND bd = %s
+        ORDER BY ruta ASC, producto ASC
+    """,
+    "fn_obtener_reparticion_inventario_json": """
+        SELECT bd, ruta, codigo_pro, producto, cantidad, pedir, ped99, inv
+        FROM pedxrutaxprod
+        WHERE inv > 0 AND bd = %s
+        ORDER BY ruta ASC, producto ASC
+    """,
+    "fn_obtener_resumen_pedidos": """
+        SELECT bd, codigo_cli, nombre, barrio, ciudad, asesor,
+               MAX(codigo_pideky) AS codigo_pideky,
+               COUNT(DISTINCT numero_pedido) AS total_pedidos,
+               SUM(valor) AS valor,
+               ruta
+        FROM pedxclixprod
+        WHERE bd = %s
+        GROUP BY barrio, codigo_cli, bd, nombre, ciudad, asesor, ruta
+    """,
+}
+
+def _relanzar(e: Exception) -> None:
+    """Relanza la cancelación como `PlazoVencido` si hay plazo, o tal cual."""
+    traducida = plazos.traducir(e)
+    if traducida is e:
+        raise  # sin plazo: `from e` la haría su propia causa
+    raise traducida from e
+
+
+class CursorMedido(Cursor):
+    """Cursor que suma a la petición en curso el tiempo esperando a la base.
+
+    También respeta el plazo de la petición (plazos.py): no envía sentencias
+    con el plazo vencido y convierte la cancelación en `PlazoVencido`.
+    """
+
+    def execute(self, *args, **kwargs):
+        plazos.verificar()
+        t0 = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        except (errors.QueryCanceled, errors.LockNotAvailable) as e:
+            _relanzar(e)
+        finally:
+            metricas.sumar_db(time.perf_counter() - t0)
+
+    def executemany(self, *args, **kwargs):
+        plazos.verificar()
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(*args, **kwargs)
+        except (errors.QueryCanceled, errors.LockNotAvailable) as e:
+            _relanzar(e)
+        finally:
+            metricas.sumar_db(time.perf_counter() - t0)
+
+    # En modo pipeline la espera ocurre al leer los resultados
+    def fetchone(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchone()
+        except (errors.QueryCanceled, errors.LockNotAvailable) as e:
+            _relanzar(e)
+        finally:
+            metricas.sumar_db(time.perf_counter() - t0)
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchall()
+        except (errors.QueryCanceled, errors.LockNotAvailable) as e:
+            _relanzar(e)
+        finally:
+            metricas.sumar_db(time.perf_counter() - t0)
+
+
+class ConexionMedida(Connection):
+    # True si plazos.py le cambió statement_timeout/lock_timeout
+    con_plazo = False
+
+    def commit(self):
+        t0 = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            metricas.sumar_db(time.perf_counter() - t0)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Preparación extra para las conexiones de la petición en curso (diagnostico.py)
+_preparar: ContextVar[Optional[Callable]] = ContextVar("obt_preparar_conexion", default=None)
+
+
+def _restablecer(conn) -> None:
+    # Al volver al pool: los timeouts de un plazo no pasan a la siguiente petición
+    if conn.con_plazo:
+        conn.execute("RESET statement_timeout; RESET lock_timeout")
+        conn.commit()
+        conn.con_plazo = False
+
+
+def _crear_pool(dsn: str, nombre: str, **extra) -> ConnectionPool:
+    return ConnectionPool(
+        dsn,
+        connection_class=ConexionMedida,
+        kwargs={"cursor_factory": CursorMedido},
+        min_size=DB_POOL_MIN,
+        max_size=DB_POOL_MAX,
+        timeout=DB_POOL_TIMEOUT,
+        reset=_restablecer,
+        name=f"{nombre}-{os.getpid()}",
+        open=True,
+        **extra,
+    )
+
+
+def _obtener_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _crear_pool(DATABASE_URL, "obt")
+    return _pool
+
+
+def conectar():
+    """Conexión para `with conectar() as conn:`; sale del pool si DB_POOL=1.
+
+    En ambos casos el bloque hace commit al salir bien y rollback si hay
+    excepción; con pool la conexión se devuelve en vez de cerrarse. Si la
+    petición tiene plazo (plazos.py) la conexión lleva sus timeouts.
+    """
+    preparar = _preparar.get()
+    if preparar is not None or plazos.actual() is not None:
+        return _conexion_de_peticion(preparar)
+    if DB_POOL:
+        return _conexion_del_pool()
+    return conectar_directo()
+
+
+@contextmanager
+def _conexion_de_peticion(preparar: Optional[Callable]):
+    # Con `preparar`, conexión propia: lo que cambie en la sesión no vuelve al pool
+    origen = _conexion_del_pool() if DB_POOL and preparar is None else conectar_directo()
+    with origen as conn:
+        if preparar is not None:
+            preparar(conn)
+        with plazos.vigilar(conn):
+            yield conn
+
+
+@contextmanager
+def _conexion_del_pool():
+    # La espera por una conexión libre es la señal de saturación del pool
+    t0 = time.perf_counter()
+    with _obtener_pool().connection() as conn:
+        metricas.sumar_pool(time.perf_counter() - t0)
+        yield conn
+
+
+def conectar_directo():
+    """Conexión propia fuera del pool (p. ej. para un LISTEN permanente)."""
+    return ConexionMedida.connect(DATABASE_URL, cursor_factory=CursorMedido)
+
+
+# ------------------------------------------------------------------
+# Réplica de lectura
+# ------------------------------------------------------------------
+_pool_replica = None
+_escrituras: dict = {}  # empresa -> monotonic de su última escritura
+_retraso_replica = 0.0
+_retraso_medido_en = float("-inf")
+
+_SQL_RETRASO = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def marcar_escritura(empresa: str) -> None:
+    """La empresa acaba de escribir: sus lecturas van al primario un rato."""
+    _escrituras[empresa] = time.monotonic()
+
+
+def usar_replica(empresa: Optional[str] = None) -> bool:
+    """True si una lectura (de `empresa`, si se indica) puede ir a la réplica."""
+    if not DATABASE_URL_REPLICA or _preparar.get() is not None:
+        return False
+    escrita = _escrituras.get(empresa) if empresa else None
+    if escrita is not None and time.monotonic() - escrita <= max(REPLICA_VENTANA_SEG, _retraso_replica):
+        return False
+    # Atrasada: se vuelve a probar cuando toque medir otra vez
+    return (_retraso_replica <= REPLICA_RETRASO_MAX
+            or time.monotonic() - _retraso_medido_en >= REPLICA_MEDIR_CADA)
+
+
+def conectar_lectura(empresa: Optional[str] = None):
+    """Como `conectar()`, para bloques que solo leen.
+
+    Usa la réplica (`DATABASE_URL_REPLICA`) salvo que no haya, que esté
+    atrasada o que `empresa` haya escrito hace menos de
+    `DB_REPLICA_VENTANA_SEG`; en esos casos, y si la réplica no responde,
+    devuelve una conexión al primario.
+    """
+    if not usar_replica(empresa):
+        return conectar()
+    return _conexion_replica(empresa)
+
+
+@contextmanager
+def _conexion_replica(empresa: Optional[str]):
+    with ExitStack() as pila:
+        with ExitStack() as replica:
+            try:
+                conn = replica.enter_context(_abrir_replica())
+            except (OperationalError, PoolTimeout) as e:
+                log.warning("réplica no disponible, se lee del primario", extra={"error": str(e)})
+                _marcar_caida()
+            else:
+                _medir_retraso(conn)
+                if _retraso_replica <= REPLICA_RETRASO_MAX:
+                    pila.push(replica.pop_all())
+                    pila.enter_context(plazos.vigilar(conn))
+                    yield conn
+                    return
+        # Sin réplica o demasiado atrasada: la réplica ya se devolvió
+        yield pila.enter_context(conectar())
+
+
+def _abrir_replica():
+    if DB_POOL:
+        return _obtener_pool_replica().connection(timeout=REPLICA_TIMEOUT)
+    conn = ConexionMedida.connect(DATABASE_URL_REPLICA, cursor_factory=CursorMedido,
+                                  connect_timeout=max(int(REPLICA_TIMEOUT), 1))
+    conn.read_only = True
+    return conn
+
+
+def _solo_lectura(conn) -> None:
+    conn.read_only = True
+
+
+def _obtener_pool_replica() -> ConnectionPool:
+    global _pool_replica
+    if _pool_replica is None:
+        with _pool_lock:
+            if _pool_replica is None:
+                _pool_replica = _crear_pool(DATABASE_URL_REPLICA, "obt-replica", configure=_solo_lectura)
+    return _pool_replica
+
+
+def _medir_retraso(conn) -> None:
+    # Como mucho cada REPLICA_MEDIR_CADA segundos, en la conexión ya abierta
+    global _retraso_replica, _retraso_medido_en
+    ahora = time.monotonic()
+    if ahora - _retraso_medido_en < REPLICA_MEDIR_CADA:
+        return
+    _retraso_medido_en = ahora
+    try:
+        _retraso_replica = float(conn.execute(_SQL_RETRASO).fetchone()[0])
+        conn.rollback()
+    except OperationalError as e:
+        log.warning("no se pudo medir el retraso de la réplica", extra={"error": str(e)})
+
+
+def _marcar_caida() -> None:
+    # Como si estuviera atrasada: no se vuelve a intentar hasta la próxima medición
+    global _retraso_replica, _retraso_medido_en
+    _retraso_replica = float("inf")
+    _retraso_medido_en = time.monotonic()
+
+
+def _gauges_replica():
+    if not DATABASE_URL_REPLICA:
+        return {}
+    return {"obt_db_replica_retraso_seconds": ("Retraso medido de la réplica de lectura", _retraso_replica)}
+
+
+metricas.registrar_gauges(_gauges_replica)
+
+
+def preparar_conexiones(preparar: Callable):
+    """Hace que los `conectar()` siguientes de esta petición pasen por `preparar`."""
+    return _preparar.set(preparar)
+
+
+def restaurar_conexiones(token) -> None:
+    _preparar.reset(token)
+
+
+def estadisticas_pool() -> dict:
+    """Contadores de psycopg_pool del proceso (vacío si no hay pool abierto)."""
+    return _pool.get_stats() if _pool is not None else {}
+
+
+def cerrar_pool() -> None:
+    """Cierra los pools; el próximo `conectar()` abre uno nuevo."""
+    global _pool, _pool_replica
+    with _pool_lock:
+        for pool in (_pool, _pool_replica):
+            if pool is not None:
+                pool.close()
+        _pool = _pool_replica = None
+
+
+def reiniciar_pool_tras_fork() -> None:
+    """En el hijo se descarta la referencia heredada sin tocar sus sockets."""
+    global _pool, _pool_replica, _pool_lock, _escrituras
+    _pool = _pool_replica = None
+    _pool_lock = threading.Lock()
+    _escrituras = {}
+
+
+def _leer_json(cur) -> list:
+    # Único decodificador del resultado de un `SELECT fn(...)` que devuelve JSON
+    fila = cur.fetchone()
+    raw = fila[0] if fila else None
+    if isinstance(raw, (str, bytes)):
+        raw = _json_loads(raw)
+    return raw or []
+
+
+def _leer_filas(cur) -> list:
+    columnas = [d.name for d in cur.description]
+    return [dict(zip(columnas, fila)) for fila in cur.fetchall()]
+
+
+def consultar_json(cur, funcion: str, *args) -> list:
+    """Ejecuta `SELECT funcion(args)` y devuelve el JSON ya decodificado."""
+    marcadores = ", ".join(["%s"] * len(args))
+    cur.execute(f"SELECT {funcion}({marcadores});", args)
+    return _leer_json(cur)
+
+
+def consultar_filas(cur, sql: str, params=()) -> list:
+    """Ejecuta `sql` y devuelve las filas como dicts con sus tipos nativos."""
+    cur.execute(sql, params)
+    return _leer_filas(cur)
+
+
+def _por_filas(funcion: str) -> bool:
+    return LECTURA_FILAS and funcion in CONSULTAS_FILAS
+
+
+def _enviar_lectura(cur, funcion: str, empresa: str) -> None:
+    if _por_filas(funcion):
+        cur.execute(CONSULTAS_FILAS[funcion], (empresa,))
+    else:
+        cur.execute(f"SELECT {funcion}(%s);", (empresa,))
+
+
+def _recibir_lectura(cur, funcion: str) -> list:
+    return _leer_filas(cur) if _por_filas(funcion) else _leer_json(cur)
+
+
+def obtener_datos(cur, funcion: str, empresa: str) -> list:
+    """Datos de un fn_obtener_* por empresa, como filas o como JSON según LECTURA_FILAS."""
+    _enviar_lectura(cur, funcion, empresa)
+    return _recibir_lectura(cur, funcion)
+
+
+def obtener_varios(conn, empresa: str, *funciones: str) -> list:
+    """Como `obtener_datos` para varias funciones, enviadas juntas en modo pipeline.
+
+    Con pipeline todas las consultas salen en un solo viaje de red; si la
+    libpq no lo soporta se ejecutan una tras otra en la misma conexión.
+    """
+    if not Pipeline.is_supported():
+        with conn.cursor() as cur:
+            return [obtener_datos(cur, f, empresa) for f in funciones]
 
+    cursores = [conn.cursor() for _ in funciones]
+    try:
+        with conn.pipeline():
+            for cur, funcion in zip(cursores, funciones):
+                _enviar_lectura(cur, funcion, empresa)
+        return [_recibir_lectura(cur, f) for cur, f in zip(cursores, funciones)]
+    finally:
+        for cur in cursores:
+            cur.close()
@@ -0,0 +1,348 @@
+"""Diagnóstico SQL de una petición pesada: planes de auto_explain y deltas de
+pg_stat_statements, guardados con el `run_id` en la tabla `diagnosticos`.
+
+Solo para administración. Una petición de `admision.ENDPOINTS_PESADOS` se
+diagnostica si:
+
+- la envía un administrador con la cabecera `X-Diagnostico` (`explain`,
+  `stats` o `explain,stats`), o
+- un administrador dejó armado un diagnóstico para la empresa desde /admin:
+  lo consume la siguiente petición pesada de esa empresa.
+
+Modos:
+
+- `explain`: la petición usa conexiones propias (fuera del pool) con
+  `auto_explain` en la sesión (`log_analyze`, `log_buffers`, sentencias
+  anidadas, formato JSON). Los planes llegan como NOTICE, incluidos los de
+  las sentencias dentro de los SP.
+- `stats`: diferencia de `pg_stat_statements` antes y después de la
+  petición, por sentencia. Con `pg_stat_statements.track = all` se ven las
+  sentencias internas de los SP. La diferencia incluye lo que ejecuten otras
+  peticiones al mismo tiempo: conviene usarlo en horas tranquilas.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from flask import g, request, session
+from psycopg.types.json import Jsonb
+
+import db
+from admision import ENDPOINTS_PESADOS
+from registro import get_logger, run_id_actual
+
+log = get_logger(__name__)
+
+MODOS = ("explain", "stats")
+CABECERA = "X-Diagnostico"
+MAX_PLANES = int(os.getenv("DIAGNOSTICO_MAX_PLANES", "300"))
+MAX_SENTENCIAS = int(os.getenv("DIAGNOSTICO_MAX_SENTENCIAS", "100"))
+# Cada cuánto cada proceso revisa si hay diagnósticos armados
+PENDIENTES_TTL_SEG = float(os.getenv("DIAGNOSTICO_PENDIENTES_TTL", "10"))
+
+_AUTO_EXPLAIN = (
+    "LOAD 'auto_explain'",
+    "SET auto_explain.log_min_duration = 0",
+    "SET auto_explain.log_analyze = on",
+    "SET auto_explain.log_buffers = on",
+    "SET auto_explain.log_nested_statements = on",
+    "SET auto_explain.log_format = 'json'",
+    "SET auto_explain.log_level = 'notice'",
+)
+
+_SQL_STATS = """
+    SELECT queryid, query, calls, total_exec_time, rows,
+           shared_blks_hit, shared_blks_read, temp_blks_written
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+      AND query NOT ILIKE '%%pg_stat_statements%%'
+"""
+
+_PLAN_RE = re.compile(r"duration:\s*([\d.]+)\s*ms\s+plan:\s*(.*)", re.S)
+
+
+class Captura:
+    """Lo recolectado durante una petición diagnosticada."""
+
+    def __init__(self, diag_id: int, modos: Tuple[str, ...]):
+        self.id = diag_id
+        self.modos = modos
+        self.t0 = time.perf_counter()
+        self.planes: List[Dict[str, Any]] = []
+        self.errores: List[str] = []
+        self.stats_antes: Dict[int, tuple] = {}
+        self.token = None
+
+    # --- auto_explain ----------------------------------------------
+    def preparar(self, conn) -> None:
+        """Activa auto_explain en una conexión nueva y escucha sus NOTICE."""
+        try:
+            for sentencia in _AUTO_EXPLAIN:
+                conn.execute(sentencia)
+            conn.commit()  # un SET dentro de una transacción revertida se pierde
+        except Exception as e:
+            conn.rollback()
+            self._error(f"auto_explain no disponible: {e}")
+            return
+        conn.add_notice_handler(self._aviso)
+
+    def _aviso(self, diag) -> None:
+        m = _PLAN_RE.match(diag.message_primary or "")
+        if not m or len(self.planes) >= MAX_PLANES:
+            return
+        try:
+            plan = json.loads(m.group(2))
+        except ValueError:
+            plan = {"texto": m.group(2)}
+        self.planes.append({
+            "duracion_ms": float(m.group(1)),
+            "consulta": (plan.get("Query Text") or "").strip(),
+            "plan": plan.get("Plan", plan),
+        })
+
+    # --- pg_stat_statements ---------------------------------------
+    def tomar_stats(self) -> Dict[int, tuple]:
+        try:
+            with db.conectar_directo() as conn:
+                filas = conn.execute(_SQL_STATS).fetchall()
+        except Exception as e:
+            self._error(f"pg_stat_statements no disponible: {e}")
+            return {}
+        acumulado: Dict[int, list] = {}
+        # Una misma sentencia puede aparecer como toplevel y anidada: se suman
+        for queryid, query, *valores in filas:
+            previo = acumulado.setdefault(queryid, [query, 0, 0.0, 0, 0, 0, 0])
+            for i, v in enumerate(valores, start=1):
+                previo[i] += v or 0
+        return {k: tuple(v) for k, v in acumulado.items()}
+
+    def deltas_stats(self) -> List[Dict[str, Any]]:
+        despues = self.tomar_stats()
+        sentencias = []
+        for queryid, (query, calls, total, filas, hit, read, temp) in despues.items():
+            _, calls0, total0, filas0, hit0, read0, temp0 = self.stats_antes.get(
+                queryid, (query, 0, 0.0, 0, 0, 0, 0)
+            )
+            if calls - calls0 <= 0:
+                continue
+            llamadas = calls - calls0
+            ms = total - total0
+            sentencias.append({
+                "queryid": queryid,
+                "consulta": query,
+                "llamadas": llamadas,
+                "total_ms": round(ms, 3),
+                "media_ms": round(ms / llamadas, 3),
+                "filas": filas - filas0,
+                "blks_hit": hit - hit0,
+                "blks_read": read - read0,
+                "temp_blks_written": temp - temp0,
+            })
+        sentencias.sort(key=lambda s: s["total_ms"], reverse=True)
+        return sentencias[:MAX_SENTENCIAS]
+
+    def _error(self, mensaje: str) -> None:
+        log.warning("diagnóstico incompleto", extra={"diagnostico_id": self.id, "error": mensaje})
+        self.errores.append(mensaje)
+
+
+def _modos(valor: str) -> Tuple[str, ...]:
+    return tuple(m for m in MODOS if m in (valor or "").lower())
+
+
+# ------------------------------------------------------------------
+# Tabla `diagnosticos`
+# ------------------------------------------------------------------
+_lock = threading.Lock()
+_pendientes: Tuple[float, FrozenSet[str]] = (float("-inf"), frozenset())
+
+
+def _hay_pendiente(bd: str) -> bool:
+    """¿Hay un diagnóstico armado para `bd`? Consulta la base como mucho
+    una vez cada `PENDIENTES_TTL_SEG` por proceso."""
+    global _pendientes
+    leido, empresas = _pendientes
+    if time.monotonic() - leido >= PENDIENTES_TTL_SEG:
+        with _lock:
+            leido, empresas = _pendientes
+            if time.monotonic() - leido >= PENDIENTES_TTL_SEG:
+                empresas = frozenset()
+                try:
+                    with db.conectar() as conn:
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT DISTINCT bd FROM diagnosticos WHERE estado = 'pendiente'")
+                            empresas = frozenset(fila[0] for fila in cur.fetchall())
+                finally:
+                    # Si la consulta falla tampoco se reintenta en cada petición
+                    _pendientes = (time.monotonic(), empresas)
+    return bd in empresas
+
+
+def _consumido(bd: str) -> None:
+    """Otra petición ya tomó el pendiente de `bd`: no se vuelve a buscar hasta el TTL."""
+    global _pendientes
+    with _lock:
+        leido, empresas = _pendientes
+        _pendientes = (leido, empresas - {bd})
+
+
+def armar(bd: str, modos: Tuple[str, ...], creado_por: str) -> int:
+    """Deja pendiente un diagnóstico para la próxima petición pesada de `bd`.
+
+    Los demás procesos lo ven en hasta `PENDIENTES_TTL_SEG`.
+    """
+    global _pendientes
+    with db.conectar() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO diagnosticos (bd, modo, estado, creado_por)
+                VALUES (%s, %s, 'pendiente', %s) RETURNING id
+                """,
+                (bd, ",".join(modos), creado_por),
+            )
+            diag_id = cur.fetchone()[0]
+    with _lock:
+        leido, empresas = _pendientes
+        _pendientes = (leido, empresas | {bd})
+    return diag_id
+
+
+def _iniciar(bd: str, endpoint: str, modos: Tuple[str, ...]) -> Optional[Tuple[int, Tuple[str, ...]]]:
+    """Consume el pendiente de la empresa o, con `modos`, crea uno en curso."""
+    with db.conectar() as conn:
+        with conn.cursor() as cur:
+            if modos:
+                cur.execute(
+                    """
+                    INSERT INTO diagnosticos (bd, modo, estado, creado_por, endpoint, run_id, iniciado_en)
+                    VALUES (%s, %s, 'en_curso', %s, %s, %s, NOW()) RETURNING id, modo
+                    """,
+                    (bd, ",".join(modos), session.get("email"), endpoint, run_id_actual()),
+                )
+            else:
+                cur.execute(
+                    """
+                    UPDATE diagnosticos
+                    SET estado = 'en_curso', endpoint = %s, run_id = %s, iniciado_en = NOW()
+                    WHERE id = (
+                        SELECT id FROM diagnosticos
+                        WHERE bd = %s AND estado = 'pendiente'
+                        ORDER BY id LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, modo
+                    """,
+                    (endpoint, run_id_actual(), bd),
+                )
+            fila = cur.fetchone()
+    return (fila[0], _modos(fila[1])) if fila else None
+
+
+def _terminar(captura: Captura, status: Optional[int], sentencias: Optional[List[Dict[str, Any]]]) -> None:
+    # Conexión aparte: la petición pudo terminar por su plazo (plazos.py)
+    with db.conectar_directo() as conn:
+        conn.execute(
+            """
+            UPDATE diagnosticos
+            SET estado = %s, status = %s, duracion_ms = %s, terminado_en = NOW(),
+                planes = %s, sentencias = %s, errores = %s
+            WHERE id = %s
+            """,
+            (
+                "completo" if not captura.errores else "con_errores",
+                status,
+                round((time.perf_counter() - captura.t0) * 1000, 1),
+                Jsonb(captura.planes) if "explain" in captura.modos else None,
+                Jsonb(sentencias) if sentencias is not None else None,
+                Jsonb(captura.errores),
+                captura.id,
+            ),
+        )
+
+
+def listar(limite: int = 30) -> List[Dict[str, Any]]:
+    with db.conectar() as conn:
+        with conn.cursor() as cur:
+            return db.consultar_filas(
+                cur,
+                """
+                SELECT id, bd, modo, estado, endpoint, run_id, creado_por, creado_en,
+                       duracion_ms, status,
+                       COALESCE(jsonb_array_length(planes), 0) AS n_planes,
+                       COALESCE(jsonb_array_length(sentencias), 0) AS n_sentencias
+                FROM diagnosticos ORDER BY id DESC LIMIT %s
+                """,
+                (limite,),
+            )
+
+
+def obtener(diag_id: int) -> Optional[Dict[str, Any]]:
+    with db.conectar() as conn:
+        with conn.cursor() as cur:
+            filas = db.consultar_filas(cur, "SELECT * FROM diagnosticos WHERE id = %s", (diag_id,))
+    return filas[0] if filas else None
+
+
+# ------------------------------------------------------------------
+# Integración con Flask
+# ------------------------------------------------------------------
+def _antes() -> None:
+    if request.method != "POST" or request.endpoint not in ENDPOINTS_PESADOS:
+        return
+    bd = session.get("empresa")
+    if not bd:
+        return
+    modos = _modos(request.headers.get(CABECERA, "")) if session.get("is_admin") else ()
+    try:
+        # Sin cabecera ni pendiente armado la petición no toca `diagnosticos`
+        if not modos and not _hay_pendiente(bd):
+            return
+        inicio = _iniciar(bd, request.endpoint, modos)
+    except Exception as e:
+        # Sin la tabla (o sin base) la petición sigue sin diagnóstico
+        log.warning("no se pudo iniciar el diagnóstico", extra={"error": str(e)})
+        return
+    if inicio is None:
+        _consumido(bd)
+        return
+
+    captura = Captura(*inicio)
+    if "stats" in captura.modos:
+        captura.stats_antes = captura.tomar_stats()
+    if "explain" in captura.modos:
+        captura.token = db.preparar_conexiones(captura.preparar)
+    g.diagnostico = captura
+    log.info("diagnóstico SQL", extra={"diagnostico_id": captura.id, "modo": ",".join(captura.modos)})
+
+
+def _despues(resp):
+    captura = g.get("diagnostico")
+    if captura is not None:
+        resp.headers["X-Diagnostico-Id"] = str(captura.id)
+        g.diagnostico_status = resp.status_code
+    return resp
+
+
+def _cerrar(_exc) -> None:
+    captura = g.pop("diagnostico", None)
+    if captura is None:
+        return
+    if captura.token is not None:
+        db.restaurar_conexiones(captura.token)
+    try:
+        sentencias = captura.deltas_stats() if "stats" in captura.modos else None
+        _terminar(captura, g.get("diagnostico_status", 500), sentencias)
+    except Exception:
+        log.exception("no se pudo guardar el diagnóstico", extra={"diagnostico_id": captura.id})
+
+
+def init_app(app) -> None:
+    """Registra la captura de diagnósticos en los endpoints pesados."""
+    app.before_request(_antes)
+    app.after_request(_despues)
+    app.teardown_request(_cerrar)
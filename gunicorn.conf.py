@@ -0,0 +1,123 @@
+"""Configuración de gunicorn para producción: `gunicorn app:app`.
+
+Todo se controla con variables de entorno. `GUNICORN_PERFIL` elige un
+punto de partida y cada valor se puede sobrescribir por separado:
+
+- `mixto` (por defecto): workers gthread, uno por CPU, con 4 hilos. Los
+  hilos cubren las esperas largas (SP de Postgres, Playwright) y los
+  procesos reparten el trabajo de CPU (pandas/openpyxl), que no escala con
+  hilos por el GIL.
+- `cpu`: workers sync, 2 × CPU + 1, para servidores que sobre todo generan
+  Excel/ZIP.
+- `io`: pocos procesos con muchos hilos, para instancias pequeñas donde casi
+  todo es espera de base de datos o del portal.
+
+Los números de cada perfil salen de `benchmarks/comparar_presets.py`
+(ver GUNICORN.md); conviene repetir la medición al cambiar de servidor.
+"""
+
+import importlib
+import multiprocessing
+import os
+import resource
+import time
+
+_CPU = multiprocessing.cpu_count()
+
+PERFILES = {
+    "mixto": {"worker_class": "gthread", "workers": max(2, _CPU), "threads": 4},
+    "cpu": {"worker_class": "sync", "workers": 2 * _CPU + 1, "threads": 1},
+    "io": {"worker_class": "gthread", "workers": 2, "threads": 16},
+}
+
+perfil = PERFILES[os.getenv("GUNICORN_PERFIL", "mixto")]
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", perfil["worker_class"])
+workers = int(os.getenv("GUNICORN_WORKERS", perfil["workers"]))
+threads = int(os.getenv("GUNICORN_THREADS", perfil["threads"]))
+
+# Los SP masivos y la carga al portal pueden pasar de un minuto
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "60"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# pandas/openpyxl no devuelven toda la memoria al SO: se recicla el worker
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "500"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "50"))
+
+# La app se carga una vez en el master y se comparte por copy-on-write; lo
+# que no sobrevive al fork se rehace en post_fork
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# pandas/openpyxl/playwright se importan al primer uso (arranque rápido y
+# workers livianos). Si casi todos los workers terminan usándolos, listarlos
+# aquí los carga una vez en el master para compartirlos: "pandas,openpyxl"
+PRECARGAR = [m for m in os.getenv("GUNICORN_PRECARGAR", "").split(",") if m.strip()]
+
+# Cada cuántas peticiones un worker registra sus estadísticas
+STATS_CADA = int(os.getenv("GUNICORN_STATS_CADA", "100"))
+
+accesslog = None  # el acceso lo registra registro.py en JSON
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
+
+
+def _log():
+    from registro import get_logger
+
+    return get_logger("gunicorn")
+
+
+def _estadisticas(worker) -> dict:
+    import db
+
+    return {
+        "pid": worker.pid,
+        "peticiones": getattr(worker, "obt_peticiones", 0),
+        "vida_seg": round(time.monotonic() - getattr(worker, "obt_inicio", time.monotonic()), 1),
+        "maxrss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "pool": db.estadisticas_pool(),
+    }
+
+
+def when_ready(server):
+    # Ninguna conexión abierta en el master debe heredarse a los workers
+    if preload_app:
+        import db
+
+        db.cerrar_pool()
+        for modulo in PRECARGAR:
+            importlib.import_module(modulo.strip())
+    _log().info("gunicorn listo", extra={
+        "worker_class": worker_class, "workers": workers, "threads": threads,
+        "timeout": timeout, "max_requests": max_requests, "preload": preload_app,
+        "precargados": PRECARGAR if preload_app else [],
+    })
+
+
+def post_fork(server, worker):
+    import db
+    import metricas
+    import registro
+
+    db.reiniciar_pool_tras_fork()
+    registro.reiniciar_tras_fork()
+    metricas.reiniciar_tras_fork()
+    worker.obt_inicio = time.monotonic()
+    worker.obt_peticiones = 0
+
+
+def post_request(worker, req, environ, resp):
+    worker.obt_peticiones = getattr(worker, "obt_peticiones", 0) + 1
+    if STATS_CADA and worker.obt_peticiones % STATS_CADA == 0:
+        _log().info("estadísticas del worker", extra=_estadisticas(worker))
+
+
+def worker_exit(server, worker):
+    _log().info("worker terminado", extra=_estadisticas(worker))
+    import db
+    import registro
+
+    db.cerrar_pool()
+    registro.detener()
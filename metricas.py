@@ -0,0 +1,338 @@
+"""Métricas por endpoint, spans y perfilado opcional de peticiones.
+
+`init_app(app)` registra los hooks de Flask y el endpoint `/metrics` en
+formato de texto de Prometheus. Por cada petición se mide la latencia, los
+bytes de entrada/salida, el aumento del pico de RSS y el tiempo pasado en
+la base (acumulado por el cursor de `db.conectar`). Los bloques marcados
+con `span(...)` se anidan y salen también en la cabecera `Server-Timing`.
+
+Los valores son del proceso: con varios workers cada uno expone los suyos
+(la etiqueta `pid` permite sumarlos).
+"""
+
+import bisect
+import cProfile
+import hmac
+import os
+import resource
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import Response, g, request, session
+
+try:
+    from pyinstrument import Profiler as _Pyinstrument
+except ImportError:  # pragma: no cover - pyinstrument es opcional
+    _Pyinstrument = None
+
+# Límites (segundos) de los histogramas de latencia
+BUCKETS_SEG = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Límites (bytes) de los histogramas de tamaño
+BUCKETS_BYTES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Sin token, /metrics solo responde a peticiones directas desde el mismo host
+_LOCALES = ("127.0.0.1", "::1")
+PERFIL_DIR = os.getenv("PERFIL_DIR", os.path.join(tempfile.gettempdir(), "obt_perfiles"))
+CABECERA_PERFIL = "X-Perfil"
+
+_PID = str(os.getpid())
+
+
+class Histograma:
+    """Histograma acumulado al estilo Prometheus (buckets + suma + conteo)."""
+
+    __slots__ = ("buckets", "conteos", "suma", "total")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.conteos = [0] * (len(buckets) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float) -> None:
+        self.conteos[bisect.bisect_left(self.buckets, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+
+_lock = threading.Lock()
+# nombre -> (ayuda, buckets, {etiquetas: Histograma})
+_histogramas: Dict[str, Tuple[str, Tuple[float, ...], Dict[Tuple[Tuple[str, str], ...], Histograma]]] = {}
+
+
+def definir(nombre: str, ayuda: str, buckets: Tuple[float, ...]) -> None:
+    """Declara un histograma; otros módulos pueden agregar los suyos."""
+    _histogramas[nombre] = (ayuda, buckets, {})
+
+
+definir("obt_request_duration_seconds", "Latencia de la petición por endpoint", BUCKETS_SEG)
+definir("obt_request_db_seconds", "Tiempo en la base de datos por petición", BUCKETS_SEG)
+definir("obt_request_pool_wait_seconds", "Espera por una conexión libre del pool por petición", BUCKETS_SEG)
+definir("obt_request_size_bytes", "Tamaño del cuerpo de la petición", BUCKETS_BYTES)
+definir("obt_response_size_bytes", "Tamaño de la respuesta", BUCKETS_BYTES)
+definir("obt_request_maxrss_delta_bytes", "Aumento del pico de RSS del proceso durante la petición", BUCKETS_BYTES)
+definir("obt_span_duration_seconds", "Duración de los bloques marcados con span()", BUCKETS_SEG)
+
+
+def observar(nombre: str, valor: float, **etiquetas: str) -> None:
+    """Registra `valor` en el histograma `nombre` con las etiquetas dadas."""
+    _, buckets, series = _histogramas[nombre]
+    clave = tuple(sorted(etiquetas.items()))
+    with _lock:
+        h = series.get(clave)
+        if h is None:
+            h = series[clave] = Histograma(buckets)
+        h.observar(valor)
+
+
+# ------------------------------------------------------------------
+# Contexto de la petición: tiempo de base de datos y spans
+# ------------------------------------------------------------------
+class _Traza:
+    __slots__ = ("db_seg", "pool_seg", "spans", "pila")
+
+    def __init__(self):
+        self.db_seg = 0.0
+        self.pool_seg = 0.0
+        self.spans: List[Tuple[str, float]] = []
+        self.pila: List[str] = []
+
+
+_traza: ContextVar[Optional[_Traza]] = ContextVar("obt_traza", default=None)
+
+
+def sumar_db(segundos: float) -> None:
+    """Lo llama el cursor de `db.py` después de cada operación."""
+    traza = _traza.get()
+    if traza is not None:
+        traza.db_seg += segundos
+
+
+def sumar_pool(segundos: float) -> None:
+    """Lo llama `db.conectar` tras esperar una conexión del pool."""
+    traza = _traza.get()
+    if traza is not None:
+        traza.pool_seg += segundos
+
+
+@contextmanager
+def span(nombre: str):
+    """Mide un bloque; los spans anidados quedan como `padre.hijo`."""
+    traza = _traza.get()
+    ruta = ".".join([*traza.pila, nombre]) if traza else nombre
+    if traza:
+        traza.pila.append(nombre)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dur = time.perf_counter() - t0
+        if traza:
+            traza.pila.pop()
+            traza.spans.append((ruta, dur))
+        observar("obt_span_duration_seconds", dur, span=ruta)
+
+
+def spans_actuales() -> List[Tuple[str, float]]:
+    """Spans cerrados en la petición en curso, en orden de finalización."""
+    traza = _traza.get()
+    return list(traza.spans) if traza else []
+
+
+# ------------------------------------------------------------------
+# Hooks de Flask
+# ------------------------------------------------------------------
+def _maxrss_bytes() -> int:
+    # En Linux ru_maxrss viene en KiB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _es_admin() -> bool:
+    return bool(session.get("is_admin"))
+
+
+def _iniciar_perfil() -> None:
+    modo = request.headers.get(CABECERA_PERFIL, "").lower()
+    if not modo or not _es_admin():
+        return
+    if modo == "pyinstrument" and _Pyinstrument is not None:
+        perfil = _Pyinstrument()
+        perfil.start()
+        g.obt_perfil = ("pyinstrument", perfil)
+    else:
+        perfil = cProfile.Profile()
+        perfil.enable()
+        g.obt_perfil = ("cprofile", perfil)
+
+
+def _cerrar_perfil(resp: Response) -> None:
+    tipo, perfil = g.pop("obt_perfil", (None, None))
+    if perfil is None:
+        return
+    os.makedirs(PERFIL_DIR, exist_ok=True)
+    base = os.path.join(
+        PERFIL_DIR, f"{request.endpoint or 'desconocido'}_{int(time.time() * 1000)}_{_PID}"
+    )
+    if tipo == "pyinstrument":
+        perfil.stop()
+        archivo = base + ".html"
+        with open(archivo, "w", encoding="utf-8") as fh:
+            fh.write(perfil.output_html())
+    else:
+        perfil.disable()
+        archivo = base + ".prof"
+        perfil.dump_stats(archivo)
+    resp.headers["X-Perfil-Archivo"] = archivo
+
+
+def _antes() -> None:
+    g.obt_t0 = time.perf_counter()
+    g.obt_rss0 = _maxrss_bytes()
+    g.obt_token = _traza.set(_Traza())
+    _iniciar_perfil()
+
+
+def _medir_respuesta(resp: Response, etiquetas: Dict[str, str]) -> None:
+    tam = resp.content_length
+    if tam is None:
+        tam = resp.calculate_content_length()
+    if tam is not None or not resp.is_streamed:
+        observar("obt_response_size_bytes", tam or 0, **etiquetas)
+        return
+    # send_file y los generadores no traen largo: se cuenta al enviarlos
+    cuerpo = resp.response
+    enviados = [0]
+
+    def _contar():
+        for trozo in cuerpo:
+            enviados[0] += len(trozo)
+            yield trozo
+
+    resp.response = _contar()
+    if hasattr(cuerpo, "close"):
+        resp.call_on_close(cuerpo.close)
+    resp.call_on_close(lambda: observar("obt_response_size_bytes", enviados[0], **etiquetas))
+
+
+def _despues(resp: Response) -> Response:
+    if "obt_t0" not in g:
+        return resp
+    _cerrar_perfil(resp)
+    dur = time.perf_counter() - g.obt_t0
+    traza = _traza.get()
+    endpoint = request.endpoint or "desconocido"
+    etiquetas = {"endpoint": endpoint, "metodo": request.method, "pid": _PID}
+
+    observar("obt_request_duration_seconds", dur, status=str(resp.status_code), **etiquetas)
+    observar("obt_request_db_seconds", traza.db_seg if traza else 0.0, **etiquetas)
+    if traza and traza.pool_seg:
+        observar("obt_request_pool_wait_seconds", traza.pool_seg, **etiquetas)
+    observar("obt_request_size_bytes", request.content_length or 0, **etiquetas)
+    _medir_respuesta(resp, etiquetas)
+    observar("obt_request_maxrss_delta_bytes", max(_maxrss_bytes() - g.obt_rss0, 0), **etiquetas)
+
+    if traza and endpoint != "metricas":
+        tiempos = [("total", dur), ("db", traza.db_seg), *traza.spans]
+        if traza.pool_seg:
+            tiempos.insert(2, ("pool", traza.pool_seg))
+        resp.headers["Server-Timing"] = ", ".join(
+            f"{nombre};dur={seg * 1000:.1f}" for nombre, seg in tiempos
+        )
+    return resp
+
+
+def _limpiar(_exc) -> None:
+    token = g.pop("obt_token", None)
+    if token is not None:
+        _traza.reset(token)
+
+
+def _exponer() -> str:
+    lineas: List[str] = []
+    with _lock:
+        for nombre, (ayuda, buckets, series) in _histogramas.items():
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} histogram")
+            for clave, h in series.items():
+                etiquetas = ",".join(f'{k}="{v}"' for k, v in clave)
+                sep = "," if etiquetas else ""
+                acumulado = 0
+                for limite, n in zip([*buckets, "+Inf"], h.conteos):
+                    acumulado += n
+                    lineas.append(f'{nombre}_bucket{{{etiquetas}{sep}le="{limite}"}} {acumulado}')
+                lineas.append(f"{nombre}_sum{{{etiquetas}}} {h.suma}")
+                lineas.append(f"{nombre}_count{{{etiquetas}}} {h.total}")
+    for fuente in _fuentes_gauges:
+        for nombre, (ayuda, valor) in fuente().items():
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} gauge")
+            lineas.append(f'{nombre}{{pid="{_PID}"}} {valor}')
+    return "\n".join(lineas) + "\n"
+
+
+# Funciones que devuelven {nombre: (ayuda, valor)} al leer /metrics
+_fuentes_gauges: List[Callable[[], Dict[str, Tuple[str, float]]]] = []
+
+
+def registrar_gauges(fuente: Callable[[], Dict[str, Tuple[str, float]]]) -> None:
+    """Agrega valores instantáneos del proceso (p. ej. colas) a /metrics."""
+    _fuentes_gauges.append(fuente)
+
+
+# Contadores de psycopg_pool que se exponen como gauges
+_ESTADISTICAS_POOL = ("pool_size", "pool_available", "pool_max", "requests_waiting",
+                      "requests_num", "requests_queued", "requests_wait_ms", "requests_errors")
+
+
+def _gauges_pool() -> Dict[str, Tuple[str, float]]:
+    import db  # db importa este módulo
+
+    stats = db.estadisticas_pool()
+    if not stats:
+        return {}
+    # psycopg_pool omite los contadores que están en cero
+    return {f"obt_db_{clave}": (f"psycopg_pool: {clave}", stats.get(clave, 0))
+            for clave in _ESTADISTICAS_POOL}
+
+
+registrar_gauges(_gauges_pool)
+
+
+def _es_local() -> bool:
+    # Lo que llega por un proxy del mismo host trae X-Forwarded-For y no cuenta
+    return (request.remote_addr in _LOCALES
+            and "X-Forwarded-For" not in request.headers
+            and "Forwarded" not in request.headers)
+
+
+def metricas_view():
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+            return Response("no autorizado\n", status=401, mimetype="text/plain")
+    elif not _es_local():
+        return Response("definir METRICS_TOKEN para leer /metrics desde fuera del host\n",
+                        status=403, mimetype="text/plain")
+    return Response(_exponer(), mimetype="text/plain; version=0.0.4")
+
+
+def reiniciar_tras_fork() -> None:
+    """En cada worker: su propio `pid` y contadores desde cero."""
+    global _PID, _lock
+    _PID = str(os.getpid())
+    _lock = threading.Lock()
+    with _lock:
+        for _, _, series in _histogramas.values():
+            series.clear()
+
+
+def init_app(app) -> None:
+    """Registra los hooks de medición y el endpoint `/metrics`."""
+    app.before_request(_antes)
+    app.after_request(_despues)
+    app.teardown_request(_limpiar)
+    app.add_url_rule("/metrics", "metricas", metricas_view)
@@ -0,0 +1,163 @@
+"""Migraciones versionadas del esquema que crea la propia aplicación.
+
+Cada migración se aplica una sola vez y queda registrada en
+`schema_migraciones`. Se ejecutan al iniciar la app (`MIGRAR_AL_INICIAR=1`,
+por defecto) o a mano con `flask --app app migrar` / `python migraciones.py`,
+de modo que las rutas HTTP solo hacen consultas de datos.
+"""
+
+import os
+from typing import List, Tuple
+
+from db import conectar
+from registro import get_logger
+
+log = get_logger(__name__)
+
+# Evita que dos procesos (p. ej. workers de gunicorn) migren a la vez
+LLAVE_BLOQUEO = 72_034
+
+# (versión, nombre, SQL). Nunca editar una migración ya publicada: agregar otra.
+MIGRACIONES: List[Tuple[int, str, str]] = [
+    (
+        1,
+        "crear vehiculos",
+        """
+        CREATE TABLE IF NOT EXISTS vehiculos (
+            bd    TEXT NOT NULL,
+            ruta  INTEGER NOT NULL,
+            placa VARCHAR(17) NOT NULL DEFAULT '',
+            PRIMARY KEY (bd, ruta)
+        );
+        """,
+    ),
+    (
+        2,
+        "ampliar vehiculos.placa a 17 caracteres",
+        """
+        DO $$
+        BEGIN
+            IF (SELECT character_maximum_length
+                FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = 'vehiculos'
+                  AND column_name = 'placa') < 17 THEN
+                ALTER TABLE vehiculos ALTER COLUMN placa TYPE VARCHAR(17);
+            END IF;
+        END $$;
+        """,
+    ),
+    (
+        3,
+        "crear cargas_pedidos",
+        """
+        CREATE TABLE IF NOT EXISTS cargas_pedidos (
+            bd           TEXT PRIMARY KEY,
+            dia          VARCHAR(10) NOT NULL,
+            payload_hash CHAR(64) NOT NULL,
+            resumen_xlsx BYTEA NOT NULL,
+            cargado_en   TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        """,
+    ),
+    (
+        4,
+        "cargas_pedidos: índice de huellas para carga delta",
+        """
+        ALTER TABLE cargas_pedidos
+            ADD COLUMN IF NOT EXISTS rutas_hash CHAR(64),
+            ADD COLUMN IF NOT EXISTS huellas BYTEA;
+        """,
+    ),
+    (
+        5,
+        "crear diagnosticos",
+        """
+        CREATE TABLE IF NOT EXISTS diagnosticos (
+            id           BIGSERIAL PRIMARY KEY,
+            bd           TEXT NOT NULL,
+            modo         TEXT NOT NULL,
+            estado       TEXT NOT NULL DEFAULT 'pendiente',
+            creado_por   TEXT,
+            creado_en    TIMESTAMP NOT NULL DEFAULT NOW(),
+            endpoint     TEXT,
+            run_id       TEXT,
+            iniciado_en  TIMESTAMP,
+            terminado_en TIMESTAMP,
+            duracion_ms  DOUBLE PRECISION,
+            status       INTEGER,
+            planes       JSONB,
+            sentencias   JSONB,
+            errores      JSONB
+        );
+        CREATE INDEX IF NOT EXISTS diagnosticos_pendientes
+            ON diagnosticos (bd, id) WHERE estado = 'pendiente';
+        """,
+    ),
+    (
+        6,
+        "crear artefactos_rutas",
+        """
+        CREATE TABLE IF NOT EXISTS artefactos_rutas (
+            bd          TEXT NOT NULL,
+            ruta        INTEGER NOT NULL,
+            hash        CHAR(64) NOT NULL,
+            xlsx        BYTEA NOT NULL,
+            csv         BYTEA NOT NULL,
+            generado_en TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (bd, ruta)
+        );
+        """,
+    ),
+]
+
+
+def migrar() -> List[int]:
+    """Aplica las migraciones pendientes y devuelve las versiones aplicadas."""
+
+    aplicadas: List[int] = []
+    with conectar() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s);", (LLAVE_BLOQUEO,))
+            try:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS schema_migraciones (
+                        version     INTEGER PRIMARY KEY,
+                        nombre      TEXT NOT NULL,
+                        aplicada_en TIMESTAMP NOT NULL DEFAULT NOW()
+                    );
+                    """
+                )
+                cur.execute("SELECT version FROM schema_migraciones;")
+                hechas = {fila[0] for fila in cur.fetchall()}
+                conn.commit()
+
+                for version, nombre, sql in MIGRACIONES:
+                    if version in hechas:
+                        continue
+                    # Cada migración y su registro van en la misma transacción
+                    cur.execute(sql)
+                    cur.execute(
+                        "INSERT INTO schema_migraciones (version, nombre) VALUES (%s, %s);",
+                        (version, nombre),
+                    )
+                    conn.commit()
+                    aplicadas.append(version)
+                    log.info("migración aplicada", extra={"version": version, "nombre_migracion": nombre})
+            finally:
+                conn.rollback()
+                cur.execute("SELECT pg_advisory_unlock(%s);", (LLAVE_BLOQUEO,))
+                conn.commit()
+    return aplicadas
+
+
+def migrar_al_iniciar() -> None:
+    """Llamada desde app.py; se desactiva con MIGRAR_AL_INICIAR=0."""
+
+    if os.getenv("MIGRAR_AL_INICIAR", "1") == "1":
+        migrar()
+
+
+if __name__ == "__main__":
+    versiones = migrar()
+    print(f"Migraciones aplicadas: {versiones or 'ninguna'}")
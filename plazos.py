@@ -0,0 +1,266 @@
+"""Plazos por endpoint para las consultas a la base, con cancelación.
+
+Si `sp_etl_pedxrutaxprod_json` o la exportación de auditoría tardan más de
+lo que el cliente espera, el navegador se rinde pero la consulta seguía
+corriendo en Postgres y el worker quedaba ocupado. Para los endpoints de
+`PLAZOS`:
+
+- cada conexión de la petición recibe `statement_timeout` con el tiempo que
+  le queda a la petición y `lock_timeout` (`PLAZO_LOCK_TIMEOUT_MS`);
+- un hilo vigilante por proceso cancela en el servidor la consulta en curso
+  (`cancel_safe`) cuando vence el plazo o cuando el cliente cerró la conexión
+  (solo bajo gunicorn, que expone el socket en `gunicorn.socket`);
+- una sentencia nueva después del plazo ni siquiera se envía.
+
+En todos los casos la vista recibe `PlazoVencido` y la petición responde 504
+en JSON. Los plazos se cambian por variable de entorno:
+`PLAZO_<ENDPOINT>` en segundos, p. ej. `PLAZO_GENERAR_PEDIDOS_CARGAR_PEDIDOS=180`;
+0 desactiva el plazo de ese endpoint.
+"""
+
+import os
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from flask import g, jsonify, request
+from psycopg import errors
+
+from registro import get_logger
+
+log = get_logger(__name__)
+
+ACTIVOS = os.getenv("PLAZOS_ACTIVOS", "1") == "1"
+LOCK_TIMEOUT_MS = int(os.getenv("PLAZO_LOCK_TIMEOUT_MS", "5000"))
+VIGILANCIA_SEG = float(os.getenv("PLAZO_VIGILANCIA_SEG", "0.5"))
+CORTAR_SI_CLIENTE_SE_VA = os.getenv("PLAZO_CORTAR_SI_CLIENTE_SE_VA", "1") == "1"
+
+# Segundos por endpoint; por debajo del `timeout` de gunicorn (300 s)
+_PLAZOS_BASE = {
+    "upload.upload_index": 240,
+    "generar_pedidos.cargar_pedidos": 240,
+    "generar_pedidos.simular": 240,
+    "generar_pedidos.descargar_zip": 120,
+    "auditoria.descargar_excel": 120,
+}
+
+
+def _variable(endpoint: str) -> str:
+    return "PLAZO_" + endpoint.replace(".", "_").upper()
+
+
+PLAZOS = {
+    endpoint: float(os.getenv(_variable(endpoint), str(segundos)))
+    for endpoint, segundos in _PLAZOS_BASE.items()
+}
+
+
+class PlazoVencido(Exception):
+    """La consulta se canceló porque venció el plazo o el cliente se fue.
+
+    `motivo`: `plazo`, `cliente`, `statement_timeout` o `lock_timeout`.
+    """
+
+    def __init__(self, motivo: str, segundos: float):
+        self.motivo = motivo
+        self.segundos = segundos
+        super().__init__(f"La operación superó el tiempo máximo ({segundos:.0f} s, {motivo}).")
+
+
+class Plazo:
+    """Plazo de una petición y las conexiones que tiene abiertas."""
+
+    def __init__(self, segundos: float, sock: Optional[socket.socket]):
+        self.segundos = segundos
+        self.limite = time.monotonic() + segundos
+        self.socket = sock
+        self.motivo: Optional[str] = None
+        self._conexiones: set = set()
+        self._lock = threading.Lock()
+
+    def restante(self) -> float:
+        return self.limite - time.monotonic()
+
+    def verificar(self) -> None:
+        """Lanza `PlazoVencido` si ya no hay tiempo para otra sentencia."""
+        if self.motivo is None and self.restante() <= 0:
+            self.motivo = "plazo"
+        if self.motivo is not None:
+            raise PlazoVencido(self.motivo, self.segundos)
+
+    def registrar(self, conn) -> None:
+        with self._lock:
+            self._conexiones.add(conn)
+
+    def soltar(self, conn) -> None:
+        # Con el lock: no se suelta (ni vuelve al pool) a mitad de una cancelación
+        with self._lock:
+            self._conexiones.discard(conn)
+
+    def cancelar(self, motivo: str) -> None:
+        with self._lock:
+            if self.motivo is not None:
+                return
+            self.motivo = motivo
+            for conn in self._conexiones:
+                try:
+                    conn.cancel_safe(timeout=2.0)
+                except Exception as e:
+                    log.warning("no se pudo cancelar la consulta", extra={"error": str(e)})
+
+
+_actual: ContextVar[Optional[Plazo]] = ContextVar("obt_plazo", default=None)
+
+
+def actual() -> Optional[Plazo]:
+    """Plazo de la petición en curso (None si el endpoint no tiene)."""
+    return _actual.get()
+
+
+# ------------------------------------------------------------------
+# Integración con db.py
+# ------------------------------------------------------------------
+@contextmanager
+def vigilar(conn):
+    """Aplica los timeouts del plazo a `conn` y la deja cancelable."""
+    plazo = _actual.get()
+    if plazo is None:
+        yield conn
+        return
+    plazo.verificar()
+    # A nivel de sesión: los `commit` intermedios de las vistas no los borran;
+    # el `reset` del pool los deshace al devolver la conexión
+    conn.execute(
+        "SELECT set_config('statement_timeout', %s, false), set_config('lock_timeout', %s, false)",
+        (f"{max(int(plazo.restante() * 1000), 1)}ms", f"{LOCK_TIMEOUT_MS}ms"),
+    )
+    conn.con_plazo = True
+    plazo.registrar(conn)
+    try:
+        yield conn
+    finally:
+        plazo.soltar(conn)
+
+
+def verificar() -> None:
+    """Antes de enviar una sentencia: falla de una vez si el plazo venció."""
+    plazo = _actual.get()
+    if plazo is not None:
+        plazo.verificar()
+
+
+def traducir(exc: Exception) -> Exception:
+    """Convierte la cancelación de Postgres en `PlazoVencido` si hay plazo."""
+    plazo = _actual.get()
+    if plazo is None:
+        return exc
+    if isinstance(exc, errors.LockNotAvailable):
+        return PlazoVencido("lock_timeout", plazo.segundos)
+    if isinstance(exc, errors.QueryCanceled):
+        return PlazoVencido(plazo.motivo or "statement_timeout", plazo.segundos)
+    return exc
+
+
+def vencido_en(exc: BaseException) -> Optional[PlazoVencido]:
+    """Busca un `PlazoVencido` en la cadena de causas (pandas envuelve los errores)."""
+    vistas = set()
+    while exc is not None and id(exc) not in vistas:
+        if isinstance(exc, PlazoVencido):
+            return exc
+        vistas.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+# ------------------------------------------------------------------
+# Hilo vigilante
+# ------------------------------------------------------------------
+_vigentes: set = set()
+_vigentes_lock = threading.Lock()
+_hilo_pid: Optional[int] = None
+
+
+def _cliente_desconectado(sock: Optional[socket.socket]) -> bool:
+    if sock is None:
+        return False
+    try:
+        legible, _, _ = select.select([sock], [], [], 0)
+        # Legible y sin datos: el cliente cerró su lado de la conexión
+        return bool(legible) and sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+
+def _vigilar_plazos() -> None:
+    while True:
+        time.sleep(VIGILANCIA_SEG)
+        with _vigentes_lock:
+            vigentes = list(_vigentes)
+        ahora = time.monotonic()
+        for plazo in vigentes:
+            if plazo.motivo is not None:
+                continue
+            if ahora >= plazo.limite:
+                plazo.cancelar("plazo")
+            elif CORTAR_SI_CLIENTE_SE_VA and _cliente_desconectado(plazo.socket):
+                plazo.cancelar("cliente")
+
+
+def _asegurar_hilo() -> None:
+    # Tras el fork de gunicorn el hilo del maestro no existe en el worker
+    global _hilo_pid
+    if _hilo_pid == os.getpid():
+        return
+    with _vigentes_lock:
+        if _hilo_pid != os.getpid():
+            threading.Thread(target=_vigilar_plazos, name="obt-plazos", daemon=True).start()
+            _hilo_pid = os.getpid()
+
+
+# ------------------------------------------------------------------
+# Integración con Flask
+# ------------------------------------------------------------------
+def _antes() -> None:
+    segundos = PLAZOS.get(request.endpoint or "")
+    if not segundos:
+        return
+    plazo = Plazo(segundos, request.environ.get("gunicorn.socket"))
+    _asegurar_hilo()
+    with _vigentes_lock:
+        _vigentes.add(plazo)
+    g.plazo = plazo
+    g.plazo_token = _actual.set(plazo)
+
+
+def _limpiar(_exc) -> None:
+    plazo = g.pop("plazo", None)
+    if plazo is None:
+        return
+    with _vigentes_lock:
+        _vigentes.discard(plazo)
+    _actual.reset(g.pop("plazo_token"))
+
+
+def _respuesta_vencido(exc: PlazoVencido):
+    log.warning("plazo vencido", extra={"motivo": exc.motivo, "plazo": exc.segundos})
+    mensaje = (
+        "La operación tardó demasiado y se canceló. Intenta de nuevo en unos minutos; "
+        "si se repite, divide la carga."
+    )
+    resp = jsonify(success=False, estado="plazo_vencido", motivo=exc.motivo,
+                   error=mensaje, message=mensaje)
+    resp.status_code = 504
+    return resp
+
+
+def init_app(app) -> None:
+    """Activa los plazos de `PLAZOS` (PLAZOS_ACTIVOS=0 los desactiva)."""
+    app.register_error_handler(PlazoVencido, _respuesta_vencido)
+    if not ACTIVOS:
+        return
+    app.before_request(_antes)
+    app.teardown_request(_limpiar)
@@ -0,0 +1,215 @@
+"""Logging estructurado (JSON) y sin bloquear las peticiones.
+
+Los módulos piden su logger con `get_logger(__name__)` y pasan los datos
+como campos (`extra={...}`), no armados dentro del mensaje. Los registros
+van a una cola; un hilo (`QueueListener`) los serializa y escribe en stdout,
+así la petición no espera por el flush. A cada registro se le agregan
+`empresa`, `endpoint` y `run_id` de la petición en curso.
+
+`muestreado(...)` sirve para los payloads grandes: solo arma los datos en
+una fracción (`LOG_MUESTREO`) de las llamadas y si el nivel está activo.
+"""
+
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+from flask import g, has_request_context, request, session
+
+try:
+    import orjson
+
+    def _dumps(obj: Dict[str, Any]) -> str:
+        return orjson.dumps(obj, default=str).decode()
+except ImportError:  # pragma: no cover - orjson es opcional
+    import json
+
+    def _dumps(obj: Dict[str, Any]) -> str:
+        return json.dumps(obj, default=str, ensure_ascii=False)
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MUESTREO = float(os.getenv("LOG_MUESTREO", "0.05"))
+LOG_ACCESOS = os.getenv("LOG_ACCESOS", "1") == "1"
+RAIZ = "obt"
+
+# Atributos propios de LogRecord: lo demás viene de `extra`
+_ESTANDAR = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_contexto: ContextVar[Dict[str, Any]] = ContextVar("obt_log_contexto", default={})
+_listener: Optional[logging.handlers.QueueListener] = None
+_formato_exc = logging.Formatter()
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro con los campos de contexto y de `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        datos: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ESTANDAR and not clave.startswith("_"):
+                datos[clave] = valor
+        if record.exc_info:
+            datos["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            datos["exc"] = record.exc_text
+        return _dumps(datos)
+
+
+class FiltroContexto(logging.Filter):
+    """Agrega empresa, endpoint y run_id; corre en el hilo que registra."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for clave, valor in _contexto.get().items():
+            if not hasattr(record, clave):
+                setattr(record, clave, valor)
+        if has_request_context():
+            if not hasattr(record, "empresa"):
+                record.empresa = session.get("empresa")
+            if not hasattr(record, "endpoint"):
+                record.endpoint = request.endpoint
+        return True
+
+
+class _ColaHandler(logging.handlers.QueueHandler):
+    """Como QueueHandler, pero deja el JSON y los campos para el hilo escritor."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        # El traceback no se puede serializar en otro hilo: se pasa a texto
+        if record.exc_info:
+            record.exc_text = _formato_exc.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configurar() -> None:
+    """Instala el handler de cola en el logger `obt` (idempotente)."""
+    global _listener
+    if _listener is not None:
+        return
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(FormatoJSON())
+    cola: queue.SimpleQueue = queue.SimpleQueue()
+    manejador = _ColaHandler(cola)
+    manejador.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger(RAIZ)
+    raiz.handlers[:] = [manejador]
+    raiz.setLevel(LOG_LEVEL)
+    raiz.propagate = False
+
+    _listener = logging.handlers.QueueListener(cola, salida)
+    _listener.start()
+    atexit.register(detener)
+
+
+def detener() -> None:
+    """Vacía la cola y detiene el hilo escritor."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def reiniciar_tras_fork() -> None:
+    """Los hilos no sobreviven al fork: cada worker arranca su propio escritor."""
+    global _listener
+    _listener = None
+    configurar()
+
+
+def get_logger(nombre: str) -> logging.Logger:
+    """Logger hijo de `obt` (p. ej. `obt.views.upload`)."""
+    return logging.getLogger(f"{RAIZ}.{nombre}")
+
+
+@contextmanager
+def contexto(**campos: Any):
+    """Agrega campos (p. ej. `job`, `ruta`) a todo lo que se registre dentro."""
+    token = _contexto.set({**_contexto.get(), **campos})
+    try:
+        yield
+    finally:
+        _contexto.reset(token)
+
+
+def run_id_actual() -> Optional[str]:
+    """`run_id` de la petición en curso (None fuera de una petición)."""
+    return _contexto.get().get("run_id")
+
+
+def muestreado(
+    logger: logging.Logger,
+    mensaje: str,
+    datos: Callable[[], Any],
+    *,
+    nivel: int = logging.DEBUG,
+    tasa: Optional[float] = None,
+    **campos: Any,
+) -> None:
+    """Registra `datos()` solo en una muestra de llamadas; si no, ni lo construye."""
+    if not logger.isEnabledFor(nivel):
+        return
+    if random.random() >= (LOG_MUESTREO if tasa is None else tasa):
+        return
+    logger.log(nivel, mensaje, extra={**campos, "datos": datos()})
+
+
+# ------------------------------------------------------------------
+# Integración con Flask
+# ------------------------------------------------------------------
+_acceso = get_logger("acceso")
+
+
+def _antes() -> None:
+    g.log_t0 = time.perf_counter()
+    g.log_token = _contexto.set({**_contexto.get(), "run_id": uuid.uuid4().hex[:12]})
+
+
+def _despues(resp):
+    run_id = _contexto.get().get("run_id")
+    if run_id:
+        resp.headers["X-Run-Id"] = run_id
+    if LOG_ACCESOS and "log_t0" in g:
+        _acceso.info(
+            "petición",
+            extra={
+                "metodo": request.method,
+                "path": request.path,
+                "status": resp.status_code,
+                "duracion": round(time.perf_counter() - g.log_t0, 4),
+            },
+        )
+    return resp
+
+
+def _limpiar(_exc) -> None:
+    token = g.pop("log_token", None)
+    if token is not None:
+        _contexto.reset(token)
+
+
+def init_app(app) -> None:
+    """Configura el logging y asigna un `run_id` a cada petición."""
+    configurar()
+    app.before_request(_antes)
+    app.after_request(_despues)
+    app.teardown_request(_limpiar)
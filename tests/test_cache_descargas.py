@@ -0,0 +1,65 @@
+"""Caché de descargas frente al NOTIFY que el propio proceso envía tras su ETL."""
+
+import pytest
+
+from views import cache_descargas, cache_pedidos
+
+
+class CursorAvisos:
+    """Guarda los `pg_notify` en vez de enviarlos."""
+
+    def __init__(self):
+        self.avisos = []
+
+    def execute(self, sql, params):
+        self.avisos.append(params[1])
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_descargas, "ACTIVO", True)
+    monkeypatch.setattr(cache_descargas, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cache_descargas, "GENERACIONES_DIR", str(tmp_path / ".generaciones"))
+    monkeypatch.setattr(cache_pedidos, "NOTIFY_ACTIVO", True)
+    monkeypatch.setattr(cache_pedidos, "asegurar_listener", lambda: None)
+    monkeypatch.setattr(cache_pedidos.db, "marcar_escritura", lambda empresa: None)
+    return cache_descargas
+
+
+def _etl(empresa):
+    """notify + commit + invalidación local, como `upload_index`."""
+    cur = CursorAvisos()
+    cache_pedidos.notificar(cur, empresa)
+    cache_pedidos.invalidar(empresa)
+    return cur.avisos
+
+
+def test_aviso_propio_no_borra_lo_guardado_tras_el_etl(cache):
+    avisos = _etl("acme")
+    gen = cache.generacion("acme")
+    path, etag = cache.guardar("acme", "pedidos.zip", b"zip", gen)
+    assert path is not None
+
+    for payload in avisos:  # el listener entrega el aviso después
+        cache_pedidos.recibir(payload)
+
+    assert cache.buscar("acme", "pedidos.zip") == (path, etag)
+
+
+def test_aviso_de_otro_proceso_invalida(cache):
+    gen = cache.generacion("acme")
+    cache.guardar("acme", "pedidos.zip", b"zip", gen)
+
+    cache_pedidos.recibir("otro-proceso:acme")
+
+    assert cache.buscar("acme", "pedidos.zip") is None
+
+
+def test_etl_durante_la_construccion_no_guarda(cache):
+    gen = cache.generacion("acme")
+    _etl("acme")
+
+    path, _ = cache.guardar("acme", "pedidos.zip", b"zip-viejo", gen)
+
+    assert path is None
+    assert cache.buscar("acme", "pedidos.zip") is None
@@ -0,0 +1,21 @@
+"""Claves de la carga delta."""
+
+from views.cargas import agrupar_pedidos, clave_borrado
+
+
+def test_clave_distingue_null_de_vacio():
+    pedidos = [
+        {"cliente": None, "codigo_pro": "A"},
+        {"cliente": "", "codigo_pro": "A"},
+        {"cliente": "C1-Tienda", "codigo_pro": None},
+        {"cliente": "C1", "codigo_pro": 0},
+    ]
+
+    borrados = sorted((clave_borrado(k) for k in agrupar_pedidos(pedidos)), key=repr)
+
+    assert borrados == sorted([
+        {"codigo_cli": None, "codigo_pro": "A"},
+        {"codigo_cli": "", "codigo_pro": "A"},
+        {"codigo_cli": "C1", "codigo_pro": None},
+        {"codigo_cli": "C1", "codigo_pro": "0"},
+    ], key=repr)
@@ -0,0 +1,31 @@
+"""Acceso a `/metrics` con y sin `METRICS_TOKEN`."""
+
+import pytest
+from flask import Flask
+
+import metricas
+
+
+@pytest.fixture
+def cliente():
+    app = Flask(__name__)
+    app.add_url_rule("/metrics", "metricas", metricas.metricas_view)
+    return app.test_client()
+
+
+def _get(cliente, ip, **cabeceras):
+    return cliente.get("/metrics", headers=cabeceras, environ_base={"REMOTE_ADDR": ip})
+
+
+def test_sin_token_solo_local(cliente, monkeypatch):
+    monkeypatch.setattr(metricas, "METRICS_TOKEN", None)
+    assert _get(cliente, "127.0.0.1").status_code == 200
+    assert _get(cliente, "10.0.0.5").status_code == 403
+    # Un proxy en el mismo host no vuelve local la petición
+    assert _get(cliente, "127.0.0.1", **{"X-Forwarded-For": "203.0.113.9"}).status_code == 403
+
+
+def test_con_token(cliente, monkeypatch):
+    monkeypatch.setattr(metricas, "METRICS_TOKEN", "s3creto")
+    assert _get(cliente, "127.0.0.1").status_code == 401
+    assert _get(cliente, "10.0.0.5", Authorization="Bearer s3creto").status_code == 200
@@ -0,0 +1,34 @@
+"""Reglas de `validar_pedidos_rutas` frente a lo que rechaza el SP."""
+
+import pytest
+
+from views.validacion import ValidacionError, validar_pedidos_rutas
+
+BASE = {
+    "numero_pedido": "P1", "cliente": "C1-Tienda", "codigo_pro": "A",
+    "cantidad": 5, "valor": 10, "tipo_pro": "N", "estado": "Sin Descargar",
+}
+
+
+def _errores(pedidos):
+    with pytest.raises(ValidacionError) as e:
+        validar_pedidos_rutas(pedidos, [], "LU")
+    return e.value.errores
+
+
+def test_acepta_nulos_duplicados_y_enteros_en_texto():
+    validar_pedidos_rutas(
+        [BASE, dict(BASE), dict(BASE, cantidad=None), dict(BASE, cantidad=" 7 ", cliente=None)],
+        [], "LU",
+    )
+
+
+@pytest.mark.parametrize("cantidad", [5.0, "5.0", 5.5, True, "", 2**31])
+def test_rechaza_lo_que_no_convierte_a_integer(cantidad):
+    assert _errores([BASE, dict(BASE, cantidad=cantidad, _fila=12)]) == [
+        "Pedidos con cantidad no entera: filas 12"
+    ]
+
+
+def test_valor_vacio_no_es_numeric():
+    assert _errores([dict(BASE, valor="", _fila=3)]) == ["Pedidos con valor no numérico: filas 3"]
@@ -1,9 +1,10 @@
 from datetime import datetime
 from functools import wraps
 
-from flask import Blueprint, flash, redirect, render_template, request, session, url_for
+from flask import Blueprint, abort, flash, redirect, render_template, request, session, url_for
 
-from db import conectar
+import diagnostico
+from db import conectar, conectar_lectura
 from views.auth import login_required
 
 ADMIN_EMAIL = "saulosorioh@gmail.com"
@@ -226,13 +227,54 @@ def admin_dashboard():
 
             return redirect(url_for("admin.admin_dashboard"))
 
+        if action == "arm_diagnostic":
+            email = request.form.get("email", "").strip().lower()
+            modos = tuple(m for m in diagnostico.MODOS if request.form.get(f"modo_{m}"))
+
+            if "@" not in email or not modos:
+                flash("Debes indicar el usuario y al menos un modo de diagnóstico.", "error")
+                return redirect(url_for("admin.admin_dashboard"))
+
+            empresa = email.split("@")[1].split(".")[0]
+            try:
+                diag_id = diagnostico.armar(empresa, modos, session.get("email"))
+                flash(
+                    f"Diagnóstico #{diag_id} armado: se capturará la próxima carga pesada de '{empresa}'.",
+                    "success",
+                )
+            except Exception as exc:
+                flash(f"No fue posible armar el diagnóstico: {exc}", "error")
+
+            return redirect(url_for("admin.admin_dashboard"))
+
     user_emails = []
     try:
-        with conectar() as conn:
+        with conectar_lectura() as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT email FROM users ORDER BY email")
                 user_emails = [row[0] for row in cur.fetchall() if row and row[0]]
     except Exception as exc:
         flash(f"No fue posible cargar la lista de usuarios: {exc}", "error")
 
-    return render_template("admin.html", admin_email=ADMIN_EMAIL, user_emails=user_emails)
+    diagnosticos = []
+    try:
+        diagnosticos = diagnostico.listar()
+    except Exception as exc:
+        flash(f"No fue posible cargar los diagnósticos: {exc}", "error")
+
+    return render_template(
+        "admin.html",
+        admin_email=ADMIN_EMAIL,
+        user_emails=user_emails,
+        diagnosticos=diagnosticos,
+        modos_diagnostico=diagnostico.MODOS,
+    )
+
+
+@admin_bp.route("/admin/diagnosticos/<int:diag_id>")
+@admin_required
+def ver_diagnostico(diag_id: int):
+    diag = diagnostico.obtener(diag_id)
+    if diag is None:
+        abort(404)
+    return render_template("admin_diagnostico.html", diag=diag)
@@ -0,0 +1,160 @@
+"""Archivos por ruta de /generar-pedidos guardados con su hash.
+
+Cada corrida guarda en `artefactos_rutas` el `pedidos_ruta_{ruta}.xlsx` y el
+`cargue_sugerido_ruta_{ruta}.csv` de cada ruta junto con el hash de sus filas.
+En la siguiente corrida solo se regeneran las rutas cuyo hash cambió; las
+demás se toman de la tabla. También permite descargar una sola ruta sin
+armar el ZIP. La tabla la crea `migraciones.py`.
+"""
+
+import hashlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import msgpack
+
+from registro import get_logger
+
+log = get_logger(__name__)
+
+# Cambiarla obliga a regenerar todo (p. ej. si cambia el formato del Excel)
+VERSION_FORMATO = 1
+
+Archivos = Tuple[bytes, bytes]  # (xlsx, csv)
+
+
+def agrupar_por_ruta(data_ped: List[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
+    """Filas de `fn_obtener_pedidos_con_pedir_json` por ruta, en el mismo orden."""
+
+    rutas: Dict[int, List[Dict[str, Any]]] = {}
+    for fila in data_ped:
+        rutas.setdefault(fila["ruta"], []).append(fila)
+    return rutas
+
+
+def hash_ruta(ruta: int, filas: List[Dict[str, Any]]) -> str:
+    """Hash del conjunto de filas de la ruta, independiente de su orden."""
+
+    h = hashlib.sha256(msgpack.packb([VERSION_FORMATO, ruta], default=str))
+    for fila in sorted(
+        msgpack.packb([f["codigo_pro"], f["producto"], f["pedir"]], use_bin_type=True, default=str)
+        for f in filas
+    ):
+        h.update(fila)
+    return h.hexdigest()
+
+
+def _guardados(cur, bd: str, hashes: Dict[int, str]) -> Dict[int, Archivos]:
+    """Archivos guardados de las rutas cuyo hash no cambió."""
+
+    # Solo viajan los bytes de las rutas que no cambiaron
+    cur.execute(
+        """
+        SELECT a.ruta, a.xlsx, a.csv
+        FROM artefactos_rutas a
+        JOIN unnest(%s::int[], %s::text[]) AS n(ruta, hash)
+          ON a.ruta = n.ruta AND a.hash = n.hash
+        WHERE a.bd = %s
+        """,
+        (list(hashes), list(hashes.values()), bd),
+    )
+    return {ruta: (bytes(xlsx), bytes(csv)) for ruta, xlsx, csv in cur.fetchall()}
+
+
+def armar_rutas(
+    cur,
+    bd: str,
+    data_ped: List[Dict[str, Any]],
+    generar: Callable[[int, List[Dict[str, Any]]], Archivos],
+) -> Dict[int, Archivos]:
+    """Como `actualizar_rutas`, pero sin escribir: para las descargas GET.
+
+    Las rutas sin archivo guardado (o con otro hash) se generan solo en memoria.
+    """
+
+    rutas = agrupar_por_ruta(data_ped)
+    archivos = _guardados(cur, bd, {ruta: hash_ruta(ruta, filas) for ruta, filas in rutas.items()})
+    for ruta in rutas:
+        if ruta not in archivos:
+            archivos[ruta] = generar(ruta, rutas[ruta])
+    return {ruta: archivos[ruta] for ruta in sorted(archivos)}
+
+
+def actualizar_rutas(
+    conn,
+    bd: str,
+    data_ped: List[Dict[str, Any]],
+    generar: Callable[[int, List[Dict[str, Any]]], Archivos],
+) -> Dict[int, Archivos]:
+    """Devuelve los archivos de cada ruta, regenerando solo los que cambiaron.
+
+    Guarda los nuevos, borra los de rutas que ya no tienen pedidos y confirma.
+    """
+
+    rutas = agrupar_por_ruta(data_ped)
+    hashes = {ruta: hash_ruta(ruta, filas) for ruta, filas in rutas.items()}
+    with conn.cursor() as cur:
+        archivos = _guardados(cur, bd, hashes)
+        nuevas = [ruta for ruta in rutas if ruta not in archivos]
+        for ruta in nuevas:
+            archivos[ruta] = generar(ruta, rutas[ruta])
+        if nuevas:
+            cur.executemany(
+                """
+                INSERT INTO artefactos_rutas (bd, ruta, hash, xlsx, csv, generado_en)
+                VALUES (%s, %s, %s, %s, %s, NOW())
+                ON CONFLICT (bd, ruta) DO UPDATE SET
+                    hash = EXCLUDED.hash,
+                    xlsx = EXCLUDED.xlsx,
+                    csv = EXCLUDED.csv,
+                    generado_en = EXCLUDED.generado_en
+                """,
+                [(bd, ruta, hashes[ruta], *archivos[ruta]) for ruta in nuevas],
+            )
+        cur.execute(
+            "DELETE FROM artefactos_rutas WHERE bd = %s AND NOT (ruta = ANY(%s::int[]))",
+            (bd, list(hashes)),
+        )
+    conn.commit()
+
+    log.info("archivos por ruta", extra={
+        "rutas": len(rutas), "regeneradas": len(nuevas), "reutilizadas": len(rutas) - len(nuevas),
+    })
+    return {ruta: archivos[ruta] for ruta in sorted(archivos)}
+
+
+def descartar(cur, bd: str) -> None:
+    """Borra los archivos guardados de la empresa, sin confirmar.
+
+    Para el ETL de /cargar-pedidos, que vacía `pedxrutaxprod`: va en su
+    misma transacción para que las descargas por ruta no sirvan la corrida
+    anterior.
+    """
+
+    cur.execute("DELETE FROM artefactos_rutas WHERE bd = %s", (bd,))
+
+
+def listar_rutas(cur, bd: str) -> List[Dict[str, Any]]:
+    """Rutas con archivos guardados para la empresa."""
+
+    cur.execute(
+        "SELECT ruta, hash, generado_en FROM artefactos_rutas WHERE bd = %s ORDER BY ruta",
+        (bd,),
+    )
+    return [
+        {"ruta": ruta, "hash": hash_.strip(), "generado_en": generado_en.isoformat()}
+        for ruta, hash_, generado_en in cur.fetchall()
+    ]
+
+
+def obtener_ruta(cur, bd: str, ruta: int, formato: str) -> Optional[Tuple[bytes, str]]:
+    """(contenido, hash) del `xlsx` o `csv` guardado de la ruta, o None."""
+
+    columna = {"xlsx": "xlsx", "csv": "csv"}[formato]
+    cur.execute(
+        f"SELECT {columna}, hash FROM artefactos_rutas WHERE bd = %s AND ruta = %s",
+        (bd, ruta),
+    )
+    fila = cur.fetchone()
+    if not fila:
+        return None
+    return bytes(fila[0]), fila[1].strip()
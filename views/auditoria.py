@@ -1,7 +1,8 @@
-from flask import Blueprint, render_template, session, send_file, flash, redirect, url_for
-import pandas as pd
+from flask import Blueprint, render_template, session, flash, redirect, url_for
 import io
 import db  # usa el archivo db.py en la raíz
+import plazos
+from views import cache_descargas
 from views.auth import login_required
 
 auditoria_bp = Blueprint('auditoria', __name__, template_folder="../templates")
@@ -19,8 +20,11 @@ def descargar_excel():
         flash('Empresa no definida en la sesión', 'danger')
         return redirect(url_for('auditoria.auditoria_view'))
 
-    try:
-        with db.conectar() as conn:
+    def construir():
+        import pandas as pd
+
+        # Solo lee: réplica si la hay (salvo justo después de un ETL de la empresa)
+        with db.conectar_lectura(empresa) as conn:
             query1 = "SELECT * FROM PEDXCLIXPROD WHERE bd = %s"
             df1 = pd.read_sql(query1, conn, params=(empresa,))
 
@@ -31,14 +35,17 @@ def descargar_excel():
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
             df1.to_excel(writer, sheet_name='PEDXCLIXPROD', index=False)
             df2.to_excel(writer, sheet_name='pedxrutaxprod', index=False)
-        output.seek(0)
-
-        return send_file(output,
-                         download_name='auditoria.xlsx',
-                         as_attachment=True,
-                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        return output.getvalue()
 
+    try:
+        # Hasta el próximo ETL de la empresa se sirve el mismo archivo
+        return cache_descargas.enviar(empresa, 'auditoria.xlsx', 'auditoria.xlsx',
+                                      cache_descargas.MIME_XLSX, construir)
     except Exception as e:
+        # pandas envuelve la cancelación en su propio DatabaseError
+        vencido = plazos.vencido_en(e)
+        if vencido:
+            raise vencido
         flash(f'Error al exportar: {str(e)}', 'danger')
         return redirect(url_for('auditoria.auditoria_view'))
 
@@ -0,0 +1,199 @@
+"""Caché en disco de las descargas generadas, con ETag por contenido.
+
+`ResumenPedidos_*.xlsx`, el ZIP de /generar-pedidos y `auditoria.xlsx` se
+guardan por empresa la primera vez que se arman. Las siguientes descargas
+salen del archivo con `send_file` (sendfile bajo gunicorn) y, si el
+navegador ya tiene esa versión (`If-None-Match`), con un 304 sin cuerpo.
+
+El ETag es el SHA-256 del archivo y va en su nombre: `<empresa>/<clave>~<etag>`.
+Las entradas de una empresa se borran cuando corre su ETL
+(`cache_pedidos.invalidar`, también en los demás procesos por NOTIFY).
+
+La generación de cada empresa vive en `.generaciones/<empresa>`, junto a la
+caché, para que la vean todos los procesos que comparten el directorio.
+"""
+
+import contextlib
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from io import BytesIO
+from typing import Callable, Optional, Tuple
+
+from flask import send_file
+
+from registro import get_logger
+
+log = get_logger(__name__)
+
+ACTIVO = os.getenv("CACHE_DESCARGAS", "1") == "1"
+CACHE_DIR = os.getenv(
+    "CACHE_DESCARGAS_DIR",
+    os.path.join(tempfile.gettempdir(), "obt_descargas"),
+)
+CACHE_MAX_BYTES = int(os.getenv("CACHE_DESCARGAS_MAX_MB", "512")) * 1024 * 1024
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+MIME_ZIP = "application/zip"
+
+# Fuera de los directorios por empresa: `invalidar` los borra enteros
+_GENERACIONES = ".generaciones"
+GENERACIONES_DIR = os.path.join(CACHE_DIR, _GENERACIONES)
+
+
+def _nombre(empresa: str) -> str:
+    return re.sub(r"[^\w.-]", "_", empresa)
+
+
+def _dir_empresa(empresa: str) -> str:
+    return os.path.join(CACHE_DIR, _nombre(empresa))
+
+
+def _asegurar_listener() -> None:
+    from views.cache_pedidos import asegurar_listener
+
+    # Sin el listener este proceso no se enteraría de los ETL de los demás
+    asegurar_listener()
+
+
+def generacion(empresa: str) -> str:
+    """Tomarla antes de leer los datos; `guardar` descarta si cambió."""
+    _asegurar_listener()
+    try:
+        with open(os.path.join(GENERACIONES_DIR, _nombre(empresa))) as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def invalidar(empresa: str) -> None:
+    """Borra las descargas de la empresa; llamada tras su ETL.
+
+    Cambia la generación antes de borrar: un `guardar` en curso en
+    cualquier proceso la vuelve a revisar después de escribir.
+    """
+    try:
+        os.makedirs(GENERACIONES_DIR, exist_ok=True)
+        path = os.path.join(GENERACIONES_DIR, _nombre(empresa))
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning("caché de descargas no disponible", extra={"error": str(e)})
+    shutil.rmtree(_dir_empresa(empresa), ignore_errors=True)
+
+
+def buscar(empresa: str, clave: str) -> Optional[Tuple[str, str]]:
+    """(ruta, etag) de la descarga cacheada, o None."""
+    if not ACTIVO:
+        return None
+    _asegurar_listener()
+    prefijo = f"{clave}~"
+    try:
+        with os.scandir(_dir_empresa(empresa)) as it:
+            for e in it:
+                if e.name.startswith(prefijo) and not e.name.endswith(".tmp"):
+                    os.utime(e.path, None)  # renueva su posición LRU
+                    return e.path, e.name[len(prefijo):]
+    except OSError:
+        pass
+    return None
+
+
+def guardar(empresa: str, clave: str, contenido: bytes, gen: str) -> Tuple[Optional[str], str]:
+    """Escribe la descarga de forma atómica. Devuelve (ruta o None, etag)."""
+    etag = hashlib.sha256(contenido).hexdigest()
+    if not ACTIVO or generacion(empresa) != gen:
+        # Corrió un ETL mientras se armaba: se envía pero no se guarda
+        return None, etag
+    directorio = _dir_empresa(empresa)
+    path = os.path.join(directorio, f"{clave}~{etag}")
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(contenido)
+        os.replace(tmp, path)
+        if generacion(empresa) != gen:
+            # El ETL pudo borrar el directorio antes del replace
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            return None, etag
+        # Versiones anteriores de la misma descarga
+        with os.scandir(directorio) as it:
+            for e in it:
+                if e.name.startswith(f"{clave}~") and e.path != path and not e.name.endswith(".tmp"):
+                    os.unlink(e.path)
+        _podar_cache()
+    except OSError as e:
+        # La caché es opcional: un fallo aquí no debe tumbar la petición
+        log.warning("caché de descargas no disponible", extra={"error": str(e)})
+        return None, etag
+    return path, etag
+
+
+def _podar_cache() -> None:
+    entradas = []
+    for raiz, dirs, archivos in os.walk(CACHE_DIR):
+        if raiz == CACHE_DIR and _GENERACIONES in dirs:
+            dirs.remove(_GENERACIONES)  # no cuentan y no se podan
+        for nombre in archivos:
+            if nombre.endswith(".tmp"):
+                continue
+            path = os.path.join(raiz, nombre)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, path))
+    total = sum(tamano for _, tamano, _ in entradas)
+    for _, tamano, path in sorted(entradas):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.unlink(path)
+            total -= tamano
+        except OSError:
+            pass
+
+
+def responder(origen, etag: str, nombre: str, mimetype: str):
+    """`send_file` con ETag; responde 304 si el cliente ya tiene esa versión."""
+    if isinstance(origen, bytes):
+        origen = BytesIO(origen)
+    resp = send_file(origen, as_attachment=True, download_name=nombre, mimetype=mimetype,
+                     etag=etag, conditional=True, max_age=0)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
+
+def enviar(empresa: str, clave: str, nombre: str, mimetype: str,
+           construir: Callable[[], Optional[bytes]]):
+    """Sirve `clave` desde la caché o la arma con `construir` y la guarda.
+
+    `construir` devuelve None si no hay nada que descargar (la vista decide
+    el 404). `X-Cache` indica `hit` o `miss`.
+    """
+    cacheado = buscar(empresa, clave)
+    if cacheado is not None:
+        path, etag = cacheado
+        try:
+            resp = responder(path, etag, nombre, mimetype)
+            resp.headers["X-Cache"] = "hit"
+            return resp
+        except OSError:
+            pass  # lo borró un ETL entre la búsqueda y el envío
+
+    gen = generacion(empresa)
+    contenido = construir()
+    if contenido is None:
+        return None
+    path, etag = guardar(empresa, clave, contenido, gen)
+    resp = responder(path or contenido, etag, nombre, mimetype)
+    resp.headers["X-Cache"] = "miss"
+    return resp
@@ -0,0 +1,183 @@
+"""Caché por empresa de `fn_obtener_pedidos_con_pedir_json` en el proceso.
+
+Los datos se guardan en columnas (arreglos numpy para `ruta`/`pedir`) y se
+invalidan de forma explícita cuando corre un ETL que reescribe
+`pedxrutaxprod`. Con `CACHE_PEDIDOS_NOTIFY=1` la invalidación se propaga a
+los demás procesos mediante LISTEN/NOTIFY de Postgres.
+"""
+
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import db
+from registro import get_logger
+from views import cache_descargas
+
+log = get_logger(__name__)
+
+CANAL = "obt_cache_pedidos"
+TTL_SEG = int(os.getenv("CACHE_PEDIDOS_TTL", "600"))
+NOTIFY_ACTIVO = os.getenv("CACHE_PEDIDOS_NOTIFY", "1") == "1"
+# Cuánto espera el primer uso de la caché a que el listener quede conectado
+ESPERA_LISTENER_SEG = float(os.getenv("CACHE_PEDIDOS_ESPERA_LISTENER", "2"))
+
+
+class PedidosColumnar:
+    """Filas ruta/codigo_pro/producto/pedir almacenadas por columnas."""
+
+    __slots__ = ("ruta", "codigo_pro", "producto", "pedir", "creado")
+
+    def __init__(self, filas: List[Dict[str, Any]]):
+        import numpy as np
+
+        self.ruta = np.fromiter((f["ruta"] for f in filas), dtype=np.int32, count=len(filas))
+        self.pedir = np.fromiter((f["pedir"] for f in filas), dtype=np.int32, count=len(filas))
+        self.codigo_pro = [f["codigo_pro"] for f in filas]
+        self.producto = [f["producto"] for f in filas]
+        self.creado = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.codigo_pro)
+
+    def filas(self) -> List[Dict[str, Any]]:
+        return [
+            {"ruta": r, "codigo_pro": c, "producto": p, "pedir": q}
+            for r, c, p, q in zip(
+                self.ruta.tolist(), self.codigo_pro, self.producto, self.pedir.tolist()
+            )
+        ]
+
+
+_lock = threading.Lock()
+_datos: Dict[str, PedidosColumnar] = {}
+_generacion: Dict[str, int] = {}
+_epoca = 0  # sube al (re)conectar el listener: pudo perder avisos de cualquier empresa
+_listener: Optional[threading.Thread] = None
+_conectado = threading.Event()
+_arranque = float("-inf")
+# Identifica los NOTIFY de este proceso; se renueva tras un fork
+_origen: Tuple[int, str] = (0, "")
+
+
+def _vigente(entrada: Optional[PedidosColumnar]) -> bool:
+    return entrada is not None and time.monotonic() - entrada.creado < TTL_SEG
+
+
+def generacion(empresa: str) -> Tuple[int, int]:
+    """Tomarla antes de leer los datos; `guardar` descarta si cambió."""
+    asegurar_listener()
+    with _lock:
+        return _epoca, _generacion.get(empresa, 0)
+
+
+def obtener(empresa: str, cargar: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Filas cacheadas de la empresa; si no hay, las lee con `cargar` y las guarda."""
+    gen = generacion(empresa)
+    with _lock:
+        entrada = _datos.get(empresa)
+    if _vigente(entrada):
+        return entrada.filas()
+
+    filas = cargar()
+    guardar(empresa, filas, gen)
+    return filas
+
+
+def guardar(empresa: str, filas: List[Dict[str, Any]], gen: Tuple[int, int]) -> None:
+    """Guarda datos leídos con la generación `gen` (p. ej. los de `_build_zip`).
+
+    Si hubo una invalidación desde que se tomó `gen`, no se guarda.
+    """
+    asegurar_listener()
+    with _lock:
+        if (_epoca, _generacion.get(empresa, 0)) == gen:
+            _datos[empresa] = PedidosColumnar(filas)
+
+
+def invalidar(empresa: str) -> None:
+    """Descarta la entrada local de la empresa.
+
+    También la saca de la réplica de lectura por un rato y borra sus
+    descargas cacheadas: llega aquí tras su ETL, en este proceso o en otro
+    por NOTIFY.
+    """
+    with _lock:
+        _datos.pop(empresa, None)
+        _generacion[empresa] = _generacion.get(empresa, 0) + 1
+    db.marcar_escritura(empresa)
+    cache_descargas.invalidar(empresa)
+
+
+def _id_proceso() -> str:
+    global _origen
+    pid = os.getpid()
+    if _origen[0] != pid:
+        _origen = (pid, uuid.uuid4().hex[:12])
+    return _origen[1]
+
+
+def notificar(cur, empresa: str) -> None:
+    """Encola un NOTIFY para los demás procesos; se entrega al hacer commit.
+
+    El payload es `<proceso>:<empresa>`: quien lo envía ya invalidó en local
+    y no debe volver a hacerlo cuando le llegue su propio aviso.
+    """
+    if NOTIFY_ACTIVO:
+        cur.execute("SELECT pg_notify(%s, %s);", (CANAL, f"{_id_proceso()}:{empresa}"))
+
+
+# ------------------------------------------------------------------
+# Invalidación entre procesos (LISTEN/NOTIFY)
+# ------------------------------------------------------------------
+def recibir(payload: str) -> None:
+    """Atiende un aviso del canal; ignora los que envió este mismo proceso."""
+    origen, sep, empresa = payload.partition(":")
+    if not sep:
+        origen, empresa = "", payload  # aviso sin origen
+    if origen == _id_proceso():
+        return
+    invalidar(empresa)
+
+
+def _escuchar() -> None:
+    global _epoca
+    while True:
+        try:
+            with db.conectar_directo() as conn:
+                conn.autocommit = True
+                conn.execute(f"LISTEN {CANAL};")
+                # Lo cacheado antes de (re)conectar pudo perder avisos
+                with _lock:
+                    _datos.clear()
+                    _epoca += 1
+                _conectado.set()
+                for aviso in conn.notifies():
+                    recibir(aviso.payload)
+        except Exception as e:
+            log.warning("listener de caché desconectado", extra={"canal": CANAL, "error": str(e)})
+        _conectado.clear()
+        time.sleep(5)
+
+
+def asegurar_listener() -> None:
+    """Arranca el hilo LISTEN la primera vez que se usa la caché en el proceso.
+
+    Espera (hasta `ESPERA_LISTENER_SEG`) a que quede conectado: su primera
+    conexión sube la época, y una generación tomada antes se descartaría.
+    """
+    global _listener, _arranque
+    if not NOTIFY_ACTIVO:
+        return
+    if _listener is None or not _listener.is_alive():
+        with _lock:
+            if _listener is None or not _listener.is_alive():
+                _arranque = time.monotonic()
+                _listener = threading.Thread(target=_escuchar, name="cache-pedidos-listen", daemon=True)
+                _listener.start()
+    # También esperan los hilos que llegan mientras arranca
+    restante = _arranque + ESPERA_LISTENER_SEG - time.monotonic()
+    if restante > 0 and not _conectado.is_set():
+        _conectado.wait(restante)
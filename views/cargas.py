@@ -0,0 +1,160 @@
+"""Registro de cargas de pedidos/rutas para no repetir el ETL masivo.
+
+Guarda por empresa la última carga: hash del payload, resumen en Excel y
+un índice compacto de huellas por (cliente, producto) que permite enviar
+solo los cambios a `etl_cargar_pedidos_delta`. La tabla la crea `migraciones.py`.
+"""
+
+import hashlib
+from typing import Any, Dict, List, Optional
+
+import msgpack
+
+# Primera llave de `pg_advisory_xact_lock(llave, hashtext(bd))`
+LLAVE_BLOQUEO = 72_035
+
+
+def hash_carga(payload: Dict[str, Any], dia: str, empresa: str) -> str:
+    """Hash del payload decodificado junto con el día y la empresa."""
+
+    contenido = msgpack.packb(
+        [empresa, dia, payload.get("pedidos") or [], payload.get("rutas") or []],
+        use_bin_type=True,
+        default=str,
+    )
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def hash_rutas(rutas: Optional[List[Dict[str, Any]]]) -> str:
+    """Hash de las rutas del día; si cambian, la carga delta no aplica."""
+
+    contenido = msgpack.packb(rutas or [], use_bin_type=True, default=str)
+    return hashlib.sha256(contenido).hexdigest()
+
+
+# Marca de NULL en las claves: un TEXT de Postgres no puede contener NUL,
+# así que no choca con '' (que es un valor distinto de NULL en el SP)
+_NULO = "\x00"
+
+
+def _clave_pedido(pedido: Dict[str, Any]) -> str:
+    # Igual que el SP: codigo_cli = split_part(cliente, '-', 1), NULL si no hay cliente
+    cliente, codigo_pro = pedido.get("cliente"), pedido.get("codigo_pro")
+    cli = _NULO if cliente is None else str(cliente).split("-", 1)[0]
+    pro = _NULO if codigo_pro is None else str(codigo_pro)
+    return f"{cli}\x1f{pro}"
+
+
+def clave_borrado(clave: str) -> Dict[str, Optional[str]]:
+    """`{codigo_cli, codigo_pro}` de una clave para `p_borrados`, con None como NULL."""
+
+    return {
+        campo: None if valor == _NULO else valor
+        for campo, valor in zip(("codigo_cli", "codigo_pro"), clave.split("\x1f", 1))
+    }
+
+
+def agrupar_pedidos(pedidos: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Agrupa las filas de pedidos por (cliente, producto)."""
+
+    grupos: Dict[str, List[Dict[str, Any]]] = {}
+    for p in pedidos:
+        grupos.setdefault(_clave_pedido(p), []).append(p)
+    return grupos
+
+
+def huellas_pedidos(grupos: Dict[str, List[Dict[str, Any]]]) -> Dict[str, bytes]:
+    """Huella de 8 bytes por (cliente, producto), independiente del orden de filas."""
+
+    huellas = {}
+    for clave, filas in grupos.items():
+        h = hashlib.blake2b(digest_size=8)
+        for fila in sorted(msgpack.packb(f, use_bin_type=True, default=str) for f in filas):
+            h.update(fila)
+        huellas[clave] = h.digest()
+    return huellas
+
+
+def calcular_delta(previas: Dict[str, bytes], actuales: Dict[str, bytes]) -> Dict[str, List[str]]:
+    """Claves insertadas, actualizadas y eliminadas respecto a la carga anterior."""
+
+    return {
+        "insertados": [k for k in actuales if k not in previas],
+        "actualizados": [k for k, h in actuales.items() if k in previas and previas[k] != h],
+        "eliminados": [k for k in previas if k not in actuales],
+    }
+
+
+def empaquetar_huellas(huellas: Dict[str, bytes]) -> bytes:
+    return msgpack.packb(huellas, use_bin_type=True)
+
+
+def desempaquetar_huellas(raw: Optional[bytes]) -> Optional[Dict[str, bytes]]:
+    if raw is None:
+        return None
+    return msgpack.unpackb(bytes(raw), raw=False)
+
+
+def bloquear_carga(cur, bd: str) -> None:
+    """Serializa las cargas de la empresa hasta el fin de la transacción.
+
+    Vale también para la primera carga, cuando aún no hay fila que bloquear.
+    """
+
+    cur.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s));", (LLAVE_BLOQUEO, bd))
+
+
+def obtener_carga(cur, bd: str) -> Optional[Dict[str, Any]]:
+    """Devuelve la última carga registrada para la empresa, o None."""
+
+    cur.execute(
+        """
+        SELECT dia, payload_hash, resumen_xlsx, rutas_hash, huellas
+        FROM cargas_pedidos WHERE bd=%s
+        """,
+        (bd,),
+    )
+    fila = cur.fetchone()
+    if not fila:
+        return None
+    return {
+        "dia": fila[0],
+        "payload_hash": fila[1],
+        "resumen_xlsx": bytes(fila[2]),
+        "rutas_hash": fila[3],
+        "huellas": desempaquetar_huellas(fila[4]),
+    }
+
+
+def registrar_carga(
+    cur,
+    bd: str,
+    dia: str,
+    payload_hash: str,
+    resumen_xlsx: bytes,
+    rutas_hash: Optional[str] = None,
+    huellas: Optional[Dict[str, bytes]] = None,
+) -> None:
+    """Guarda (o reemplaza) la última carga de la empresa con su resumen e índice."""
+
+    cur.execute(
+        """
+        INSERT INTO cargas_pedidos (bd, dia, payload_hash, resumen_xlsx, rutas_hash, huellas, cargado_en)
+        VALUES (%s, %s, %s, %s, %s, %s, NOW())
+        ON CONFLICT (bd) DO UPDATE SET
+            dia = EXCLUDED.dia,
+            payload_hash = EXCLUDED.payload_hash,
+            resumen_xlsx = EXCLUDED.resumen_xlsx,
+            rutas_hash = EXCLUDED.rutas_hash,
+            huellas = EXCLUDED.huellas,
+            cargado_en = EXCLUDED.cargado_en
+        """,
+        (
+            bd,
+            dia,
+            payload_hash,
+            resumen_xlsx,
+            rutas_hash,
+            empaquetar_huellas(huellas) if huellas is not None else None,
+        ),
+    )
@@ -1,13 +1,24 @@
 import base64
-import pandas as pd
+import hashlib
+import json
+import os
+import tempfile
 from io import BytesIO, StringIO
 from datetime import datetime
+from typing import TYPE_CHECKING
 from flask import (
     Blueprint, render_template, request,
     flash, redirect, url_for, send_file, jsonify
 )
+from metricas import span
+from registro import get_logger
 from views.auth import login_required
 
+if TYPE_CHECKING:  # pandas se importa al usarse
+    import pandas as pd
+
+log = get_logger(__name__)
+
 consolidar_bp = Blueprint(
     "consolidar_compras", __name__,
     template_folder="../templates"
@@ -73,11 +84,96 @@ ECOM_COLUMN_SPEC = {
 }
 ECOM_COLUMNS = list(ECOM_COLUMN_SPEC.keys())
 
+# 3) Caché en disco del DataFrame agrupado ('agg')
+#    clave: hash del archivo subido + COLUMN_CONFIG
+#    formato: Parquet (zstd); eviction LRU por mtime con tope de tamaño
+CACHE_DIR = os.getenv(
+    "CONSOLIDAR_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "consolidar_compras_cache"),
+)
+CACHE_MAX_BYTES = int(os.getenv("CONSOLIDAR_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+
+def _clave_cache(raw: bytes) -> str:
+    """Hash del contenido subido; incluye la config para invalidar si cambia."""
+    h = hashlib.sha256(raw)
+    h.update(json.dumps(COLUMN_CONFIG, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _ruta_cache(clave: str) -> str:
+    return os.path.join(CACHE_DIR, f"{clave}.parquet")
+
+
+def _leer_cache(clave: str):
+    """Devuelve el 'agg' cacheado o None. Un acierto renueva su posición LRU."""
+    import pandas as pd
+
+    path = _ruta_cache(clave)
+    try:
+        agg = pd.read_parquet(path)
+        os.utime(path, None)
+    except (OSError, ValueError):
+        return None
+    return agg
+
+
+def _guardar_cache(clave: str, agg: "pd.DataFrame") -> None:
+    """Escribe 'agg' de forma atómica y poda las entradas menos usadas."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = _ruta_cache(clave)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        agg.to_parquet(tmp, index=False, compression="zstd")
+        os.replace(tmp, path)
+        _podar_cache()
+    except (OSError, ValueError, ImportError) as e:
+        # La caché es opcional: un fallo aquí no debe tumbar la petición
+        log.warning("caché consolidar_compras no disponible", extra={"error": str(e)})
+
+
+def _podar_cache() -> None:
+    entradas = []
+    with os.scandir(CACHE_DIR) as it:
+        for e in it:
+            if e.name.endswith(".parquet"):
+                st = e.stat()
+                entradas.append((st.st_mtime, st.st_size, e.path))
+    total = sum(size for _, size, _ in entradas)
+    for _, size, path in sorted(entradas):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _agrupar_reporte(df: "pd.DataFrame") -> "pd.DataFrame":
+    """Convierte, filtra y agrupa el reporte SAP (sin estáticos ni orden)."""
+    # --- Conversión numérica para sum/mean ---
+    for col, cfg in COLUMN_CONFIG.items():
+        if cfg["action"] in ("sum", "mean"):
+            df[col] = df[col].replace("", "0").astype(float)
+
+    # --- Prefiltrado ECOM (excluir ZCMM y ZCM2) ---
+    df = df[~df["Tipo Pos"].isin(["ZCMM", "ZCM2"])]
+
+    # --- Preparar agrupación ---
+    group_cols = [c for c, cfg in COLUMN_CONFIG.items() if cfg["action"] == "group"]
+    agg_map    = {c: cfg["action"] for c, cfg in COLUMN_CONFIG.items() if cfg["action"] in ("sum", "mean")}
+
+    # --- Agrupar ---
+    return df.groupby(group_cols, as_index=False).agg(agg_map)
+
 
 @consolidar_bp.route("/consolidar-compras", methods=["GET", "POST"])
 @login_required
 def consolidar_compras_index():
     if request.method == "POST":
+        import pandas as pd
+
         f = request.files.get("archivo")
         orden_compra = request.form.get("orden_compra", "").strip()
         if not f:
@@ -88,27 +184,23 @@ def consolidar_compras_index():
             return redirect(url_for(".consolidar_compras_index"))
 
         try:
-            # --- Lectura y validación de columnas de entrada ---
-            df = pd.read_excel(f, engine="openpyxl", dtype=str).fillna("")
-            falt = [c for c in COLUMN_CONFIG if c not in df.columns]
-            if falt:
-                flash(f"Faltan columnas: {falt}", "error")
-                return redirect(url_for(".consolidar_compras_index"))
-
-            # --- Conversión numérica para sum/mean ---
-            for col, cfg in COLUMN_CONFIG.items():
-                if cfg["action"] in ("sum", "mean"):
-                    df[col] = df[col].replace("", "0").astype(float)
-
-            # --- Prefiltrado ECOM (excluir ZCMM y ZCM2) ---
-            df = df[~df["Tipo Pos"].isin(["ZCMM", "ZCM2"])]
+            # --- Caché por contenido: el mismo reporte no se vuelve a agrupar ---
+            raw = f.read()
+            clave = _clave_cache(raw)
+            agg = _leer_cache(clave)
 
-            # --- Preparar agrupación ---
-            group_cols = [c for c, cfg in COLUMN_CONFIG.items() if cfg["action"] == "group"]
-            agg_map    = {c: cfg["action"] for c, cfg in COLUMN_CONFIG.items() if cfg["action"] in ("sum", "mean")}
+            if agg is None:
+                # --- Lectura y validación de columnas de entrada ---
+                with span("lectura"):
+                    df = pd.read_excel(BytesIO(raw), engine="openpyxl", dtype=str).fillna("")
+                falt = [c for c in COLUMN_CONFIG if c not in df.columns]
+                if falt:
+                    flash(f"Faltan columnas: {falt}", "error")
+                    return redirect(url_for(".consolidar_compras_index"))
 
-            # --- Agrupar ---
-            agg = df.groupby(group_cols, as_index=False).agg(agg_map)
+                with span("agrupar"):
+                    agg = _agrupar_reporte(df)
+                _guardar_cache(clave, agg)
 
             # --- Asignar estáticos generales (COLUMN_CONFIG) ---
             for col, cfg in COLUMN_CONFIG.items():
@@ -153,10 +245,11 @@ def consolidar_compras_index():
                 csv_df = csv_df[["bodega", "codigo_producto", "cantidad", "costo"]]
 
             # --- Serializar archivos en memoria ---
-            excel_buffer = BytesIO()
-            with pd.ExcelWriter(excel_buffer, engine="openpyxl") as writer:
-                df_out.to_excel(writer, index=False)
-            excel_bytes = excel_buffer.getvalue()
+            with span("excel"):
+                excel_buffer = BytesIO()
+                with pd.ExcelWriter(excel_buffer, engine="openpyxl") as writer:
+                    df_out.to_excel(writer, index=False)
+                excel_bytes = excel_buffer.getvalue()
 
             csv_buffer = StringIO()
             csv_df.to_csv(csv_buffer, index=False)
@@ -3,11 +3,18 @@ from io import BytesIO
 import zipfile
 from datetime import datetime
 
-import pandas as pd
 import msgpack
-from flask import Blueprint, render_template, request, jsonify, send_file, session
+from flask import Blueprint, render_template, request, jsonify, session
 from views.auth import login_required
-from db import conectar
+from metricas import span, spans_actuales
+from registro import get_logger
+from views import artefactos, cache_descargas, cache_pedidos, simulacion
+from views.ingesta import leer_inventario, leer_materiales
+from views.validacion import ValidacionError, validar_inventario_materiales
+from db import conectar, conectar_lectura, consultar_json, obtener_varios
+from plazos import PlazoVencido
+
+log = get_logger(__name__)
 
 generar_pedidos_bp = Blueprint("generar_pedidos", __name__, template_folder="../templates")
 
@@ -16,6 +23,27 @@ def _get_msgpack_payload():
     raw = request.get_data()
     return msgpack.unpackb(raw, raw=False)
 
+
+def _get_payload():
+    """Payload MessagePack del navegador o, si llegan archivos, leído en el servidor."""
+    if not request.files:
+        return _get_msgpack_payload() or {}
+
+    f_inv = request.files.get("inventario")
+    if not f_inv:
+        raise ValueError("Adjunta el Excel de inventario.")
+    payload = {"inventario": leer_inventario(f_inv)}
+    f_mat = request.files.get("materiales")
+    if f_mat and f_mat.filename:
+        payload["materiales"] = leer_materiales(f_mat)
+    for carro in ("carro1", "carro2"):
+        valor = (request.form.get(carro) or "").strip()
+        if valor:
+            if not valor.isdigit():
+                raise ValueError(f"{carro} debe ser un número de ruta.")
+            payload[carro] = int(valor)
+    return payload
+
 @generar_pedidos_bp.route("/generar-pedidos", methods=["GET"])
 @login_required
 def generar_pedidos_index():
@@ -27,62 +55,205 @@ def cargar_pedidos():
     try:
         # Datos enviados por el frontend (MessagePack)
         negocio = session.get("negocio"); empresa = session.get("empresa")
-        payload  = _get_msgpack_payload() or {}
+        payload  = _get_payload()
         data_inv = payload.get("inventario") or []
         data_mat = payload.get("materiales")
         carro1   = payload.get("carro1")
         carro2   = payload.get("carro2")
+        validar_inventario_materiales(
+            data_inv, data_mat if negocio != "nutresa" else None, carro1, carro2
+        )
 
-        # --- 1. Insertar/validar materiales (si aplica) ------------
-        if data_mat and negocio != "nutresa":
-            with conectar() as conn:
-                with conn.cursor() as cur:
-                    cur.execute("CALL sp_cargar_materiales(%s, %s);",
-                                (json.dumps(data_mat), empresa))
-                    # Verificar si quedaron materiales sin definir
-                    cur.execute("SELECT fn_materiales_sin_definir(%s);", (empresa,))
-                    sin_def = json.loads(cur.fetchone()[0] or "[]")
-                    if sin_def:
-                        listado = ", ".join(f"{m['codigo_pro']}:{m['producto']}" for m in sin_def)
-                        raise ValueError(f"Materiales sin definir: {listado}")
-                    conn.commit()
-
-        # --- 2. Procesar inventario / generar pedidos --------------
+        # Toda la corrida usa una sola conexión; cada fase es un span
         with conectar() as conn:
             with conn.cursor() as cur:
-                cur.execute("CALL sp_etl_pedxrutaxprod_json(%s, %s, %s, %s);",
-                            (json.dumps(data_inv), empresa, carro1, carro2))
-                conn.commit()
+                # --- 1. Insertar/validar materiales (si aplica) --------
+                if data_mat and negocio != "nutresa":
+                    with span("materiales"):
+                        cur.execute("CALL sp_cargar_materiales(%s, %s);",
+                                    (json.dumps(data_mat), empresa))
+                        # Verificar si quedaron materiales sin definir
+                        sin_def = consultar_json(cur, "fn_materiales_sin_definir", empresa)
+                        if sin_def:
+                            listado = ", ".join(f"{m['codigo_pro']}:{m['producto']}" for m in sin_def)
+                            raise ValueError(f"Materiales sin definir: {listado}")
+                        conn.commit()
+
+                # --- 2. Procesar inventario / generar pedidos ----------
+                with span("etl"):
+                    cur.execute("CALL sp_etl_pedxrutaxprod_json(%s, %s, %s, %s);",
+                                (json.dumps(data_inv), empresa, carro1, carro2))
+                    cache_pedidos.notificar(cur, empresa)
+                    conn.commit()
+                    cache_pedidos.invalidar(empresa)
+                    gen = cache_descargas.generacion(empresa)
+                    gen_ped = cache_pedidos.generacion(empresa)
+
+            # --- 3. Lecturas del ZIP juntas en pipeline ----------------
+            with span("lecturas"):
+                data_rep, data_ped = obtener_varios(
+                    conn, empresa,
+                    "fn_obtener_reparticion_inventario_json",
+                    "fn_obtener_pedidos_con_pedir_json",
+                )
+            # El portal reutiliza estos datos sin volver a consultarlos
+            cache_pedidos.guardar(empresa, data_ped, gen_ped)
 
-        # --- 3. Construir el ZIP y devolverlo ----------------------
-        zip_buf = _build_zip(empresa)
+            # --- 4. Archivos por ruta: solo se regeneran los que cambiaron
+            with span("rutas"):
+                archivos_rutas = artefactos.actualizar_rutas(
+                    conn, empresa, data_ped, _archivos_ruta)
+
+        # --- 5. Construir el ZIP y devolverlo ----------------------
+        with span("zip"):
+            zip_buf = _build_zip(data_rep, data_ped, archivos_rutas)
+
+        log.info("generar-pedidos", extra={
+            "fases": {k: round(v, 3) for k, v in spans_actuales()},
+        })
         nombre  = datetime.now().strftime("formatos_%Y%m%d_%H%M.zip")
-        return send_file(zip_buf, as_attachment=True,
-                         download_name=nombre, mimetype="application/zip")
+        # Queda en la caché de descargas para GET /generar-pedidos/zip.
+        # La cabecera Server-Timing la agrega metricas.py con estos spans
+        contenido = zip_buf.getvalue()
+        path, etag = cache_descargas.guardar(empresa, "pedidos.zip", contenido, gen)
+        return cache_descargas.responder(path or contenido, etag, nombre, cache_descargas.MIME_ZIP)
     # --------- Manejo de errores ----------------------------------
+    except ValidacionError as ve:
+        return jsonify(error=str(ve), errores=ve.errores), 400
     except ValueError as ve:        
         return jsonify(error=str(ve)), 400
+    except PlazoVencido:
+        raise  # 504 en plazos.py
     except Exception:
         tb = traceback.format_exc()        
         return jsonify(error=tb), 500
 
+@generar_pedidos_bp.route("/generar-pedidos/simular", methods=["POST"])
+@login_required
+def simular():
+    """Compara escenarios carro1/carro2 sin confirmar nada ni armar el ZIP."""
+    try:
+        negocio = session.get("negocio"); empresa = session.get("empresa")
+        payload  = _get_payload()
+        data_inv = payload.get("inventario") or []
+        data_mat = payload.get("materiales") if negocio != "nutresa" else None
+        escenarios = simulacion.leer_escenarios(
+            payload.get("escenarios") or request.form.get("escenarios")
+        )
+        validar_inventario_materiales(data_inv, data_mat)
+
+        with span("escenarios"):
+            comparacion = simulacion.simular(empresa, data_inv, data_mat, escenarios)
+        log.info("simulación de carros", extra={
+            "escenarios": len(escenarios), "mejor": comparacion["mejor"],
+        })
+        return jsonify(success=True, **comparacion)
+    except ValidacionError as ve:
+        return jsonify(error=str(ve), errores=ve.errores), 400
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+    except PlazoVencido:
+        raise  # 504 en plazos.py
+    except Exception:
+        tb = traceback.format_exc()
+        return jsonify(error=tb), 500
+
+@generar_pedidos_bp.route("/generar-pedidos/zip", methods=["GET"])
+@login_required
+def descargar_zip():
+    """El ZIP de la última corrida, sin volver a correr el ETL.
+
+    Sale de la caché de descargas; si no está, se arma con lo que hay en
+    `pedxrutaxprod` y los archivos por ruta guardados. Solo lee: las rutas
+    que falten se generan en memoria y las guarda el próximo POST.
+    """
+    empresa = session.get("empresa")
+
+    def construir():
+        with conectar_lectura(empresa) as conn:
+            with span("lecturas"):
+                data_rep, data_ped = obtener_varios(
+                    conn, empresa,
+                    "fn_obtener_reparticion_inventario_json",
+                    "fn_obtener_pedidos_con_pedir_json",
+                )
+            if not data_rep and not data_ped:
+                return None
+            with span("rutas"):
+                with conn.cursor() as cur:
+                    archivos_rutas = artefactos.armar_rutas(
+                        cur, empresa, data_ped, _archivos_ruta)
+        with span("zip"):
+            return _build_zip(data_rep, data_ped, archivos_rutas).getvalue()
+
+    nombre = datetime.now().strftime("formatos_%Y%m%d_%H%M.zip")
+    resp = cache_descargas.enviar(empresa, "pedidos.zip", nombre, cache_descargas.MIME_ZIP, construir)
+    if resp is None:
+        return jsonify(error="No hay pedidos generados para la empresa."), 404
+    return resp
+
+@generar_pedidos_bp.route("/generar-pedidos/rutas", methods=["GET"])
+@login_required
+def listar_rutas():
+    """Rutas con archivos de la última corrida y el hash de sus filas."""
+    empresa = session.get("empresa")
+    with conectar_lectura(empresa) as conn:
+        with conn.cursor() as cur:
+            rutas = artefactos.listar_rutas(cur, empresa)
+    return jsonify(success=True, rutas=rutas)
+
+@generar_pedidos_bp.route("/generar-pedidos/rutas/<int:ruta>/<formato>", methods=["GET"])
+@login_required
+def descargar_ruta(ruta: int, formato: str):
+    """`pedidos_ruta_{ruta}.xlsx` o `cargue_sugerido_ruta_{ruta}.csv` sin armar el ZIP."""
+    if formato not in ("xlsx", "csv"):
+        return jsonify(error="formato debe ser xlsx o csv"), 400
+    empresa = session.get("empresa")
+    with conectar_lectura(empresa) as conn:
+        with conn.cursor() as cur:
+            archivo = artefactos.obtener_ruta(cur, empresa, ruta, formato)
+    if archivo is None:
+        return jsonify(error=f"No hay archivos generados para la ruta {ruta}"), 404
+    contenido, hash_filas = archivo
+    if formato == "xlsx":
+        nombre, mimetype = f"pedidos_ruta_{ruta}.xlsx", cache_descargas.MIME_XLSX
+    else:
+        nombre, mimetype = f"cargue_sugerido_ruta_{ruta}.csv", "text/csv"
+    # El archivo guardado solo cambia cuando cambia el hash de sus filas
+    return cache_descargas.responder(contenido, f"{hash_filas}-{formato}", nombre, mimetype)
+
 # ------------------------------------------------------------------
-# Función auxiliar: consulta datos y arma el ZIP totalmente en RAM
+# Función auxiliar: archivos de una ruta (se guardan en artefactos_rutas)
 # ------------------------------------------------------------------
-def _build_zip(empresa: int) -> BytesIO:
-    with conectar() as conn:
-        with conn.cursor() as cur:
-            # 1) JSON con repartición de inventario
-            cur.execute("SELECT fn_obtener_reparticion_inventario_json(%s);", (empresa,))
-            raw_rep = cur.fetchone()[0]
-            data_rep = json.loads(raw_rep) if isinstance(raw_rep, str) else (raw_rep or [])
+def _archivos_ruta(ruta: int, filas: list) -> tuple:
+    """(`pedidos_ruta_{ruta}.xlsx`, `cargue_sugerido_ruta_{ruta}.csv`) en bytes."""
+    import pandas as pd
+
+    df = pd.DataFrame(filas, columns=["codigo_pro", "producto", "pedir"])
+    df.insert(2, "UN", "UN")
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as xlsx:
+        df.to_excel(xlsx, index=False, startrow=3, sheet_name=f"Ruta_{ruta}")
 
-            # 2) JSON con pedidos por ruta
-            cur.execute("SELECT fn_obtener_pedidos_con_pedir_json(%s);", (empresa,))
-            raw_ped = cur.fetchone()[0]
-            data_ped = json.loads(raw_ped) if isinstance(raw_ped, str) else (raw_ped or [])
+    # CSV con estructura similar a consolidar_compras
+    csv_df = pd.DataFrame({
+        "bodega": ["01"] * len(df),
+        "codigo_producto": df["codigo_pro"],
+        "cantidad": df["pedir"],
+        "costo": 0
+    })
+    return buf.getvalue(), csv_df.to_csv(index=False).encode("utf-8")
 
-    # 3) Crear ZIP en memoria
+# ------------------------------------------------------------------
+# Función auxiliar: arma el ZIP totalmente en RAM
+# ------------------------------------------------------------------
+def _build_zip(data_rep: list, data_ped: list, archivos_rutas: dict) -> BytesIO:
+    # data_rep: fn_obtener_reparticion_inventario_json
+    # data_ped: fn_obtener_pedidos_con_pedir_json
+    # archivos_rutas: {ruta: (xlsx, csv)} de artefactos.actualizar_rutas
+    import pandas as pd
+
+    # Crear ZIP en memoria
     zip_buf = BytesIO()
     with zipfile.ZipFile(zip_buf, "w") as zf:
         # ---- Hoja única de repartición ---------------------------
@@ -93,37 +264,20 @@ def _build_zip(empresa: int) -> BytesIO:
                 df_rep = pd.DataFrame(columns=rep_cols)
         else:
                 df_rep = pd.DataFrame(data_rep)[rep_cols]
-        buf = BytesIO()
-        df_rep.to_excel(buf, index=False, sheet_name="Reparticion", engine="openpyxl")
-        buf.seek(0); zf.writestr("reparticion_inventario.xlsx", buf.read())
-
-        # ---- Un .xlsx y un .csv por cada ruta --------------------
-        csv_acumulado = []
-        for ruta in sorted({r["ruta"] for r in data_ped}):
-            df = pd.DataFrame(
-                [r for r in data_ped if r["ruta"] == ruta],
-                columns=["codigo_pro", "producto", "pedir"])
-            df.insert(2, "UN", "UN")
+        with span("reparticion"):
             buf = BytesIO()
-            with pd.ExcelWriter(buf, engine="openpyxl") as xlsx:
-                df.to_excel(xlsx, index=False, startrow=3, sheet_name=f"Ruta_{ruta}")
-            buf.seek(0)
-            zf.writestr(f"pedidos_ruta_{ruta}.xlsx", buf.read())
-
-            # CSV con estructura similar a consolidar_compras
-            csv_df = pd.DataFrame({
-                "bodega": ["01"] * len(df),
-                "codigo_producto": df["codigo_pro"],
-                "cantidad": df["pedir"],
-                "costo": 0
-            })
-            zf.writestr(f"cargue_sugerido_ruta_{ruta}.csv",
-                        csv_df.to_csv(index=False))
-            csv_acumulado.append(csv_df)
+            df_rep.to_excel(buf, index=False, sheet_name="Reparticion", engine="openpyxl")
+            buf.seek(0); zf.writestr("reparticion_inventario.xlsx", buf.read())
+
+        # ---- Un .xlsx y un .csv por cada ruta (artefactos.py) -----
+        for ruta, (xlsx, csv) in archivos_rutas.items():
+            zf.writestr(f"pedidos_ruta_{ruta}.xlsx", xlsx)
+            zf.writestr(f"cargue_sugerido_ruta_{ruta}.csv", csv)
 
         # CSV consolidado de todas las rutas
-        if csv_acumulado:
-            total_df = pd.concat(csv_acumulado, ignore_index=True)
+        if data_ped:
+            total_df = pd.DataFrame(data_ped, columns=["codigo_pro", "pedir"]).rename(
+                columns={"codigo_pro": "codigo_producto", "pedir": "cantidad"})
             total_df = (
                 total_df.groupby("codigo_producto", as_index=False)["cantidad"].sum()
             )
@@ -0,0 +1,327 @@
+"""Lectura en el servidor de los Excel/CSV que hoy se procesan con SheetJS.
+
+Replica la normalización de encabezados y filas de `templates/upload.html`
+y `templates/generar_pedidos.html` para que el payload resultante sea el
+mismo que envía el navegador en MessagePack.
+"""
+
+import csv
+import io
+import re
+import unicodedata
+from datetime import date, datetime, time
+from typing import Any, Dict, Iterator, List, Optional
+
+# ---- Pedidos / rutas (upload.html) ---------------------------------------
+PED_HEADERS = [
+    "numero_pedido", "cliente", "nombre", "barrio", "ciudad", "asesor",
+    "codigo_pideky", "codigo_pro", "producto", "cantidad", "valor",
+    "tipo_pro", "estado",
+]
+RUT_HEADERS = ["codigo_cliente", "codigo_ruta"]
+DIAS_VALIDOS = ["LU", "MA", "MI", "JU", "VI", "SA", "DO"]
+ESTADOS_VALIDOS = {"Sin Descargar", "Sin facturar"}
+# Fila de la hoja original (la de encabezados es la 1). Solo sirve para los
+# mensajes de `validacion.py`; `sin_fila` la quita antes del ETL y del hash
+CAMPO_FILA = "_fila"
+
+# mapas sinónimos → canónico
+PED_COL_MAP = {
+    "Pedido": "numero_pedido",
+    "numerodocPedido": "numero_pedido",
+    "Cliente": "cliente",
+    "codCliente": "cliente",
+    "R. Social": "nombre",
+    "razonSocial": "nombre",
+    "Barrio": "barrio",
+    "Ciudad": "ciudad",
+    "Asesor": "asesor",
+    "codVendedor": "asesor",
+    "Codigo Pideky": "codigo_pideky",
+    "Código Pideky": "codigo_pideky",
+    "Pedidos Pideky": "codigo_pideky",
+    "Cod.Prod": "codigo_pro",
+    "codProducto": "codigo_pro",
+    "Producto": "producto",
+    "Cantidad": "cantidad",
+    "Total": "valor",
+    "ventaNeta": "valor",
+    "Tip Pro": "tipo_pro",
+    "Estado": "estado",
+    "Est": "estado",
+}
+RUT_COL_MAP = {
+    "Cod. Cliente": "codigo_cliente",
+    "Código CW": "codigo_cliente",
+    "Ruta": "codigo_ruta",
+    "Descripción Ruta": "codigo_ruta",
+}
+
+# ---- Materiales / inventario (generar_pedidos.html) ----------------------
+GEN_HEADERS = {
+    "materiales": ["pro_codigo", "particion", "pq_x_caja"],
+    "inventario": ["codigo", "stock"],
+}
+GEN_COL_MATERIALES = {
+    "pro_codigo": ["Codigo SAP", "Codigo"],
+    "particion": ["Particion"],
+    "pq_x_caja": ["Unidades x caja", "UnidadCaja"],
+}
+GEN_COL_INVENTARIO = {
+    "codigo": ["Codigo articulo", "Cod Producto"],
+    "stock": ["Unidades", "Unidades Disponibles"],
+}
+MAT_COL_MAP = {s.lower(): c for c, sin in GEN_COL_MATERIALES.items() for s in sin}
+INV_COL_MAP = {s.lower(): c for c, sin in GEN_COL_INVENTARIO.items() for s in sin}
+
+_NUMERO_INICIAL = re.compile(r"^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+_ESPACIOS_UNICODE = re.compile("[\u00A0\u1680\u2000-\u200A\u202F\u205F\u3000]")
+_CONTROLES = re.compile("[\x00-\x1F\x7F]")
+
+
+# ------------------------------------------------------------------
+# Lectura genérica de la primera hoja (xlsx) o del CSV
+# ------------------------------------------------------------------
+def _celda(v: Any) -> Any:
+    if isinstance(v, (datetime, date, time)):
+        return v.isoformat()
+    return v
+
+
+def _leer_filas(archivo) -> Iterator[List[Any]]:
+    """Itera las filas de la primera hoja sin cargar el libro completo."""
+    nombre = (getattr(archivo, "filename", "") or "").lower()
+    stream = getattr(archivo, "stream", archivo)
+
+    if nombre.endswith(".csv"):
+        texto = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        muestra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        for fila in csv.reader(texto, dialecto):
+            yield [v if v != "" else None for v in fila]
+        return
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        for fila in ws.iter_rows(values_only=True):
+            yield [_celda(v) for v in fila]
+    finally:
+        wb.close()
+
+
+def _vacia(v: Any) -> bool:
+    return v is None or str(v).strip() == ""
+
+
+def _check(encabezados: List[str], esperados: List[str]):
+    vistos, dup = set(), []
+    for h in encabezados:
+        if h in vistos and h not in dup:
+            dup.append(h)
+        vistos.add(h)
+    falt = [e for e in esperados if e not in vistos]
+    return dup, falt
+
+
+def _errores_encabezados(nombre: str, encabezados: List[str], esperados: List[str]) -> List[str]:
+    dup, falt = _check(encabezados, esperados)
+    errores = []
+    if dup:
+        errores.append(f"Duplicadas en {nombre}: " + ", ".join(dup))
+    if falt:
+        errores.append(f"Faltan en {nombre}: " + ", ".join(falt))
+    return errores
+
+
+def _a_entero(v: Any, defecto: str) -> Optional[int]:
+    """Equivalente a parseInt(parseFloat(v)) con valor por defecto si viene vacío."""
+    texto = str(v if v is not None else "").strip() or defecto
+    m = _NUMERO_INICIAL.match(texto)
+    if not m:
+        return None
+    return int(float(m.group(0)))
+
+
+def _a_decimal(v: Any) -> Optional[float]:
+    """parseFloat tras quitar todo lo que no sea dígito, punto o signo."""
+    limpio = re.sub(r"[^0-9.-]", "", str(v)) or "0"
+    m = _NUMERO_INICIAL.match(limpio)
+    return float(m.group(0)) if m else None
+
+
+def sanitizar_nombre(valor: Any) -> str:
+    """Quita BOM, espacios raros, controles y diacríticos (sanitizeName en JS)."""
+    if valor is None:
+        return ""
+    texto = str(valor).replace("\uFEFF", "")
+    texto = _ESPACIOS_UNICODE.sub(" ", texto)
+    texto = _CONTROLES.sub("", texto).strip()
+    try:
+        # Corrige textos UTF-8 leídos como latin-1 (decodeURIComponent(escape()))
+        texto = texto.encode("latin-1").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        pass
+    texto = unicodedata.normalize("NFD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return unicodedata.normalize("NFC", texto)
+
+
+# ------------------------------------------------------------------
+# Pedidos y rutas
+# ------------------------------------------------------------------
+def leer_pedidos(archivo) -> List[Dict[str, Any]]:
+    """Lee el Excel de pedidos y devuelve las filas canónicas filtradas por estado."""
+    filas = _leer_filas(archivo)
+    encabezado = next(filas, None)
+    if not encabezado:
+        raise ValueError("El Excel de pedidos está vacío")
+
+    # Columnas con encabezado no vacío
+    cols = [i for i, h in enumerate(encabezado) if not _vacia(h)]
+    norm = [PED_COL_MAP.get(str(encabezado[i]).strip(), str(encabezado[i]).strip()) for i in cols]
+
+    # Validación de cabeceras (misma regla que reactiveValidate)
+    a_validar = norm + ([] if "tipo_pro" in norm else ["tipo_pro"])
+    while a_validar.count("valor") > 1:
+        a_validar.remove("valor")
+    errores = _errores_encabezados("pedidos", a_validar, PED_HEADERS)
+    if errores:
+        raise ValueError("; ".join(errores))
+
+    idx_tipo = norm.index("tipo_pro") if "tipo_pro" in norm else None
+    data = []
+    for n, vals in enumerate(filas, start=2):
+        vals = [vals[i] if i < len(vals) else None for i in cols]
+        if all(_vacia(v) for v in vals):
+            continue
+        o = {CAMPO_FILA: n}
+        for hdr, val in zip(norm, vals):
+            if hdr in PED_HEADERS and hdr != "tipo_pro":
+                if hdr == "codigo_pideky" and val is not None:
+                    val = str(val)
+                o[hdr] = val
+        o["tipo_pro"] = vals[idx_tipo] if idx_tipo is not None else "N"
+        data.append(o)
+
+    # Relleno hacia ↑ y ↓ de nombre/barrio/ciudad por cliente
+    if any(not r.get("nombre") for r in data):
+        grupos: Dict[Any, List[Dict[str, Any]]] = {}
+        for r in data:
+            grupos.setdefault(r.get("cliente"), []).append(r)
+        for arr in grupos.values():
+            for orden in (arr, reversed(arr)):
+                ultimo = {}
+                for f in orden:
+                    for campo in ("nombre", "barrio", "ciudad"):
+                        if f.get(campo):
+                            ultimo[campo] = f[campo]
+                        else:
+                            f[campo] = ultimo.get(campo)
+
+    for r in data:
+        r["nombre"] = sanitizar_nombre(r.get("nombre"))
+        r["barrio"] = sanitizar_nombre(r.get("barrio"))
+
+    return [r for r in data if r.get("estado") in ESTADOS_VALIDOS]
+
+
+def leer_rutas(archivo, dia: str) -> List[Dict[str, Any]]:
+    """Lee el Excel de rutas y devuelve solo las del día indicado."""
+    filas = _leer_filas(archivo)
+    encabezado = next(filas, None)
+    if not encabezado:
+        raise ValueError("El Excel de rutas está vacío")
+
+    norm = [RUT_COL_MAP.get(str(h or "").strip(), str(h or "").strip()) for h in encabezado]
+    errores = _errores_encabezados("rutas", norm, RUT_HEADERS)
+    if errores:
+        raise ValueError("; ".join(errores))
+
+    rutas = []
+    for n, vals in enumerate(filas, start=2):
+        o = {hdr: val for hdr, val in zip(norm, vals) if hdr in RUT_HEADERS}
+        codigo_ruta = o.get("codigo_ruta")
+        if isinstance(codigo_ruta, str) and dia in codigo_ruta:
+            o[CAMPO_FILA] = n
+            rutas.append(o)
+    return rutas
+
+
+def sin_fila(filas: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+    """Copia de las filas sin `CAMPO_FILA`, como las espera el SP."""
+    if filas is None:
+        return None
+    return [{k: v for k, v in f.items() if k != CAMPO_FILA} for f in filas]
+
+
+# ------------------------------------------------------------------
+# Inventario y materiales
+# ------------------------------------------------------------------
+def _leer_registros(archivo):
+    """Filas como dicts por encabezado, sin la columna 'Estado' (stripEstado)."""
+    filas = _leer_filas(archivo)
+    encabezado = next(filas, None) or []
+    claves = ["" if h is None else str(h) for h in encabezado]
+    quitar = {i for i, k in enumerate(claves) if k.strip().lower() == "estado"}
+    claves_ok = [(i, k) for i, k in enumerate(claves) if i not in quitar]
+
+    registros = []
+    for vals in filas:
+        if all(_vacia(v) for v in vals):
+            continue
+        registros.append({k: (vals[i] if i < len(vals) and vals[i] is not None else "") for i, k in claves_ok})
+    return [k for _, k in claves_ok], registros
+
+
+def _canonicas(registros, mapa, necesarias) -> List[Dict[str, Any]]:
+    salida = []
+    for r in registros:
+        o = {}
+        for k, v in r.items():
+            canon = mapa.get(k.strip().lower())
+            if canon and canon in necesarias:
+                o[canon] = v
+        salida.append(o)
+    return salida
+
+
+def leer_inventario(archivo) -> List[Dict[str, Any]]:
+    """Lee el inventario, descarta filas sin valor de compra y normaliza `stock`."""
+    claves, registros = _leer_registros(archivo)
+    norm = [INV_COL_MAP.get(k.strip().lower(), k.strip().lower()) for k in claves]
+    errores = _errores_encabezados("inventario", [h for h in norm if h], GEN_HEADERS["inventario"])
+    if errores:
+        raise ValueError("; ".join(errores))
+
+    vlr = next((k for k in claves if k.strip().lower() == "vlr compra con iva"), None)
+    if vlr:
+        registros = [
+            r for r in registros
+            if (_a_decimal(r.get(vlr)) or 0) > 0
+        ]
+    filas = _canonicas(registros, INV_COL_MAP, GEN_HEADERS["inventario"])
+    for r in filas:
+        r["stock"] = _a_entero(r.get("stock"), "0")
+    return filas
+
+
+def leer_materiales(archivo) -> List[Dict[str, Any]]:
+    """Lee materiales y pone 1 en particion/pq_x_caja cuando vienen vacíos."""
+    claves, registros = _leer_registros(archivo)
+    norm = [MAT_COL_MAP.get(k.strip().lower(), k.strip().lower()) for k in claves]
+    errores = _errores_encabezados("materiales", [h for h in norm if h], GEN_HEADERS["materiales"])
+    if errores:
+        raise ValueError("; ".join(errores))
+
+    filas = _canonicas(registros, MAT_COL_MAP, GEN_HEADERS["materiales"])
+    for r in filas:
+        for c in ("particion", "pq_x_caja"):
+            r[c] = _a_entero(r.get(c), "1")
+    return filas
@@ -0,0 +1,170 @@
+"""Simulación de escenarios carro1/carro2 para generar pedidos.
+
+Cada escenario corre `sp_etl_pedxrutaxprod_json` en su propia conexión y
+transacción, que se revierte al final: nada queda escrito y no se arma el
+ZIP. Para que los escenarios corran en paralelo sin bloquearse entre sí
+(el ETL borra e inserta las filas de la empresa), cada uno trabaja sobre
+un `bd` sintético (`<empresa>~s<id>`, ver `bd_simulado`) con una copia, dentro de la
+misma transacción, de las filas de la empresa en `SIMULAR_TABLAS`.
+
+El escenario elegido se exporta después con el POST normal a
+/generar-pedidos.
+"""
+
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg import sql
+
+import db
+from plazos import PlazoVencido
+from registro import get_logger
+from views.validacion import ValidacionError
+
+log = get_logger(__name__)
+
+MAX_ESCENARIOS = int(os.getenv("SIMULAR_MAX_ESCENARIOS", "6"))
+# Cada escenario ocupa una conexión; con pool se deja la mitad para el resto
+PARALELO = int(os.getenv(
+    "SIMULAR_PARALELO", str(max(1, db.DB_POOL_MAX // 2) if db.DB_POOL else 3)
+))
+# Tablas que `sp_etl_pedxrutaxprod_json` lee por `bd` sin reescribirlas (ver
+# MEMPRY FACT): los pedidos ya con ruta y las particiones de `materiales`.
+# `inventario` y `pedxrutaxprod` las vacía y llena el propio ETL.
+SIMULAR_TABLAS = tuple(
+    t.strip() for t in os.getenv("SIMULAR_TABLAS", "pedxclixprod,materiales").split(",")
+    if t.strip()
+)
+
+_SQL_RUTAS = """
+    SELECT ruta,
+           SUM(cantidad)::BIGINT AS cantidad,
+           SUM(inv)::BIGINT AS asignado,
+           SUM(pedir)::BIGINT AS pedir,
+           SUM(GREATEST(cantidad - inv, 0))::BIGINT AS sin_cubrir,
+           COUNT(*) AS productos
+    FROM pedxrutaxprod
+    WHERE bd = %s
+    GROUP BY ruta
+    ORDER BY ruta
+"""
+
+Escenario = Tuple[Optional[int], Optional[int]]
+
+# Todas las columnas `bd` del esquema son VARCHAR(25)
+BD_MAX = 25
+_SUFIJO_SIM = "~s"  # `~` no aparece en los nombres de empresa (salen del dominio del correo)
+
+
+def bd_simulado(empresa: str) -> str:
+    """`bd` único de un escenario: la empresa recortada más `~s` y 8 hex."""
+    sufijo = _SUFIJO_SIM + uuid.uuid4().hex[:8]
+    bd_sim = empresa[:BD_MAX - len(sufijo)] + sufijo
+    assert len(bd_sim) <= BD_MAX
+    return bd_sim
+
+
+def leer_escenarios(valor: Any) -> List[Escenario]:
+    """Normaliza `[[c1, c2], {"carro1": .., "carro2": ..}, ...]`; lanza ValidacionError."""
+    if isinstance(valor, str):
+        try:
+            valor = json.loads(valor)
+        except ValueError:
+            raise ValidacionError(["escenarios debe ser una lista JSON"])
+    if not isinstance(valor, list) or not valor:
+        raise ValidacionError(["Indica al menos un escenario"])
+    if len(valor) > MAX_ESCENARIOS:
+        raise ValidacionError([f"Máximo {MAX_ESCENARIOS} escenarios por simulación"])
+
+    errores: List[str] = []
+    escenarios: List[Escenario] = []
+    for i, esc in enumerate(valor, start=1):
+        par = (esc.get("carro1"), esc.get("carro2")) if isinstance(esc, dict) else tuple(esc or ())[:2]
+        par = tuple(par) + (None,) * (2 - len(par))
+        carros = []
+        for nombre, carro in zip(("carro1", "carro2"), par):
+            if carro in (None, ""):
+                carros.append(None)
+            elif re.fullmatch(r"\d+", str(carro)):
+                carros.append(int(carro))
+            else:
+                errores.append(f"Escenario {i}: {nombre} debe ser un número de ruta")
+        escenarios.append(tuple(carros))
+    if errores:
+        raise ValidacionError(errores)
+    # Sin repetidos, en el orden recibido
+    return list(dict.fromkeys(escenarios))
+
+
+def _copiar_empresa(cur, empresa: str, bd_sim: str) -> None:
+    for tabla in SIMULAR_TABLAS:
+        cur.execute(
+            sql.SQL(
+                "INSERT INTO {t} SELECT (jsonb_populate_record(NULL::{t}, "
+                "to_jsonb(x) || jsonb_build_object('bd', %s))).* FROM {t} x WHERE bd = %s"
+            ).format(t=sql.Identifier(tabla)),
+            (bd_sim, empresa),
+        )
+
+
+def _simular(escenario: Escenario, empresa: str, inventario: str,
+             materiales: Optional[str]) -> Dict[str, Any]:
+    carro1, carro2 = escenario
+    bd_sim = bd_simulado(empresa)
+    t0 = time.perf_counter()
+    resultado: Dict[str, Any] = {"carro1": carro1, "carro2": carro2}
+    try:
+        with db.conectar() as conn:
+            try:
+                with conn.cursor() as cur:
+                    _copiar_empresa(cur, empresa, bd_sim)
+                    if materiales is not None:
+                        cur.execute("CALL sp_cargar_materiales(%s, %s);", (materiales, bd_sim))
+                        sin_def = db.consultar_json(cur, "fn_materiales_sin_definir", bd_sim)
+                        if sin_def:
+                            listado = ", ".join(f"{m['codigo_pro']}:{m['producto']}" for m in sin_def)
+                            raise ValueError(f"Materiales sin definir: {listado}")
+                    cur.execute("CALL sp_etl_pedxrutaxprod_json(%s, %s, %s, %s);",
+                                (inventario, bd_sim, carro1, carro2))
+                    rutas = db.consultar_filas(cur, _SQL_RUTAS, (bd_sim,))
+            finally:
+                conn.rollback()  # la simulación nunca se confirma
+    except PlazoVencido:
+        raise
+    except Exception as e:
+        diag = getattr(e, "diag", None)
+        resultado["error"] = diag.message_primary if diag and diag.message_primary else str(e)
+        log.warning("escenario fallido", extra={"carro1": carro1, "carro2": carro2, "error": resultado["error"]})
+        return resultado
+
+    totales = {k: sum(r[k] or 0 for r in rutas) for k in ("cantidad", "asignado", "pedir", "sin_cubrir")}
+    totales["rutas"] = len(rutas)
+    resultado.update(totales=totales, rutas=rutas, duracion=round(time.perf_counter() - t0, 3))
+    return resultado
+
+
+def simular(empresa: str, inventario: List[Dict[str, Any]], materiales: Optional[List[Dict[str, Any]]],
+            escenarios: List[Escenario]) -> Dict[str, Any]:
+    """Corre los escenarios en paralelo y devuelve la comparación."""
+    inv_json = json.dumps(inventario)
+    mat_json = json.dumps(materiales) if materiales else None
+    with ThreadPoolExecutor(max_workers=min(PARALELO, len(escenarios)),
+                            thread_name_prefix="simular") as pool:
+        # Cada hilo hereda el contexto de la petición: plazo, métricas y diagnóstico
+        futuros = [
+            pool.submit(copy_context().run, _simular, esc, empresa, inv_json, mat_json)
+            for esc in escenarios
+        ]
+        resultados = [f.result() for f in futuros]
+
+    validos = [i for i, r in enumerate(resultados) if "error" not in r]
+    # Más unidades asignadas; a igualdad, menos demanda sin cubrir
+    mejor = max(validos, key=lambda i: (resultados[i]["totales"]["asignado"],
+                                         -resultados[i]["totales"]["sin_cubrir"]), default=None)
+    return {"escenarios": resultados, "mejor": mejor}
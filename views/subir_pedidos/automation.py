@@ -1,11 +1,17 @@
-"""Funciones de automatización basadas en Playwright."""
+"""Funciones de automatización basadas en Playwright.
+
+Playwright se importa dentro de las funciones: cargarlo con la app sumaba
+tiempo de arranque y memoria a cada worker aunque nunca abriera el navegador.
+"""
 
 import time
 from datetime import date
 from contextlib import contextmanager
 from typing import Any, Callable, Dict, List, Optional
-from playwright.sync_api import TimeoutError as PWTimeout
-from playwright.sync_api import sync_playwright
+
+from registro import get_logger
+
+log = get_logger(__name__)
 
 def _set_react_value(page, selector: str, value: str) -> None:
     """Escribe en un campo HTML disparando eventos de React."""
@@ -69,6 +75,7 @@ def _esperar_resultado(
 @contextmanager
 def iniciar_navegador(*, headless: bool = True):
     """Inicializa y entrega un contexto de navegador listo para usar."""
+    from playwright.sync_api import sync_playwright
 
     with sync_playwright() as playwright:
         browser = playwright.chromium.launch(
@@ -107,6 +114,7 @@ def ejecutar_flujo_playwright(
     espera_resultado_ms: int = 20_000,
 ) -> bool:
     """Ejecuta un flujo de Playwright definido por pasos."""
+    from playwright.sync_api import TimeoutError as PWTimeout
 
     try:
         with iniciar_navegador(headless=headless) as context:
@@ -158,8 +166,10 @@ def ejecutar_flujo_en_pagina(
         page.wait_for_selector(selector, timeout=step_timeout_ms)
 
     _emit(f"{nombre_flujo} - Navegador listo")
+    t_flujo = time.perf_counter()
 
     for paso in pasos:
+        t_paso = time.perf_counter()
         nombre_paso = paso.get("nombre", "Paso sin nombre")
         tipo = str(paso.get("tipo", "")).strip().lower()
         selector = paso.get("selector")
@@ -251,12 +261,22 @@ def ejecutar_flujo_en_pagina(
                 "'campo', 'campo de seleccion' o 'archivo'"
             )
 
+        log.debug("paso de playwright", extra={
+            "flujo": nombre_flujo, "paso": nombre_paso, "tipo": tipo,
+            "duracion": round(time.perf_counter() - t_paso, 3),
+        })
+
     resultado = _esperar_resultado(
         page,
         selector_exito=selector_exito,
         selector_error=selector_error,
         total_timeout_ms=espera_resultado_ms,
     )
+    log.info("flujo de playwright terminado", extra={
+        "flujo": nombre_flujo,
+        "resultado": {True: "ok", False: "error", None: "sin_respuesta"}[resultado],
+        "duracion": round(time.perf_counter() - t_flujo, 3),
+    })
 
     if resultado is None:
         return False
@@ -1,41 +1,45 @@
 """Rutas HTTP para gestionar la vista de subir pedidos."""
 
-import json
 import traceback
 from typing import Any, Dict, List
 
 from flask import jsonify, render_template, request, session
-from openpyxl import Workbook
 
-from db import conectar
+from db import conectar_lectura, obtener_datos
+from registro import get_logger, muestreado
+from views import cache_pedidos
 from views.auth import login_required
 
 from . import subir_pedidos_bp
 from .automation import cargar_pedido_masivo_excel, iniciar_navegador, login_portal_grupo_nutresa
 from .vehiculos import (
     PLACA_MAX_LEN,
-    add_ruta,
+    add_rutas,
     delete_ruta,
-    ensure_table,
     get_vehiculos,
     upsert_vehiculo,
+    upsert_vehiculos,
 )
 
+log = get_logger(__name__)
 
-def log_pedidos_rutas(empresa: str) -> Dict[str, Any]:
-    with conectar() as conn:
+
+def _leer_pedidos_con_pedir(empresa: str) -> List[Dict[str, Any]]:
+    with conectar_lectura(empresa) as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT fn_obtener_pedidos_con_pedir_json(%s);", (empresa,))
-            raw_ped = cur.fetchone()[0]
+            return obtener_datos(cur, "fn_obtener_pedidos_con_pedir_json", empresa)
+
+
+def log_pedidos_rutas(empresa: str) -> Dict[str, Any]:
+    # Normalmente ya quedó en caché al generar los pedidos
+    data_ped = cache_pedidos.obtener(empresa, lambda: _leer_pedidos_con_pedir(empresa))
 
-    data_ped = json.loads(raw_ped) if isinstance(raw_ped, str) else (raw_ped or [])
     rutas_unicas = sorted(
         {p.get("ruta") for p in data_ped if p.get("ruta") not in (None, "", "null")},
         key=lambda x: str(x),
     )
 
     # Traer placas desde tabla vehiculos
-    ensure_table()
     vehiculos = get_vehiculos(empresa)
 
     placas_por_ruta = {}
@@ -66,11 +70,9 @@ def log_pedidos_rutas(empresa: str) -> Dict[str, Any]:
         placa = (placas_por_ruta.get(r_key) or r_key)
         rutas_con_placa.append({"ruta": r, "placa": placa})
 
-    print(
-        f"[PEDIDOS] empresa={empresa} total_rutas={len(rutas_unicas)} "
-        f"rutas={json.dumps(rutas_con_placa, ensure_ascii=False)}",
-        flush=True,
-    )
+    log.info("rutas con pedidos", extra={"empresa": empresa, "total_rutas": len(rutas_unicas)})
+    # La lista completa solo en una muestra de llamadas (LOG_MUESTREO)
+    muestreado(log, "rutas con placa", lambda: rutas_con_placa, empresa=empresa)
 
     return {
         "rutas_con_placa": rutas_con_placa,
@@ -93,7 +95,6 @@ def _get_bd() -> str:
 def subir_pedidos_index():
     """Pantalla principal para consultar y editar placas."""
 
-    ensure_table()
     bd = _get_bd()
     vehiculos = get_vehiculos(bd)
     return render_template(
@@ -117,15 +118,38 @@ def guardar_placa():
         return jsonify(success=False, error=str(e)), 400
 
 
+@subir_pedidos_bp.route("/vehiculos/placas", methods=["POST"])
+@login_required
+def guardar_placas():
+    """Guarda en lote las placas editadas y devuelve qué cambió."""
+
+    try:
+        data = request.get_json() or {}
+        bd = _get_bd()
+        placas: Dict[int, str] = {}
+        # Si una ruta viene repetida gana la última edición
+        for item in data.get("placas") or []:
+            placas[int(item.get("ruta"))] = str(item.get("placa") or "")
+        if not placas:
+            return jsonify(success=True, data={"creadas": [], "actualizadas": [], "sin_cambios": []})
+        diff = upsert_vehiculos(bd, placas)
+        return jsonify(success=True, data=diff)
+    except Exception as e:
+        return jsonify(success=False, error=str(e)), 400
+
+
 @subir_pedidos_bp.route("/vehiculos/add", methods=["POST"])
 @login_required
 def agregar_ruta():
-    """Crea una nueva ruta vacía y la devuelve al cliente."""
+    """Crea una o varias rutas vacías (`cantidad`) y las devuelve al cliente."""
 
     try:
+        data = request.get_json(silent=True) or {}
         bd = _get_bd()
-        nuevo = add_ruta(bd)
-        return jsonify(success=True, data=nuevo)
+        cantidad = int(data.get("cantidad", 1))
+        nuevas = add_rutas(bd, cantidad)
+        # `data` conserva la forma anterior (la primera ruta creada)
+        return jsonify(success=True, data=nuevas[0], rutas=nuevas)
     except Exception as e:
         return jsonify(success=False, error=str(e)), 400
 
@@ -165,7 +189,7 @@ def probar_login_portal():
         avances_ui: List[str] = []
 
         def _log_debug(msg: str) -> None:
-            print(msg, flush=True)
+            log.info(msg)
 
         def _ui(msg: str) -> None:
             avances_ui.append(msg)
@@ -173,7 +197,7 @@ def probar_login_portal():
         try:
             info = log_pedidos_rutas(bd)
         except Exception as e:
-            print(f"WARN [PEDIDOS] {e}", flush=True)
+            log.warning("no se pudieron leer las rutas con pedidos", extra={"error": str(e)})
             info = {"rutas_con_placa": [], "data_ped": [], "total_rutas": 0}
 
         rutas_con_placa = info.get("rutas_con_placa") or []
@@ -200,6 +224,8 @@ def probar_login_portal():
         ruta_fallo = None
         placa_fallo = None
 
+        from openpyxl import Workbook
+
         with iniciar_navegador() as context:
             page_login = context.new_page()
             try:
@@ -265,8 +291,8 @@ def probar_login_portal():
                         del ws
                         del wb
                     except Exception:
-                        tb = traceback.format_exc()
-                        print(f"ERROR al crear Excel de pedidos\n{tb}", flush=True)
+                        log.exception("error al crear el Excel de pedidos",
+                                      extra={"ruta": ruta_placa.get("ruta")})
                         _log_debug(
                             f"Ruta {ruta_placa.get('ruta')} placa={ruta_placa.get('placa')}: falló la carga"
                         )
@@ -323,7 +349,7 @@ def probar_login_portal():
                                 pass
                     except Exception:
                         tb = traceback.format_exc()
-                        print(f"ERROR al cargar pedidos\n{tb}", flush=True)
+                        log.exception("error al cargar pedidos", extra={"ruta": ruta_placa.get("ruta")})
                         _log_debug(
                             f"Ruta {ruta_placa.get('ruta')} placa={ruta_placa.get('placa')}: falló la carga ({tb.strip()})"
                         )
@@ -362,7 +388,7 @@ def probar_login_portal():
         return jsonify(success=ok, message=message, avances=avances_ui)
     except Exception as e:
         tb = traceback.format_exc()
-        print("ERROR PLAYWRIGHT LOGIN+CARGA\n", tb)
+        log.exception("error en login y carga del portal")
         return jsonify(
             success=False,
             message="Error al ejecutar la automatización",
@@ -1,44 +1,26 @@
-"""Operaciones de base de datos para rutas y placas de vehículos."""
+"""Operaciones de base de datos para rutas y placas de vehículos.
 
-from db import conectar
-
-PLACA_MAX_LEN = 17
+La tabla `vehiculos` la crea `migraciones.py`.
+"""
 
+from typing import Dict, List
 
-def ensure_table() -> None:
-    """Crea la tabla `vehiculos` si aún no existe."""
+from psycopg.errors import UniqueViolation
 
-    with conectar() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                f"""
-                CREATE TABLE IF NOT EXISTS vehiculos (
-                    bd   TEXT NOT NULL,
-                    ruta INTEGER NOT NULL,
-                    placa VARCHAR({PLACA_MAX_LEN}) NOT NULL DEFAULT '',
-                    PRIMARY KEY (bd, ruta)
-                );
-                """
-            )
-            cur.execute(
-                """
-                SELECT character_maximum_length
-                FROM information_schema.columns
-                WHERE table_name='vehiculos' AND column_name='placa' AND table_schema='public'
-                """
-            )
-            current_len = cur.fetchone()
-            current_len = current_len[0] if current_len else None
+from db import conectar
 
-            if current_len is None or current_len < PLACA_MAX_LEN:
-                cur.execute(
-                    f"ALTER TABLE vehiculos ALTER COLUMN placa TYPE VARCHAR({PLACA_MAX_LEN});"
-                )
-            conn.commit()
+# Debe coincidir con vehiculos.placa (ver migraciones.py)
+PLACA_MAX_LEN = 17
+MAX_RUTAS_POR_LOTE = 500
+INTENTOS_ADD_RUTA = 5
 
 
 def get_vehiculos(bd: str):
-    """Devuelve todas las rutas y placas registradas para una empresa."""
+    """Devuelve todas las rutas y placas registradas para una empresa.
+
+    Lee del primario: las placas las escribe cualquier worker y una lectura
+    de la réplica podría no ver el cambio recién guardado.
+    """
 
     with conectar() as conn:
         with conn.cursor() as cur:
@@ -70,19 +52,85 @@ def upsert_vehiculo(bd: str, ruta: int, placa: str) -> None:
             conn.commit()
 
 
-def add_ruta(bd: str):
-    """Crea una nueva ruta vacía y la devuelve."""
+def upsert_vehiculos(bd: str, placas: Dict[int, str]) -> Dict[str, list]:
+    """Aplica toda la tabla ruta→placa en una sola sentencia y devuelve el diff.
+
+    Solo se escriben las filas nuevas o con placa distinta; `previas` se lee
+    con el mismo snapshot del INSERT, así que trae la placa anterior.
+    """
 
+    rutas = list(placas)
+    valores = [(placas[r] or "")[:PLACA_MAX_LEN] for r in rutas]
     with conectar() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT COALESCE(MAX(ruta),0)+1 FROM vehiculos WHERE bd=%s", (bd,))
-            next_ruta = cur.fetchone()[0]
             cur.execute(
-                "INSERT INTO vehiculos (bd, ruta, placa) VALUES (%s, %s, %s)",
-                (bd, next_ruta, ""),
+                """
+                WITH entrada AS (
+                    SELECT * FROM unnest(%s::int[], %s::text[]) AS t(ruta, placa)
+                ), previas AS (
+                    SELECT v.ruta, v.placa
+                    FROM vehiculos v JOIN entrada e USING (ruta)
+                    WHERE v.bd = %s
+                ), cambios AS (
+                    INSERT INTO vehiculos (bd, ruta, placa)
+                    SELECT %s, ruta, placa FROM entrada
+                    ON CONFLICT (bd, ruta) DO UPDATE SET placa = EXCLUDED.placa
+                    WHERE vehiculos.placa IS DISTINCT FROM EXCLUDED.placa
+                    RETURNING ruta, placa
+                )
+                SELECT c.ruta, p.placa, c.placa
+                FROM cambios c LEFT JOIN previas p USING (ruta)
+                ORDER BY c.ruta
+                """,
+                (rutas, valores, bd, bd),
             )
+            filas = cur.fetchall()
             conn.commit()
-    return {"ruta": next_ruta, "placa": ""}
+
+    creadas = [{"ruta": r, "placa": nueva} for r, antes, nueva in filas if antes is None]
+    actualizadas = [
+        {"ruta": r, "antes": antes, "placa": nueva} for r, antes, nueva in filas if antes is not None
+    ]
+    tocadas = {f[0] for f in filas}
+    return {
+        "creadas": creadas,
+        "actualizadas": actualizadas,
+        "sin_cambios": sorted(r for r in rutas if r not in tocadas),
+    }
+
+
+def add_rutas(bd: str, cantidad: int = 1) -> List[Dict[str, object]]:
+    """Crea `cantidad` rutas vacías consecutivas en una sola sentencia.
+
+    El número se calcula dentro del mismo INSERT; si otra petición tomó los
+    mismos números a la vez, la PK lo rechaza y se reintenta.
+    """
+
+    if cantidad < 1 or cantidad > MAX_RUTAS_POR_LOTE:
+        raise ValueError(f"cantidad debe estar entre 1 y {MAX_RUTAS_POR_LOTE}")
+
+    with conectar() as conn:
+        with conn.cursor() as cur:
+            for intento in range(INTENTOS_ADD_RUTA):
+                try:
+                    cur.execute(
+                        """
+                        INSERT INTO vehiculos (bd, ruta, placa)
+                        SELECT %s, base.max_ruta + n, ''
+                        FROM (SELECT COALESCE(MAX(ruta), 0) AS max_ruta
+                              FROM vehiculos WHERE bd = %s) AS base,
+                             generate_series(1, %s) AS n
+                        RETURNING ruta
+                        """,
+                        (bd, bd, cantidad),
+                    )
+                    rutas = sorted(fila[0] for fila in cur.fetchall())
+                    conn.commit()
+                    return [{"ruta": r, "placa": ""} for r in rutas]
+                except UniqueViolation:
+                    conn.rollback()
+                    if intento == INTENTOS_ADD_RUTA - 1:
+                        raise
 
 
 def delete_ruta(bd: str, ruta: int) -> bool:
@@ -2,14 +2,32 @@ import json
 import msgpack
 from datetime import datetime
 from io import BytesIO
-import pandas as pd
 import time
 from flask import (
     Blueprint, render_template, request,
-    send_file, session, jsonify
+    session, jsonify
 )
-from db import conectar
+from db import conectar, conectar_lectura, obtener_datos
+from metricas import span
+from plazos import PlazoVencido
+from registro import get_logger
+from views import artefactos, cache_descargas, cache_pedidos
 from views.auth import login_required
+from views.cargas import (
+    agrupar_pedidos,
+    bloquear_carga,
+    calcular_delta,
+    clave_borrado,
+    hash_carga,
+    hash_rutas,
+    huellas_pedidos,
+    obtener_carga,
+    registrar_carga,
+)
+from views.ingesta import DIAS_VALIDOS, leer_pedidos, leer_rutas, sin_fila
+from views.validacion import ValidacionError, validar_pedidos_rutas
+
+log = get_logger(__name__)
 
 upload_bp = Blueprint("upload", __name__, template_folder="../templates")
 
@@ -19,6 +37,81 @@ def _get_msgpack_payload():
     return msgpack.unpackb(raw, raw=False)
 
 
+def _get_payload(p_dia: str):
+    """Payload MessagePack del navegador o, si llegan archivos, leído en el servidor."""
+    if not request.files:
+        return _get_msgpack_payload()
+
+    f_ped = request.files.get("pedidos")
+    f_rut = request.files.get("rutas")
+    if not f_ped or not f_rut:
+        raise ValueError("Adjunta los archivos de pedidos y rutas.")
+    if p_dia not in DIAS_VALIDOS:
+        raise ValueError("Día inválido.")
+    return {"pedidos": leer_pedidos(f_ped), "rutas": leer_rutas(f_rut, p_dia)}
+
+
+def _resumen_xlsx(data_res) -> bytes:
+    """Convierte las filas de fn_obtener_resumen_pedidos en el Excel de resumen."""
+    import pandas as pd
+
+    cols = [
+        "bd",
+        "codigo_cli",
+        "nombre",
+        "barrio",
+        "ciudad",
+        "asesor",
+        "codigo_pideky",
+        "total_pedidos",
+        "valor",
+        "ruta",
+    ]
+    df_res = pd.DataFrame(data_res, columns=cols)
+    df_res["codigo_pideky"] = df_res["codigo_pideky"].astype(str)
+
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        df_res.to_excel(writer, sheet_name="ResumenPedidos", index=False)
+    return buf.getvalue()
+
+
+def _ejecutar_etl(cur, previa, grupos, huellas, pedidos, rutas, rutas_hash, p_dia, empresa) -> str:
+    """Ejecuta el ETL delta si la carga anterior es compatible; si no, el completo.
+
+    La carga delta aplica cuando la anterior es del mismo día, con las mismas
+    rutas y con índice de huellas: solo viajan las filas de los
+    (cliente, producto) nuevos o modificados y las claves a borrar.
+    """
+    if (
+        previa
+        and previa["dia"] == p_dia
+        and previa["rutas_hash"] == rutas_hash
+        and previa["huellas"] is not None
+    ):
+        delta = calcular_delta(previa["huellas"], huellas)
+        upserts = [f for k in delta["insertados"] + delta["actualizados"] for f in grupos[k]]
+        borrados = [clave_borrado(k) for k in delta["actualizados"] + delta["eliminados"]]
+        log.info("carga delta", extra={
+            "insertados": len(delta["insertados"]),
+            "actualizados": len(delta["actualizados"]),
+            "eliminados": len(delta["eliminados"]),
+        })
+        with span("etl_cargar_pedidos_delta"):
+            cur.execute(
+                "CALL etl_cargar_pedidos_delta(%s, %s, %s, %s);",
+                (json.dumps(upserts), json.dumps(borrados), p_dia, empresa)
+            )
+        return "delta"
+
+    with span("etl_cargar_pedidos_y_rutas_masivo"):
+        cur.execute(
+            "CALL etl_cargar_pedidos_y_rutas_masivo(%s, %s, %s, %s);",
+            (json.dumps(pedidos), json.dumps(rutas), p_dia, empresa)
+        )
+    return "completa"
+
+
 @upload_bp.route("/", methods=["GET", "POST"])
 @upload_bp.route("/cargar-pedidos", methods=["GET", "POST"])
 @login_required
@@ -27,60 +120,80 @@ def upload_index():
 
     if request.method == "POST":
         try:
+            # ---- 1) Datos MessagePack del frontend o archivos crudos ---
+            p_dia = request.args.get("dia", "").strip()
+            payload = _get_payload(p_dia)
+            validar_pedidos_rutas(payload.get("pedidos", []), payload.get("rutas"), p_dia)
+            # Los números de fila solo eran para los mensajes de validación
+            payload = {**payload, "pedidos": sin_fila(payload.get("pedidos", [])),
+                       "rutas": sin_fila(payload.get("rutas"))}
+            pedidos = payload["pedidos"]
+            rutas = payload["rutas"]
+
+            payload_hash = hash_carga(payload, p_dia, empresa)
+            forzar = request.args.get("force", "").lower() in ("1", "true", "si")
+
             with conectar() as conn:
                 with conn.cursor() as cur:
-                    t0 = time.perf_counter()
-                    # ---- 1) Datos MessagePack del frontend ------------------
-                    payload = _get_msgpack_payload()
-                    pedidos = payload.get("pedidos", [])
-                    rutas = payload.get("rutas")
-                    p_dia = request.args.get("dia", "").strip()
-
-                    # ---- 2) Procedimiento almacenado -------------------------
-                    cur.execute(
-                        "CALL etl_cargar_pedidos_y_rutas_masivo(%s, %s, %s, %s);",
-                        (json.dumps(pedidos), json.dumps(rutas), p_dia, empresa)
-                    )
-                    cur.execute("SELECT fn_obtener_resumen_pedidos(%s);", (empresa,))
-                    raw = cur.fetchone()[0]
-                    conn.commit()
-
-                    elapsed = time.perf_counter() - t0
-                    print(f"[INFO] SP etl_cargar_pedidos_y_rutas_masivo demoró {elapsed:.2f}s "
-                          f"(pedidos={len(pedidos)}, rutas={len(rutas)}, día={p_dia}, emp={empresa})")
-
-            # ---- 3) Obtener resumen en JSON --------------------------
-            data_res = json.loads(raw) if isinstance(raw, str) else (raw or [])
-            cols = [
-                "bd",
-                "codigo_cli",
-                "nombre",
-                "barrio",
-                "ciudad",
-                "asesor",
-                "codigo_pideky",
-                "total_pedidos",
-                "valor",
-                "ruta",
-            ]
-            df_res = pd.DataFrame(data_res, columns=cols)
-            df_res["codigo_pideky"] = df_res["codigo_pideky"].astype(str)
-
-            # ---- 4) Exportar a Excel
-            buf = BytesIO()
-            with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-                df_res.to_excel(writer, sheet_name="ResumenPedidos", index=False)
-            buf.seek(0)
+                    # ---- 2) ¿Misma carga que la última? -----------------------
+                    # Una carga por empresa a la vez: la anterior es la base del delta
+                    bloquear_carga(cur, empresa)
+                    previa = None if forzar else obtener_carga(cur, empresa)
+                    if previa and previa["payload_hash"] == payload_hash:
+                        modo = "omitida"
+                        resumen_xlsx = previa["resumen_xlsx"]
+                        log.info("carga repetida, se omite el ETL", extra={"dia": p_dia})
+                    else:
+                        t0 = time.perf_counter()
+                        # ---- 3) Procedimiento almacenado (completo o delta) ---
+                        with span("etl"):
+                            rutas_hash = hash_rutas(rutas)
+                            grupos = agrupar_pedidos(pedidos)
+                            huellas = huellas_pedidos(grupos)
+                            modo = _ejecutar_etl(cur, previa, grupos, huellas, pedidos, rutas,
+                                                 rutas_hash, p_dia, empresa)
+                            data_res = obtener_datos(cur, "fn_obtener_resumen_pedidos", empresa)
+
+                        elapsed = time.perf_counter() - t0
+                        log.info("ETL de pedidos", extra={
+                            "modo": modo, "duracion": round(elapsed, 3),
+                            "pedidos": len(pedidos), "rutas": len(rutas), "dia": p_dia,
+                        })
+
+                        # ---- 4) Resumen a Excel y registro de la carga -------
+                        # En la misma transacción que el ETL: si algo falla no
+                        # queda aplicado un ETL con las huellas de la carga anterior
+                        with span("excel"):
+                            resumen_xlsx = _resumen_xlsx(data_res)
+                        registrar_carga(cur, empresa, p_dia, payload_hash, resumen_xlsx,
+                                        rutas_hash, huellas)
+                        # Sin pedxrutaxprod, los archivos por ruta son de la corrida anterior
+                        artefactos.descartar(cur, empresa)
+                        # El ETL vacía pedxrutaxprod: lo cacheado ya no vale
+                        cache_pedidos.notificar(cur, empresa)
+                        conn.commit()
+                        cache_pedidos.invalidar(empresa)
+                        gen = cache_descargas.generacion(empresa)
+
             hoy = datetime.now().strftime("%Y%m%d_%H%M")
             nombre_xlsx = f"ResumenPedidos_{hoy}.xlsx"
 
-            return send_file(
-                buf,
-                as_attachment=True,
-                download_name=nombre_xlsx,
-                mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
+            # El resumen queda en la caché de descargas para GET /cargar-pedidos/resumen
+            if modo == "omitida":
+                resp = cache_descargas.enviar(empresa, "resumen.xlsx", nombre_xlsx,
+                                              cache_descargas.MIME_XLSX, lambda: resumen_xlsx)
+            else:
+                path, etag = cache_descargas.guardar(empresa, "resumen.xlsx", resumen_xlsx, gen)
+                resp = cache_descargas.responder(path or resumen_xlsx, etag, nombre_xlsx,
+                                                 cache_descargas.MIME_XLSX)
+            resp.headers["X-Carga-Modo"] = modo
+            resp.headers["X-Carga-Omitida"] = "1" if modo == "omitida" else "0"
+            return resp
+
+        except ValidacionError as ve:
+            return jsonify(error=str(ve), errores=ve.errores), 400
+        except PlazoVencido:
+            raise  # 504 en plazos.py
         except Exception as e:
             # Devuelve JSON para que el front lo capture
             error_msg = getattr(e, 'diag', None).message_primary if getattr(e, 'diag', None) else str(e)
@@ -90,6 +203,33 @@ def upload_index():
     return render_template("upload.html")
 
 
+@upload_bp.route("/cargar-pedidos/resumen", methods=["GET"])
+@login_required
+def descargar_resumen():
+    """Vuelve a descargar el resumen de la última carga sin subir nada.
+
+    Sale de la caché de descargas (304 si el navegador ya lo tiene) hasta
+    el próximo ETL de la empresa.
+    """
+    empresa = session.get("empresa")
+
+    def construir():
+        with conectar_lectura(empresa) as conn:
+            with conn.cursor() as cur:
+                data_res = obtener_datos(cur, "fn_obtener_resumen_pedidos", empresa)
+        if not data_res:
+            return None
+        with span("excel"):
+            return _resumen_xlsx(data_res)
+
+    nombre_xlsx = datetime.now().strftime("ResumenPedidos_%Y%m%d_%H%M.xlsx")
+    resp = cache_descargas.enviar(empresa, "resumen.xlsx", nombre_xlsx,
+                                  cache_descargas.MIME_XLSX, construir)
+    if resp is None:
+        return jsonify(error="No hay pedidos cargados para la empresa."), 404
+    return resp
+
+
 
 
 
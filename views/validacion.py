@@ -0,0 +1,220 @@
+"""Validación previa (vectorizada) de los payloads antes de llamar a los SP.
+
+Los errores que hoy aparecen como excepción dentro de
+`etl_cargar_pedidos_y_rutas_masivo` o `sp_etl_pedxrutaxprod_json` se
+detectan aquí con operaciones de pandas sobre todo el payload, sin abrir
+conexión, y se reportan todos juntos con sus números de fila.
+
+Solo se rechaza lo que rechazarían los SP o el esquema: conversiones de
+`jsonb_to_recordset`, largos de VARCHAR y la llave única de `rutas`. Los
+vacíos pasan como NULL, igual que en la base.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from views.ingesta import CAMPO_FILA
+
+if TYPE_CHECKING:  # pandas se importa al validar, no al cargar la app
+    import pandas as pd
+
+# Máximo de filas listadas por regla; el resto se resume con un conteo
+MAX_FILAS_REPORTADAS = 30
+
+# Longitudes de las columnas destino (ver MEMPRY FACT)
+LARGOS_PEDIDOS = {
+    "numero_pedido": 70,
+    "nombre": 80,
+    "barrio": 40,
+    "ciudad": 30,
+    "codigo_pro": 25,
+    "producto": 80,
+    "tipo_pro": 2,
+    "estado": 15,
+}
+
+
+class ValidacionError(ValueError):
+    """Payload inválido; `errores` trae un mensaje por regla incumplida."""
+
+    def __init__(self, errores: List[str]):
+        self.errores = errores
+        super().__init__("; ".join(errores))
+
+
+# Texto que aceptan int4in / numeric_in (con espacios alrededor)
+_ENTERO_SQL = re.compile(r"\s*[+-]?\d+\s*")
+_NUMERIC_SQL = re.compile(r"\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*")
+_INT4 = (-2**31, 2**31 - 1)
+# `infer_dtype` de columnas sin booleanos
+_TIPOS_NUMERICOS = ("integer", "floating", "mixed-integer-float", "decimal")
+
+
+def _frame(filas: Optional[List[Dict[str, Any]]], columnas: List[str]) -> pd.DataFrame:
+    """Payload como DataFrame de objetos: conserva 5 y 5.0 tal como llegaron."""
+    import pandas as pd
+
+    df = pd.DataFrame(filas or [], dtype=object)
+    return df.reindex(columns=columnas)
+
+
+def _coincide(s: pd.Series, patron: re.Pattern) -> pd.Series:
+    """True/False en los textos según `patron`; NaN en lo que no es texto."""
+    import pandas as pd
+
+    try:
+        return s.str.fullmatch(patron)
+    except AttributeError:  # columna sin ningún texto
+        return pd.Series(float("nan"), index=s.index, dtype=object)
+
+
+def _no_enteros(s: pd.Series) -> pd.Series:
+    """True donde `jsonb_to_recordset` no convertiría el valor a INTEGER.
+
+    Los nulos pasan. Textos y números se validan con máscaras de pandas.
+    5.0 y los booleanos llegan al SP como "5.0" y "true": solo si la columna
+    no es toda de enteros se revisa en Python el tipo de los que pasaron.
+    """
+    import pandas as pd
+
+    nulo = s.isna()
+    texto = _coincide(s, _ENTERO_SQL)
+    es_texto = texto.notna()
+    num = pd.to_numeric(s, errors="coerce")
+    valido = (num % 1 == 0) & num.between(*_INT4)
+    ok = nulo | (es_texto & texto.fillna(False).astype(bool) & valido) | (~es_texto & ~nulo & valido)
+
+    dudosos = ok & ~nulo & ~es_texto
+    if dudosos.any() and pd.api.types.infer_dtype(s[dudosos], skipna=False) != "integer":
+        ok[dudosos] = [isinstance(v, int) and not isinstance(v, bool) for v in s[dudosos]]
+    return ~ok
+
+
+def _no_numericos(s: pd.Series) -> pd.Series:
+    """True donde `jsonb_to_recordset` no convertiría el valor a NUMERIC (el texto vacío no)."""
+    import numpy as np
+    import pandas as pd
+
+    nulo = s.isna()
+    texto = _coincide(s, _NUMERIC_SQL)
+    es_texto = texto.notna()
+    num = pd.to_numeric(s.where(~es_texto), errors="coerce")
+    ok = nulo | texto.fillna(False).astype(bool) | (~es_texto & np.isfinite(num.astype(float)))
+
+    # Los booleanos llegan al SP como "true"
+    dudosos = ok & ~nulo & ~es_texto
+    if dudosos.any() and pd.api.types.infer_dtype(s[dudosos], skipna=False) not in _TIPOS_NUMERICOS:
+        ok[dudosos] = [not isinstance(v, bool) for v in s[dudosos]]
+    return ~ok
+
+
+def _texto(s: pd.Series) -> pd.Series:
+    """Como lo recibe una columna TEXT; los nulos como ''."""
+    return s.where(s.notna(), "").astype(str)
+
+
+def _prefijo(s: pd.Series, patron: str) -> pd.Series:
+    """Primer segmento del texto, igual que split_part/regexp_split_to_array."""
+    return s.astype(str).str.replace(f"(?s)(?:{patron}).*", "", regex=True)
+
+
+def _numeros_fila(df: pd.DataFrame) -> pd.Series:
+    """Fila de la hoja original (`CAMPO_FILA`) o, si no viene, posición en el payload."""
+    import pandas as pd
+
+    posicion = pd.Series(range(1, len(df) + 1), index=df.index)
+    if CAMPO_FILA not in df:
+        return posicion
+    return pd.to_numeric(df[CAMPO_FILA], errors="coerce").fillna(posicion).astype(int)
+
+
+def _reportar(errores: List[str], mask: pd.Series, mensaje: str,
+              numeros: Optional[pd.Series] = None) -> None:
+    if numeros is None:
+        filas = (mask.to_numpy().nonzero()[0] + 1).tolist()
+    else:
+        filas = numeros[mask.to_numpy()].tolist()
+    if not filas:
+        return
+    listado = ", ".join(str(f) for f in filas[:MAX_FILAS_REPORTADAS])
+    if len(filas) > MAX_FILAS_REPORTADAS:
+        listado += f" (y {len(filas) - MAX_FILAS_REPORTADAS} más)"
+    errores.append(f"{mensaje}: filas {listado}")
+
+
+# ------------------------------------------------------------------
+# /cargar-pedidos
+# ------------------------------------------------------------------
+def validar_pedidos_rutas(pedidos, rutas, dia: str) -> None:
+    """Valida pedidos y rutas del día; lanza ValidacionError con todo lo encontrado."""
+    errores: List[str] = []
+
+    ped = _frame(pedidos, ["cliente", "asesor", "cantidad", "valor", *LARGOS_PEDIDOS, CAMPO_FILA])
+    n_ped = _numeros_fila(ped)
+
+    # jsonb_to_recordset convierte todas las filas, también las que no se insertan
+    _reportar(errores, _no_enteros(ped["cantidad"]), "Pedidos con cantidad no entera", n_ped)
+    _reportar(errores, _no_numericos(ped["valor"]), "Pedidos con valor no numérico", n_ped)
+
+    # Los largos solo fallan en las filas que pasan el WHERE del SP
+    estado = _texto(ped["estado"])
+    insertadas = ((_texto(ped["tipo_pro"]) == "N") & (estado == "Sin Descargar")) | (estado == "Sin facturar")
+    for col, largo in LARGOS_PEDIDOS.items():
+        _reportar(errores, insertadas & (_texto(ped[col]).str.len() > largo),
+                  f"Pedidos con {col} de más de {largo} caracteres", n_ped)
+    _reportar(errores, insertadas & (_prefijo(_texto(ped["cliente"]), "-").str.len() > 30),
+              "Pedidos con código de cliente de más de 30 caracteres", n_ped)
+    _reportar(errores, insertadas & (_prefijo(_texto(ped["asesor"]), "-").str.len() > 20),
+              "Pedidos con código de asesor de más de 20 caracteres", n_ped)
+
+    # Rutas: "<número>-<día>" y un solo vehículo por cliente en el día
+    rut = _frame(rutas, ["codigo_cliente", "codigo_ruta", CAMPO_FILA])
+    n_rut = _numeros_fila(rut)
+    partes = _texto(rut["codigo_ruta"]).str.split(r"[- ]", regex=True)
+    numero = partes.str[0]
+    dia_ruta = partes.str[1]
+    # NULL::INTEGER es NULL; '' o texto no numérico fallan en el cast
+    invalidas = rut["codigo_ruta"].notna() & _no_enteros(numero.fillna(""))
+    _reportar(errores, invalidas, "Rutas con código de ruta desconocido (se espera '<número>-<día>')", n_rut)
+
+    del_dia = (dia_ruta == dia) & ~invalidas
+    con_cliente = rut["codigo_cliente"].notna()
+    cliente = _prefijo(_texto(rut["codigo_cliente"]), r"[- ]")
+    _reportar(errores, del_dia & con_cliente & (cliente.str.len() > 30),
+              "Rutas con código de cliente de más de 30 caracteres", n_rut)
+    # UNIQUE (bd, dia, codigo_cliente): los NULL no chocan entre sí
+    _reportar(errores, del_dia & con_cliente & cliente.where(del_dia & con_cliente).duplicated(keep=False),
+              "Clientes asignados a dos rutas el mismo día", n_rut)
+
+    if errores:
+        raise ValidacionError(errores)
+
+
+# ------------------------------------------------------------------
+# /generar-pedidos
+# ------------------------------------------------------------------
+def validar_inventario_materiales(inventario, materiales, carro1=None, carro2=None) -> None:
+    """Valida inventario, materiales y carros; lanza ValidacionError con todo lo encontrado."""
+    errores: List[str] = []
+
+    inv = _frame(inventario, ["codigo", "stock"])
+    _reportar(errores, _texto(inv["codigo"]).str.len() > 25,
+              "Inventario con codigo de más de 25 caracteres")
+    _reportar(errores, _no_enteros(inv["stock"]), "Inventario con stock no entero")
+
+    if materiales:
+        mat = _frame(materiales, ["pro_codigo", "particion", "pq_x_caja"])
+        _reportar(errores, _texto(mat["pro_codigo"]).str.len() > 25,
+                  "Materiales con pro_codigo de más de 25 caracteres")
+        for col in ("particion", "pq_x_caja"):
+            _reportar(errores, _no_enteros(mat[col]), f"Materiales con {col} no entero")
+
+    # Parámetros INTEGER del SP
+    for nombre, carro in (("carro1", carro1), ("carro2", carro2)):
+        if carro is not None and not re.fullmatch(r"\d+", str(carro)):
+            errores.append(f"{nombre} debe ser un número de ruta")
+
+    if errores:
+        raise ValidacionError(errores)
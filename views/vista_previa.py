@@ -0,0 +1,181 @@
+"""Vista previa paginada de los pedidos generados y del resumen de pedidos.
+
+Los mismos datos de `fn_obtener_pedidos_con_pedir_json` y
+`fn_obtener_resumen_pedidos`, por páginas en JSON o MessagePack, para
+mostrarlos sin armar el Excel/ZIP completo. La paginación es por llave
+(keyset): el cursor guarda la última llave de orden de la página, así que
+pedir la página 100 cuesta lo mismo que la primera.
+"""
+
+import base64
+import binascii
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import msgpack
+from flask import Blueprint, Response, jsonify, request, session
+
+from db import conectar_lectura
+from views.auth import login_required
+
+vista_previa_bp = Blueprint("vista_previa", __name__)
+
+LIMITE_DEFECTO = 50
+LIMITE_MAX = 500
+
+
+class Recurso(NamedTuple):
+    sql: str                 # consulta base; parámetros con nombre
+    ordenables: Tuple[str, ...]
+    desempate: Tuple[str, ...]  # columnas que junto a la de orden hacen única la llave
+    orden_defecto: str
+    filtro_producto: str
+
+
+RECURSOS: Dict[str, Recurso] = {
+    # Igual que db.CONSULTAS_FILAS["fn_obtener_pedidos_con_pedir_json"]
+    "pedidos": Recurso(
+        sql="""
+            SELECT ruta, codigo_pro, COALESCE(producto, '') AS producto, pedir
+            FROM pedxrutaxprod
+            WHERE pedir > 0 AND bd = %(bd)s {filtros}
+        """,
+        ordenables=("ruta", "codigo_pro", "producto", "pedir"),
+        desempate=("ruta", "codigo_pro"),
+        orden_defecto="ruta",
+        filtro_producto="(codigo_pro = %(producto)s OR producto ILIKE %(producto_like)s)",
+    ),
+    # Igual que fn_obtener_resumen_pedidos; textos nulos como '' y ruta nula como 0
+    # para que la llave de orden sea comparable
+    "resumen": Recurso(
+        sql="""
+            SELECT COALESCE(codigo_cli, '') AS codigo_cli, COALESCE(nombre, '') AS nombre,
+                   COALESCE(barrio, '') AS barrio, COALESCE(ciudad, '') AS ciudad,
+                   COALESCE(asesor, '') AS asesor,
+                   MAX(codigo_pideky) AS codigo_pideky,
+                   COUNT(DISTINCT numero_pedido) AS total_pedidos,
+                   COALESCE(SUM(valor), 0) AS valor,
+                   COALESCE(ruta, 0) AS ruta
+            FROM pedxclixprod
+            WHERE bd = %(bd)s {filtros}
+            GROUP BY barrio, codigo_cli, bd, nombre, ciudad, asesor, ruta
+        """,
+        ordenables=("codigo_cli", "nombre", "ruta", "valor", "total_pedidos", "barrio", "ciudad", "asesor"),
+        desempate=("codigo_cli", "ruta", "nombre", "barrio", "ciudad", "asesor"),
+        orden_defecto="codigo_cli",
+        # Clientes que pidieron el producto, con todos sus pedidos
+        filtro_producto="""codigo_cli IN (
+            SELECT codigo_cli FROM pedxclixprod
+            WHERE bd = %(bd)s AND (codigo_pro = %(producto)s OR producto ILIKE %(producto_like)s)
+        )""",
+    ),
+}
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def _codificar_cursor(llave: List[Any]) -> str:
+    crudo = msgpack.packb(llave, use_bin_type=True, default=str)
+    return base64.urlsafe_b64encode(crudo).decode("ascii").rstrip("=")
+
+
+def _decodificar_cursor(cursor: str, largo: int) -> List[Any]:
+    try:
+        llave = msgpack.unpackb(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)), raw=False)
+    except (binascii.Error, ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError):
+        raise ParametroInvalido("cursor inválido")
+    if not isinstance(llave, list) or len(llave) != largo:
+        raise ParametroInvalido("cursor inválido")
+    return llave
+
+
+def _entero(nombre: str, defecto: int, minimo: int, maximo: int) -> int:
+    valor = request.args.get(nombre, "").strip()
+    if not valor:
+        return defecto
+    if not valor.isdigit():
+        raise ParametroInvalido(f"{nombre} debe ser un número")
+    return max(minimo, min(int(valor), maximo))
+
+
+def consultar_pagina(recurso: Recurso, empresa: str) -> Dict[str, Any]:
+    """Arma y ejecuta la consulta de una página según los parámetros de la URL."""
+    orden = request.args.get("orden", recurso.orden_defecto)
+    if orden not in recurso.ordenables:
+        raise ParametroInvalido(f"orden debe ser uno de: {', '.join(recurso.ordenables)}")
+    descendente = request.args.get("dir", "asc").lower() == "desc"
+    limite = _entero("limite", LIMITE_DEFECTO, 1, LIMITE_MAX)
+    llave = [orden] + [c for c in recurso.desempate if c != orden]
+
+    params: Dict[str, Any] = {"bd": empresa, "limite": limite + 1}
+    filtros: List[str] = []
+    rutas = request.args.getlist("ruta")
+    if rutas:
+        if not all(r.strip().isdigit() for r in rutas):
+            raise ParametroInvalido("ruta debe ser un número")
+        filtros.append("AND ruta = ANY(%(rutas)s)")
+        params["rutas"] = [int(r) for r in rutas]
+    producto = request.args.get("producto", "").strip()
+    if producto:
+        filtros.append("AND " + recurso.filtro_producto)
+        params.update(producto=producto, producto_like=f"%{producto}%")
+    base = recurso.sql.format(filtros=" ".join(filtros))
+
+    # Todas las columnas de la llave van en la misma dirección: basta una
+    # comparación de filas, que Postgres resuelve con el índice si lo hay
+    columnas = ", ".join(llave)
+    direccion = "DESC" if descendente else "ASC"
+    donde = ""
+    cursor = request.args.get("cursor")
+    if cursor:
+        for i, valor in enumerate(_decodificar_cursor(cursor, len(llave))):
+            params[f"k{i}"] = valor
+        marcadores = ", ".join(f"%(k{i})s" for i in range(len(llave)))
+        donde = f"WHERE ({columnas}) {'<' if descendente else '>'} ({marcadores})"
+    consulta = (
+        f"SELECT * FROM ({base}) t {donde} "
+        f"ORDER BY {', '.join(f'{c} {direccion}' for c in llave)} LIMIT %(limite)s"
+    )
+
+    with conectar_lectura(empresa) as conn:
+        with conn.cursor() as cur:
+            cur.execute(consulta, params)
+            nombres = [d.name for d in cur.description]
+            filas = [dict(zip(nombres, f)) for f in cur.fetchall()]
+            total = None
+            # El total solo en la primera página y si se pide: cuesta otra consulta
+            if not cursor and request.args.get("total") == "1":
+                cur.execute(f"SELECT COUNT(*) FROM ({base}) t", params)
+                total = cur.fetchone()[0]
+
+    siguiente: Optional[str] = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = _codificar_cursor([filas[-1][c] for c in llave])
+    resultado = {"success": True, "filas": filas, "siguiente": siguiente, "orden": orden,
+                 "dir": "desc" if descendente else "asc"}
+    if total is not None:
+        resultado["total"] = total
+    return resultado
+
+
+def _responder(datos: Dict[str, Any]):
+    formato = request.args.get("formato", "")
+    if formato == "msgpack" or (not formato and "application/msgpack" in request.headers.get("Accept", "")):
+        return Response(msgpack.packb(datos, use_bin_type=True, default=str),
+                        mimetype="application/msgpack")
+    return jsonify(datos)
+
+
+@vista_previa_bp.route("/vista-previa/<recurso>", methods=["GET"])
+@login_required
+def vista_previa(recurso: str):
+    """Una página de `pedidos` o `resumen` de la empresa en sesión."""
+    spec = RECURSOS.get(recurso)
+    if spec is None:
+        return jsonify(success=False, error=f"Recurso desconocido: {recurso}"), 404
+    try:
+        return _responder(consultar_pagina(spec, session.get("empresa")))
+    except ParametroInvalido as e:
+        return jsonify(success=False, error=str(e)), 400